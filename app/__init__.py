@@ -40,6 +40,15 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix='/admins')
     app.register_blueprint(audit_bp, url_prefix='/audit')
 
+    from .cli import register_cli
+    register_cli(app)
+
+    from .utils.query_profiler import init_query_profiler
+    init_query_profiler(app)
+
+    from .utils.data_versions import init_data_versions
+    init_data_versions()
+
     # Create database tables if they don't exist
     with app.app_context():
         # Ensure all models are imported so SQLAlchemy is aware before create_all
@@ -56,13 +65,78 @@ def create_app():
         try:
             from sqlalchemy import inspect, text
             insp = inspect(db.engine)
-            admin_cols = {c['name'] for c in insp.get_columns('admins')}
-            if 'must_change_password' not in admin_cols:
-                with db.engine.begin() as conn:
-                    conn.execute(text("ALTER TABLE admins ADD COLUMN must_change_password BOOLEAN NOT NULL DEFAULT FALSE"))
+            added_columns = [
+                ('admins', 'must_change_password', "BOOLEAN NOT NULL DEFAULT FALSE"),
+                ('vms', 'fingerprint', "VARCHAR(64)"),
+                ('vms', 'vcenter_id', "INTEGER REFERENCES vcenter_configs(id) ON DELETE SET NULL"),
+                ('vms', 'first_seen_at', "TIMESTAMP WITH TIME ZONE"),
+                ('vms', 'last_seen_at', "TIMESTAMP WITH TIME ZONE"),
+                ('vms', 'removed_at', "TIMESTAMP WITH TIME ZONE"),
+                ('vms', 'moref', "VARCHAR(64)"),
+                ('vcenter_configs', 'sync_interval_minutes', "INTEGER"),
+                ('vcenter_configs', 'adaptive_sync', "BOOLEAN NOT NULL DEFAULT FALSE"),
+                ('sync_runs', 'phase', "VARCHAR(16)"),
+                ('sync_runs', 'request_id', "INTEGER REFERENCES sync_requests(id) ON DELETE SET NULL"),
+            ]
+            added_indexes = [
+                "CREATE INDEX IF NOT EXISTS ix_vms_vcenter_id ON vms (vcenter_id)",
+                "CREATE INDEX IF NOT EXISTS ix_vms_active_name_id ON vms (name, id) WHERE removed_at IS NULL",
+                # Superseded by ix_vms_active_name_id
+                "DROP INDEX IF EXISTS ix_vms_active_name",
+                "CREATE INDEX IF NOT EXISTS ix_sync_runs_request_id ON sync_runs (request_id)",
+                "CREATE INDEX IF NOT EXISTS ix_vm_nics_mac_digits ON vm_nics (lower(translate(mac, ':-.', '')))",
+                "CREATE INDEX IF NOT EXISTS ix_vm_changes_vm_id ON vm_changes (vm_id, id)",
+                # Superseded by ix_vm_changes_vm_id
+                "DROP INDEX IF EXISTS ix_vm_changes_vm_changed",
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_sync_requests_queued_target "
+                "ON sync_requests (COALESCE(vcenter_id, 0)) WHERE status = 'queued'",
+            ]
+            existing = {}
+            for table, column, ddl in added_columns:
+                if table not in existing:
+                    existing[table] = {c['name'] for c in insp.get_columns(table)}
+                if column not in existing[table]:
+                    with db.engine.begin() as conn:
+                        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            with db.engine.begin() as conn:
+                for ddl in added_indexes:
+                    conn.execute(text(ddl))
         except Exception as e:
             app.logger.warning(f"Column check/alter failed (safe to ignore if already present): {e}")
+
+        # Index guest IPs synced before vm_ip_addresses existed (best-effort, once)
+        try:
+            from .models.vm import VMNic, VMIPAddress
+            if VMIPAddress.query.first() is None and VMNic.query.filter(VMNic.ip_addresses.isnot(None)).first():
+                from .utils.vcenter_sync import rebuild_ip_addresses
+                app.logger.info(f"Indexed {rebuild_ip_addresses()} guest IP addresses")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not index guest IP addresses: {e}")
         
+        # Trigram index for VM search; needs the pg_trgm extension (best-effort)
+        try:
+            from sqlalchemy import text
+            with db.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_vm_search_document_trgm ON vm_search USING gin (document gin_trgm_ops)"
+                ))
+        except Exception as e:
+            app.logger.warning(f"pg_trgm not available, VM search will scan vm_search: {e}")
+
+        # Build search documents for VMs synced before vm_search existed (best-effort, once)
+        try:
+            from .models.vm import VM
+            from .models.vm_search import VMSearch
+            if VMSearch.query.first() is None and VM.query.first() is not None:
+                from .utils.vm_search import rebuild_search_index
+                app.logger.info(f"Built search documents for {rebuild_search_index()} VMs")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not build VM search documents: {e}")
+
         # Dev: ensure default admin exists
         try:
             from .models.admin import Admin
@@ -108,11 +182,12 @@ def create_app():
         from flask import render_template, redirect, url_for
         if not current_user.is_authenticated:
             return redirect(url_for('auth.login'))
-        from .models.vm import VM
-        total = VM.query.count()
-        powered_on = VM.query.filter_by(power_state='poweredOn').count()
-        powered_off = VM.query.filter_by(power_state='poweredOff').count()
-        return render_template('dashboard.html', total_vms=total, powered_on=powered_on, powered_off=powered_off)
+        from .utils.vm_stats import compute_vm_stats, latest_stats_snapshot
+        snapshot = latest_stats_snapshot()
+        stats = snapshot.data if snapshot is not None else compute_vm_stats()
+        return render_template('dashboard.html', total_vms=stats['total_vms'],
+                               powered_on=stats['power_stats']['powered_on'],
+                               powered_off=stats['power_stats']['powered_off'])
 
     return app
 
@@ -0,0 +1,132 @@
+import time
+import tracemalloc
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('sync-benchmark')
+@click.option('--vms', default=1000, show_default=True, help='Number of simulated VMs (e.g. 1000, 10000, 50000).')
+@click.option('--nics', default=2, show_default=True, help='NICs per VM.')
+@click.option('--disks', default=2, show_default=True, help='Disks per VM.')
+@click.option('--portgroups', default=8, show_default=True, help='Distributed portgroups.')
+@click.option('--networks', default=2, show_default=True, help='Standard networks.')
+@click.option('--hosts', default=8, show_default=True, help='ESXi hosts.')
+@click.option('--latency-ms', default=0.0, show_default=True, help='Simulated latency per vCenter round-trip.')
+@click.option('--keep', is_flag=True, help='Keep the benchmark vCenter and its VMs afterwards.')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+@with_appcontext
+def sync_benchmark(vms, nics, disks, portgroups, networks, hosts, latency_ms, keep, yes):
+    """Benchmark vCenter sync against a simulated vCenter.
+
+    Runs an initial full sync, a no-change sync and a no-change full resync
+    of a synthetic estate through the real sync path, and reports wall time,
+    vCenter round-trips, SQL statements and peak Python memory for each.
+    VMs are written to the configured database; use a scratch database.
+    """
+    from sqlalchemy import event
+    from . import db
+    from .models.vcenter import VCenterConfig
+    from .models.vm import VM
+    from .scheduler.tasks import _sync_one_vcenter
+    from .utils.vcenter_sim import SimulatedVCenter
+    from .utils.vcenter_session import register_connector, unregister_connector, release_sessions
+    from .utils.vcenter_sync import reset_incremental_state
+    from .utils.data_versions import bump_data_version
+
+    if not yes:
+        click.confirm(f"Write {vms} simulated VMs to {db.engine.url.render_as_string()}?", abort=True)
+
+    click.echo(f"Building simulated estate: {vms} VMs, {nics} NICs and {disks} disks each ...")
+    sim = SimulatedVCenter(vms=vms, nics=nics, disks=disks, portgroups=portgroups,
+                           networks=networks, hosts=hosts, latency=latency_ms / 1000.0)
+    host = 'sync-benchmark.sim.invalid'
+    register_connector(host, sim.connect)
+    cfg = VCenterConfig(name='Sync benchmark (simulated)', host=host, username='benchmark',
+                        password='benchmark', disable_ssl=True, enabled=True)
+    db.session.add(cfg)
+    db.session.commit()
+    cfg_id = cfg.id
+
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    app = current_app._get_current_object()
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    tracemalloc.start()
+    results = []
+    try:
+        for label, full in (('full sync', True), ('no-change sync', False), ('no-change full resync', True)):
+            trips, stmts = sim.round_trips, statements[0]
+            tracemalloc.reset_peak()
+            started = time.perf_counter()
+            _sync_one_vcenter(app, cfg_id, full=full)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            results.append((label, elapsed, sim.round_trips - trips, statements[0] - stmts, peak / (1024 * 1024)))
+    finally:
+        tracemalloc.stop()
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+    synced = VM.active().filter_by(vcenter_id=cfg_id).count()
+
+    click.echo('')
+    click.echo(f"{'run':<24}{'wall s':>10}{'round-trips':>14}{'SQL stmts':>12}{'peak MB':>10}")
+    for label, elapsed, trips, stmts, peak in results:
+        click.echo(f"{label:<24}{elapsed:>10.2f}{trips:>14}{stmts:>12}{peak:>10.1f}")
+    click.echo(f"\n{synced} of {vms} simulated VMs present after the runs")
+
+    reset_incremental_state(cfg_id)
+    release_sessions(cfg_id)
+    unregister_connector(host)
+    if not keep:
+        VM.query.filter_by(vcenter_id=cfg_id).delete(synchronize_session=False)
+        bump_data_version('vms')
+        db.session.delete(db.session.get(VCenterConfig, cfg_id))
+        db.session.commit()
+
+
+@click.command('sync-worker')
+@click.option('--poll-seconds', type=float, default=None,
+              help='Seconds between sync queue polls (default: SYNC_WORKER_POLL_SECONDS).')
+@with_appcontext
+def sync_worker(poll_seconds):
+    """Run scheduled and queued vCenter syncs until interrupted.
+
+    Web processes only enqueue sync requests; run exactly one worker per
+    deployment.
+    """
+    from .scheduler.worker import run_sync_worker
+
+    if poll_seconds is None:
+        poll_seconds = float(current_app.config.get('SYNC_WORKER_POLL_SECONDS', 2))
+    run_sync_worker(current_app._get_current_object(), poll_seconds)
+
+
+@click.command('rebuild-ip-index')
+@with_appcontext
+def rebuild_ip_index():
+    """Rebuild the vm_ip_addresses lookup table from stored NIC data."""
+    from .utils.vcenter_sync import rebuild_ip_addresses
+
+    click.echo(f"Indexed {rebuild_ip_addresses()} guest IP addresses")
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index():
+    """Rebuild the vm_search documents of all VMs."""
+    from .utils.vm_search import rebuild_search_index as rebuild
+
+    click.echo(f"Built search documents for {rebuild()} VMs")
+
+
+def register_cli(app):
+    """Register Nimbus maintenance commands on the Flask CLI."""
+    app.cli.add_command(sync_benchmark)
+    app.cli.add_command(sync_worker)
+    app.cli.add_command(rebuild_ip_index)
+    app.cli.add_command(rebuild_search_index)
@@ -1,16 +1,28 @@
 from .admin import Admin
-from .vm import VM, VMDisks, VMNic
+from .vm import VM, VMDisks, VMNic, VMIPAddress
 from .owner import Owner
 from .tag import Tag
 from .vcenter import VCenterConfig
 from .audit import AuditLog
+from .sync_run import SyncRun
+from .sync_request import SyncRequest
+from .vm_change import VMChange
+from .stats_snapshot import StatsSnapshot
+from .data_version import DataVersion
+from .vm_search import VMSearch
 
 __all__ = [
     'Admin',
-    'VM', 'VMDisks', 'VMNic',
+    'VM', 'VMDisks', 'VMNic', 'VMIPAddress',
     'Owner',
     'Tag',
     'VCenterConfig',
     'AuditLog',
+    'SyncRun',
+    'SyncRequest',
+    'VMChange',
+    'StatsSnapshot',
+    'DataVersion',
+    'VMSearch',
 ]
 
@@ -0,0 +1,12 @@
+from datetime import datetime
+from .. import db
+
+
+class DataVersion(db.Model):
+    """Change counter of one entity (vms, owners, tags, audit, stats), bumped on commit."""
+
+    __tablename__ = 'data_versions'
+
+    entity = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False)
@@ -0,0 +1,34 @@
+from datetime import datetime
+from .. import db
+
+
+class StatsSnapshot(db.Model):
+    """Dashboard statistics computed at the end of a sync or after an edit.
+
+    ``data`` holds the full ``/vms/api/stats`` payload; the headline counts
+    are columns as well so trends can be queried without reading JSON.
+    """
+
+    __tablename__ = 'stats_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False, index=True)
+    # What triggered the snapshot: sync, refresh, owners, tags, vcenter or initial
+    reason = db.Column(db.String(32), nullable=True)
+    total_vms = db.Column(db.Integer, nullable=False, default=0)
+    powered_on = db.Column(db.Integer, nullable=False, default=0)
+    powered_off = db.Column(db.Integer, nullable=False, default=0)
+    data = db.Column(db.JSON, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'taken_at': self.taken_at.isoformat() if self.taken_at else None,
+            'reason': self.reason,
+            'total_vms': self.total_vms,
+            'powered_on': self.powered_on,
+            'powered_off': self.powered_off,
+            'os_breakdown': {
+                name: counts['total'] for name, counts in (self.data.get('os_breakdown') or {}).items()
+            },
+        }
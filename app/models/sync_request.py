@@ -0,0 +1,33 @@
+from datetime import datetime
+from .. import db
+
+
+class SyncRequest(db.Model):
+    """A sync queued by the web app and executed by the sync worker."""
+
+    __tablename__ = 'sync_requests'
+    __table_args__ = (
+        db.Index('ix_sync_requests_queued', 'requested_at', postgresql_where=db.text("status = 'queued'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # NULL syncs every enabled vCenter
+    vcenter_id = db.Column(db.Integer, db.ForeignKey('vcenter_configs.id', ondelete='CASCADE'), nullable=True)
+    full = db.Column(db.Boolean, nullable=False, default=False)
+    # queued, running, succeeded or failed
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    requested_by = db.Column(db.String(120), nullable=True)
+    requested_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+    started_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+
+# At most one queued request per target (vCenter, or all vCenters as 0), so
+# repeated requests merge into the pending one
+db.Index(
+    'ux_sync_requests_queued_target',
+    db.func.coalesce(SyncRequest.vcenter_id, 0),
+    unique=True,
+    postgresql_where=db.text("status = 'queued'"),
+)
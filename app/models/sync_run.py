@@ -0,0 +1,76 @@
+from datetime import datetime
+from .. import db
+
+
+class SyncRun(db.Model):
+    """One vCenter sync run: outcome, counts and per-phase durations (seconds)."""
+
+    __tablename__ = 'sync_runs'
+    __table_args__ = (
+        db.Index('ix_sync_runs_vcenter_started', 'vcenter_id', 'started_at'),
+    )
+
+    PHASES = ('connect', 'retrieve', 'transform', 'upsert', 'commit')
+
+    id = db.Column(db.Integer, primary_key=True)
+    vcenter_id = db.Column(db.Integer, db.ForeignKey('vcenter_configs.id', ondelete='SET NULL'), nullable=True)
+    vcenter_name = db.Column(db.String(120), nullable=True)
+    started_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    # running, succeeded or failed
+    status = db.Column(db.String(16), nullable=False, default='running', index=True)
+    # full or incremental
+    mode = db.Column(db.String(16), nullable=True)
+    # Current phase while running (connect, retrieve, upsert, reconcile)
+    phase = db.Column(db.String(16), nullable=True)
+    # Queued request that triggered the run; NULL for scheduled runs
+    request_id = db.Column(db.Integer, db.ForeignKey('sync_requests.id', ondelete='SET NULL'), nullable=True, index=True)
+
+    connect_seconds = db.Column(db.Float, nullable=True)
+    retrieve_seconds = db.Column(db.Float, nullable=True)
+    transform_seconds = db.Column(db.Float, nullable=True)
+    upsert_seconds = db.Column(db.Float, nullable=True)
+    commit_seconds = db.Column(db.Float, nullable=True)
+
+    vm_count = db.Column(db.Integer, nullable=True)
+    created_count = db.Column(db.Integer, nullable=True)
+    changed_count = db.Column(db.Integer, nullable=True)
+    unchanged_count = db.Column(db.Integer, nullable=True)
+    skipped_count = db.Column(db.Integer, nullable=True)
+    errored_count = db.Column(db.Integer, nullable=True)
+    removed_count = db.Column(db.Integer, nullable=True)
+    round_trips = db.Column(db.Integer, nullable=True)
+    bytes_received = db.Column(db.BigInteger, nullable=True)
+
+    error = db.Column(db.Text, nullable=True)
+
+    @property
+    def duration_seconds(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'vcenter_id': self.vcenter_id,
+            'vcenter_name': self.vcenter_name,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_seconds': self.duration_seconds,
+            'status': self.status,
+            'mode': self.mode,
+            'phase': self.phase,
+            'request_id': self.request_id,
+            'phases': {phase: getattr(self, f'{phase}_seconds') for phase in self.PHASES},
+            'vm_count': self.vm_count,
+            'created': self.created_count,
+            'changed': self.changed_count,
+            'unchanged': self.unchanged_count,
+            'skipped': self.skipped_count,
+            'errored': self.errored_count,
+            'removed': self.removed_count,
+            'round_trips': self.round_trips,
+            'bytes_received': self.bytes_received,
+            'error': self.error,
+        }
@@ -12,6 +12,10 @@ class VCenterConfig(db.Model):
     password = db.Column(db.String(255), nullable=False)
     disable_ssl = db.Column(db.Boolean, default=True)
     enabled = db.Column(db.Boolean, default=True)
+    # Minutes between scheduled syncs; NULL uses VCENTER_SYNC_INTERVAL
+    sync_interval_minutes = db.Column(db.Integer, nullable=True)
+    # Shorten the interval while VMs change and lengthen it while idle
+    adaptive_sync = db.Column(db.Boolean, nullable=False, default=False)
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
     updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy.dialects.postgresql import INET
 from .. import db
 
 
@@ -27,6 +28,16 @@ class VM(db.Model):
     created_date = db.Column(db.DateTime(timezone=True))
     last_booted_date = db.Column(db.DateTime(timezone=True))
     hypervisor = db.Column(db.String(255), index=True)
+    # Hash of the synced fields, disks and NICs; lets the sync skip unchanged VMs
+    fingerprint = db.Column(db.String(64))
+
+    # Source vCenter and presence tracking; removed_at is set once a full sync no longer sees the VM
+    vcenter_id = db.Column(db.Integer, db.ForeignKey('vcenter_configs.id', ondelete='SET NULL'), index=True)
+    first_seen_at = db.Column(db.DateTime(timezone=True))
+    last_seen_at = db.Column(db.DateTime(timezone=True))
+    removed_at = db.Column(db.DateTime(timezone=True))
+    # Managed object id in the source vCenter (e.g. vm-1234), for targeted refreshes
+    moref = db.Column(db.String(64))
 
     nics = db.relationship('VMNic', backref='vm', cascade='all, delete-orphan')
     disks = db.relationship('VMDisks', backref='vm', cascade='all, delete-orphan')
@@ -36,6 +47,17 @@ class VM(db.Model):
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
     updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Serves list/stats/report queries, which only look at VMs still present in vCenter,
+        # and the (name, id) seeks of /vms/api keyset pagination
+        db.Index('ix_vms_active_name_id', 'name', 'id', postgresql_where=db.text('removed_at IS NULL')),
+    )
+
+    @classmethod
+    def active(cls):
+        """Query VMs that have not been marked removed from vCenter."""
+        return cls.query.filter(cls.removed_at.is_(None))
+
 
 class VMDisks(db.Model):
     __tablename__ = 'vm_disks'
@@ -47,6 +69,10 @@ class VMDisks(db.Model):
 
 class VMNic(db.Model):
     __tablename__ = 'vm_nics'
+    __table_args__ = (
+        # MACs are stored as vCenter reports them; lookups match on the bare lower-case hex digits
+        db.Index('ix_vm_nics_mac_digits', db.text("lower(translate(mac, ':-.', ''))")),
+    )
     id = db.Column(db.Integer, primary_key=True)
     vm_id = db.Column(db.String(64), db.ForeignKey('vms.id', ondelete='CASCADE'), nullable=False, index=True)
     label = db.Column(db.String(255))
@@ -56,3 +82,20 @@ class VMNic(db.Model):
     nic_type = db.Column(db.String(128))
     ip_addresses = db.Column(db.JSON)
 
+
+
+class VMIPAddress(db.Model):
+    """One guest IP of a VM, normalized out of ``VMNic.ip_addresses`` for lookups."""
+
+    __tablename__ = 'vm_ip_addresses'
+    __table_args__ = (
+        db.UniqueConstraint('vm_id', 'ip', name='uq_vm_ip_addresses_vm_ip'),
+        # btree serves exact lookups; GiST (inet_ops) serves CIDR containment (<<=)
+        db.Index('ix_vm_ip_addresses_ip', 'ip'),
+        db.Index('ix_vm_ip_addresses_ip_gist', 'ip', postgresql_using='gist', postgresql_ops={'ip': 'inet_ops'}),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    vm_id = db.Column(db.String(64), db.ForeignKey('vms.id', ondelete='CASCADE'), nullable=False, index=True)
+    ip = db.Column(INET, nullable=False)
+    mac = db.Column(db.String(64), index=True)
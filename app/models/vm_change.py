@@ -0,0 +1,32 @@
+from datetime import datetime
+from .. import db
+
+
+class VMChange(db.Model):
+    """One field of a VM changed by a sync: old and new value as text."""
+
+    __tablename__ = 'vm_changes'
+    __table_args__ = (
+        # One VM's history, newest (highest id) first
+        db.Index('ix_vm_changes_vm_id', 'vm_id', 'id'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    vm_id = db.Column(db.String(64), db.ForeignKey('vms.id', ondelete='CASCADE'), nullable=False)
+    # NULL for changes written outside a recorded sync run (targeted refreshes)
+    sync_run_id = db.Column(db.Integer, db.ForeignKey('sync_runs.id', ondelete='SET NULL'), nullable=True)
+    field = db.Column(db.String(64), nullable=False)
+    old_value = db.Column(db.Text, nullable=True)
+    new_value = db.Column(db.Text, nullable=True)
+    changed_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'vm_id': self.vm_id,
+            'sync_run_id': self.sync_run_id,
+            'field': self.field,
+            'old_value': self.old_value,
+            'new_value': self.new_value,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None,
+        }
@@ -0,0 +1,24 @@
+from datetime import datetime
+from .. import db
+
+
+class VMSearch(db.Model):
+    """Lowercased searchable text of one VM, kept up to date by sync and assignments.
+
+    ``document`` joins all other columns and carries the pg_trgm GIN index
+    (created at startup when the extension is available).
+    """
+
+    __tablename__ = 'vm_search'
+
+    vm_id = db.Column(db.String(64), db.ForeignKey('vms.id', ondelete='CASCADE'), primary_key=True)
+    name = db.Column(db.Text, nullable=False, default='')
+    guest_os = db.Column(db.Text, nullable=False, default='')
+    hypervisor = db.Column(db.Text, nullable=False, default='')
+    # NIC MACs and guest IPs
+    addresses = db.Column(db.Text, nullable=False, default='')
+    # Owner names and emails
+    owners = db.Column(db.Text, nullable=False, default='')
+    tags = db.Column(db.Text, nullable=False, default='')
+    document = db.Column(db.Text, nullable=False, default='')
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
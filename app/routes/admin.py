@@ -1,8 +1,9 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, current_app
 from flask_login import login_required
 from ..utils.roles import require_roles
 from ..models.admin import Admin
 from .. import db
+from ..utils.query_profiler import recent_profiles
 
 
 admin_bp = Blueprint('admin', __name__)
@@ -57,3 +58,20 @@ def admin_delete(admin_id: int):
     return jsonify({'status': 'deleted'})
 
 
+@admin_bp.route('/sql-profile')
+@login_required
+@require_roles('superadmin')
+def sql_profile():
+    profiles = recent_profiles()
+    if request.args.get('sort') == 'queries':
+        profiles.sort(key=lambda p: p['queries'], reverse=True)
+    return render_template('admins/sql_profile.html', profiles=profiles,
+                           enabled=current_app.config.get('SQL_PROFILER', False),
+                           threshold=current_app.config.get('SQL_PROFILER_REPEAT_THRESHOLD', 5))
+
+
+@admin_bp.route('/sql-profile/api')
+@login_required
+@require_roles('superadmin')
+def sql_profile_api():
+    return jsonify(recent_profiles())
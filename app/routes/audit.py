@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
 from ..utils.roles import require_roles
 from ..models.audit import AuditLog
+from ..utils.data_versions import conditional_on
 
 
 audit_bp = Blueprint('audit', __name__)
@@ -18,6 +19,7 @@ def list_audit():
 @audit_bp.route('/api')
 @login_required
 @require_roles('superadmin')
+@conditional_on('audit')
 def audit_api():
     q = AuditLog.query
     action = (request.args.get('action') or '').strip()
@@ -48,6 +50,7 @@ def audit_api():
 
 @audit_bp.route('/api/recent')
 @login_required
+@conditional_on('audit')
 def recent_audit_logs():
     """API endpoint for recent audit logs (dashboard use)"""
     limit = request.args.get('limit', 10, type=int)
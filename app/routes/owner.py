@@ -2,30 +2,47 @@ from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
 from ..utils.roles import require_roles
 from ..models.owner import Owner
+from ..models.vm import VM, vm_owners
 from ..utils.audit import log_audit_event
+from ..utils.data_versions import bump_data_version, conditional_on
+from ..utils.vm_stats import record_stats_snapshot
+from ..utils.vm_search import refresh_search_documents, owner_vm_ids
 from .. import db
 
 owner_bp = Blueprint('owner', __name__)
 
 
+def _active_vm_counts():
+    """Active VMs per owner id, in one grouped query instead of loading each owner's VMs."""
+    return dict(
+        db.session.query(vm_owners.c.owner_id, db.func.count())
+        .join(VM, VM.id == vm_owners.c.vm_id)
+        .filter(VM.removed_at.is_(None))
+        .group_by(vm_owners.c.owner_id)
+        .all()
+    )
+
+
 @owner_bp.route('/')
 @login_required
 def list_owners():
     owners = Owner.query.order_by(Owner.name.asc()).all()
-    return render_template('owners/list.html', owners=owners)
+    return render_template('owners/list.html', owners=owners, vm_counts=_active_vm_counts())
 
 
 @owner_bp.route('/api', methods=['GET'])
 @login_required
+@conditional_on('owners', 'vms')
 def owners_api_list():
     owners = Owner.query.order_by(Owner.name.asc()).all()
+    vm_counts = _active_vm_counts()
     return jsonify([
         { 
             'id': o.id, 
             'name': o.name, 
             'email': o.email, 
             'department': o.department,
-            'vm_count': len(o.vms)
+            'vm_count': vm_counts.get(o.id, 0)
         }
         for o in owners
     ])
@@ -44,7 +61,9 @@ def owners_api_create():
     o = Owner(name=name, email=email, department=department)
     db.session.add(o)
     log_audit_event(action='owner.create', entity='owner', entity_id=o.id, details=f"name={o.name}, email={o.email}")
+    bump_data_version('owners')
     db.session.commit()
+    record_stats_snapshot('owners')
     return jsonify({'id': o.id}), 201
 
 
@@ -58,6 +77,8 @@ def owners_api_update(owner_id: int):
     if 'email' in data: o.email = (data['email'] or '').strip()
     if 'department' in data: o.department = (data['department'] or '').strip()
     log_audit_event(action='owner.update', entity='owner', entity_id=o.id, details=f"name={o.name}, email={o.email}")
+    refresh_search_documents(owner_vm_ids(o.id))
+    bump_data_version('owners')
     db.session.commit()
     return jsonify({'status': 'ok'})
 
@@ -70,14 +91,19 @@ def owners_api_delete(owner_id: int):
     oid = o.id
     oname = o.name
     oemail = o.email
+    vm_ids = owner_vm_ids(o.id)
     db.session.delete(o)
     log_audit_event(action='owner.delete', entity='owner', entity_id=oid, details=f"name={oname}, email={oemail}")
+    refresh_search_documents(vm_ids)
+    bump_data_version('owners')
     db.session.commit()
+    record_stats_snapshot('owners')
     return jsonify({'status': 'deleted'})
 
 
 @owner_bp.route('/api/<int:owner_id>/vms')
 @login_required
+@conditional_on('owners', 'vms')
 def owner_vms(owner_id: int):
     """API endpoint to get VMs assigned to a specific owner"""
     owner = Owner.query.get_or_404(owner_id)
@@ -94,5 +120,6 @@ def owner_vms(owner_id: int):
             'updated_at': vm.updated_at.isoformat() if vm.updated_at else None,
         }
         for vm in owner.vms
+        if vm.removed_at is None
     ])
 
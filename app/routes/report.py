@@ -1,19 +1,19 @@
 from flask import Blueprint, jsonify
 from flask_login import login_required
-from ..models.vm import VM
+from ..utils.data_versions import conditional_on
+from ..utils.vm_stats import compute_vm_stats, latest_stats_snapshot
 
 report_bp = Blueprint('report', __name__)
 
 
 @report_bp.route('/summary')
 @login_required
+@conditional_on('stats')
 def summary():
-    total = VM.query.count()
-    powered_on = VM.query.filter_by(power_state='poweredOn').count()
-    powered_off = VM.query.filter_by(power_state='poweredOff').count()
+    snapshot = latest_stats_snapshot()
+    stats = snapshot.data if snapshot is not None else compute_vm_stats()
     return jsonify({
-        'total_vms': total,
-        'powered_on': powered_on,
-        'powered_off': powered_off,
+        'total_vms': stats['total_vms'],
+        'powered_on': stats['power_stats']['powered_on'],
+        'powered_off': stats['power_stats']['powered_off'],
     })
-
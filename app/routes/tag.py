@@ -3,6 +3,9 @@ from flask_login import login_required
 from ..utils.roles import require_roles
 from ..models.tag import Tag
 from ..utils.audit import log_audit_event
+from ..utils.data_versions import bump_data_version, conditional_on
+from ..utils.vm_stats import record_stats_snapshot
+from ..utils.vm_search import refresh_search_documents, tag_vm_ids
 from .. import db
 
 tag_bp = Blueprint('tag', __name__)
@@ -17,6 +20,7 @@ def list_tags():
 
 @tag_bp.route('/api', methods=['GET'])
 @login_required
+@conditional_on('tags', 'vms')
 def tags_api_list():
     tags = Tag.query.order_by(Tag.name.asc()).all()
     return jsonify([
@@ -37,7 +41,9 @@ def tags_api_create():
     t = Tag(name=name, description=description)
     db.session.add(t)
     log_audit_event(action='tag.create', entity='tag', entity_id=t.id, details=f"name={t.name}")
+    bump_data_version('tags')
     db.session.commit()
+    record_stats_snapshot('tags')
     return jsonify({'id': t.id}), 201
 
 
@@ -50,6 +56,8 @@ def tags_api_update(tag_id: int):
     if 'name' in data: t.name = (data['name'] or '').strip()
     if 'description' in data: t.description = (data['description'] or '').strip()
     log_audit_event(action='tag.update', entity='tag', entity_id=t.id, details=f"name={t.name}")
+    refresh_search_documents(tag_vm_ids(t.id))
+    bump_data_version('tags')
     db.session.commit()
     return jsonify({'status': 'ok'})
 
@@ -61,8 +69,12 @@ def tags_api_delete(tag_id: int):
     t = Tag.query.get_or_404(tag_id)
     tid = t.id
     tname = t.name
+    vm_ids = tag_vm_ids(t.id)
     db.session.delete(t)
     log_audit_event(action='tag.delete', entity='tag', entity_id=tid, details=f"name={tname}")
+    refresh_search_documents(vm_ids)
+    bump_data_version('tags')
     db.session.commit()
+    record_stats_snapshot('tags')
     return jsonify({'status': 'deleted'})
 
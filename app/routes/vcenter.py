@@ -1,21 +1,57 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
-from flask_login import login_required
+from flask_login import login_required, current_user
 from ..utils.roles import require_roles
 from ..models.vcenter import VCenterConfig
+from ..models.sync_run import SyncRun
+from ..models.sync_request import SyncRequest
 from ..utils.audit import log_audit_event
+from ..utils.data_versions import bump_data_version
 from .. import db, scheduler
-from ..scheduler.tasks import sync_vcenter_job
-import threading
-import ssl
-import urllib3
-from pyVim.connect import SmartConnect, Disconnect
+from ..scheduler.tasks import schedule_vcenter_job, unschedule_vcenter_job
+from ..scheduler.queue import enqueue_sync, sync_request_progress
+from ..utils.vcenter_sync import reset_incremental_state
+from ..utils.vcenter_session import get_session, release_sessions
+from ..utils.vm_stats import record_stats_snapshot
+from datetime import datetime, timedelta, timezone
 
 vcenter_bp = Blueprint('vcenter', __name__)
 
+def _refresh_schedule(cfg):
+    """Apply config changes to the in-process scheduler when this process runs one.
+
+    With a separate sync worker the worker's periodic job refresh picks the
+    change up instead.
+    """
+    if scheduler.running:
+        schedule_vcenter_job(scheduler, current_app._get_current_object(), cfg)
+
+
+def _parse_sync_interval(value):
+    """Parse the optional per-vCenter sync interval; returns (minutes, error)."""
+    value = (value or '').strip()
+    if not value:
+        return None, None
+    try:
+        minutes = int(value)
+    except ValueError:
+        return None, 'Sync interval must be a whole number of minutes'
+    if not 1 <= minutes <= 1440:
+        return None, 'Sync interval must be between 1 and 1440 minutes'
+    return minutes, None
+
+
 @vcenter_bp.route('/')
 @login_required
 def list_configs():
     configs = VCenterConfig.query.order_by(VCenterConfig.name.asc()).all()
+    last_syncs = dict(
+        db.session.query(SyncRun.vcenter_id, db.func.max(SyncRun.finished_at))
+        .filter(SyncRun.status == 'succeeded')
+        .group_by(SyncRun.vcenter_id)
+        .all()
+    )
+    for c in configs:
+        c.last_sync = last_syncs.get(c.id)
     return render_template('vcenter/vcenter.html', configs=configs)
 
 @vcenter_bp.route('/create', methods=['POST'])
@@ -28,6 +64,12 @@ def create_config():
     password = request.form.get('password')
     disable_ssl = bool(request.form.get('disable_ssl'))
     enabled = bool(request.form.get('enabled'))
+    adaptive_sync = bool(request.form.get('adaptive_sync'))
+    sync_interval_minutes, interval_error = _parse_sync_interval(request.form.get('sync_interval_minutes'))
+
+    if interval_error:
+        flash(interval_error, 'error')
+        return redirect(url_for('vcenter.list_configs'))
 
     if not name or not host or not username or not password:
         flash('All required fields must be filled', 'error')
@@ -35,11 +77,14 @@ def create_config():
 
     cfg = VCenterConfig(
         name=name, host=host, username=username, password=password,
-        disable_ssl=disable_ssl, enabled=enabled
+        disable_ssl=disable_ssl, enabled=enabled,
+        sync_interval_minutes=sync_interval_minutes, adaptive_sync=adaptive_sync
     )
     db.session.add(cfg)
     log_audit_event(action='vcenter.create', entity='vcenter', entity_id=cfg.id, details=f"name={cfg.name}, host={cfg.host}")
     db.session.commit()
+    record_stats_snapshot('vcenter')
+    _refresh_schedule(cfg)
     flash('vCenter configuration created successfully', 'success')
     return redirect(url_for('vcenter.list_configs'))
 
@@ -55,8 +100,17 @@ def edit_config(cfg_id):
         cfg.password = request.form.get('password')
     cfg.disable_ssl = bool(request.form.get('disable_ssl'))
     cfg.enabled = bool(request.form.get('enabled'))
-    log_audit_event(action='vcenter.update', entity='vcenter', entity_id=cfg.id, details=f"name={cfg.name}, host={cfg.host}")
+    sync_interval_minutes, interval_error = _parse_sync_interval(request.form.get('sync_interval_minutes'))
+    if interval_error:
+        flash(interval_error, 'error')
+        return redirect(url_for('vcenter.list_configs'))
+    cfg.sync_interval_minutes = sync_interval_minutes
+    cfg.adaptive_sync = bool(request.form.get('adaptive_sync'))
+    log_audit_event(action='vcenter.update', entity='vcenter', entity_id=cfg.id,
+                    details=f"name={cfg.name}, host={cfg.host}, interval={cfg.sync_interval_minutes or 'default'}, adaptive={cfg.adaptive_sync}")
     db.session.commit()
+    record_stats_snapshot('vcenter')
+    _refresh_schedule(cfg)
     flash('vCenter configuration updated successfully', 'success')
     return redirect(url_for('vcenter.list_configs'))
 
@@ -66,19 +120,8 @@ def edit_config(cfg_id):
 def test_connection(cfg_id):
     cfg = VCenterConfig.query.get_or_404(cfg_id)
     try:
-        if cfg.disable_ssl:
-            urllib3.disable_warnings()
-            context = ssl._create_unverified_context()
-        else:
-            context = None
-
-        si = SmartConnect(
-            host=cfg.host,
-            user=cfg.username,
-            pwd=cfg.password,
-            sslContext=context
-        )
-        Disconnect(si)
+        # Reuses the cached session when it is still valid; logs in otherwise
+        get_session(cfg, check=True)
         log_audit_event(action='vcenter.test_connection', entity='vcenter', entity_id=cfg.id, details='success')
         db.session.commit()
         return jsonify({'status': 'success', 'message': 'Connection successful'})
@@ -95,6 +138,11 @@ def toggle_config(cfg_id):
     cfg.enabled = not cfg.enabled
     log_audit_event(action='vcenter.toggle', entity='vcenter', entity_id=cfg.id, details=f"enabled={cfg.enabled}")
     db.session.commit()
+    record_stats_snapshot('vcenter')
+    _refresh_schedule(cfg)
+    if not cfg.enabled:
+        reset_incremental_state(cfg.id)
+        release_sessions(cfg.id)
     flash(f"vCenter configuration {'enabled' if cfg.enabled else 'disabled'}", 'success')
     return redirect(url_for('vcenter.list_configs'))
 
@@ -102,25 +150,41 @@ def toggle_config(cfg_id):
 @login_required
 @require_roles('editor', 'superadmin')
 def manual_sync():
-    def run_sync(app_instance):
-        from .. import db
-        with app_instance.app_context():
-            try:
-                sync_vcenter_job()
-                app_instance.logger.info("Manual vCenter sync completed successfully")
-            except Exception as e:
-                app_instance.logger.error(f"Manual vCenter sync failed: {e}")
-            finally:
-                db.session.remove()  # ensure connections are returned
-    
-    thread = threading.Thread(target=run_sync, args=(current_app._get_current_object(),))
-    thread.daemon = True
-    thread.start()
-    log_audit_event(action='vcenter.sync', entity='vcenter', entity_id=None, details='manual sync triggered')
+    full = request.args.get('full') == '1'
+    vcenter_id = request.args.get('vcenter_id', type=int)
+    if vcenter_id is not None:
+        VCenterConfig.query.get_or_404(vcenter_id)
+    req_id, merged = enqueue_sync(vcenter_id=vcenter_id, full=full,
+                                  requested_by=getattr(current_user, 'username', None))
+    details = 'manual full resync' if full else 'manual sync'
+    log_audit_event(action='vcenter.sync', entity='vcenter', entity_id=vcenter_id,
+                    details=f"{details} {'merged into' if merged else 'queued as'} request {req_id}")
     db.session.commit()
-    flash('Sync started in background', 'info')
+    message = f"{'Full resync' if full else 'Sync'} {'merged into the pending request' if merged else 'queued'}"
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'request_id': req_id, 'merged': merged, 'message': message})
+    flash(message, 'info')
     return redirect(url_for('vcenter.list_configs'))
 
+
+@vcenter_bp.route('/sync/requests/<int:req_id>')
+@login_required
+def sync_request_status(req_id):
+    req = SyncRequest.query.get_or_404(req_id)
+    return jsonify(sync_request_progress(req))
+
+
+@vcenter_bp.route('/sync/status')
+@login_required
+def sync_status():
+    """Queued and running sync requests with their progress, oldest first."""
+    active = (
+        SyncRequest.query.filter(SyncRequest.status.in_(('queued', 'running')))
+        .order_by(SyncRequest.requested_at.asc(), SyncRequest.id.asc())
+        .all()
+    )
+    return jsonify({'requests': [sync_request_progress(req) for req in active]})
+
 @vcenter_bp.route('/delete/<int:cfg_id>', methods=['POST'])
 @login_required
 @require_roles('superadmin')
@@ -130,6 +194,85 @@ def delete_config(cfg_id):
     cname = cfg.name
     db.session.delete(cfg)
     log_audit_event(action='vcenter.delete', entity='vcenter', entity_id=cid, details=f"name={cname}")
+    bump_data_version('vms')
     db.session.commit()
+    record_stats_snapshot('vcenter')
+    if scheduler.running:
+        unschedule_vcenter_job(scheduler, cid)
+    reset_incremental_state(cid)
+    release_sessions(cid)
     flash('vCenter configuration deleted successfully', 'success')
-    return redirect(url_for('vcenter.list_configs'))
\ No newline at end of file
+    return redirect(url_for('vcenter.list_configs'))
+
+
+def _sync_run_trends(days: int, vcenter_id=None):
+    """Daily per-vCenter averages of phase durations, sizes and round-trips."""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    day = db.func.date_trunc('day', SyncRun.started_at).label('day')
+    q = db.session.query(
+        SyncRun.vcenter_id,
+        db.func.max(SyncRun.vcenter_name),
+        day,
+        db.func.count(SyncRun.id),
+        db.func.sum(db.case((SyncRun.status == 'failed', 1), else_=0)),
+        db.func.max(SyncRun.vm_count),
+        db.func.avg(SyncRun.round_trips),
+        db.func.avg(SyncRun.bytes_received),
+        *[db.func.avg(getattr(SyncRun, f'{phase}_seconds')) for phase in SyncRun.PHASES],
+    ).filter(SyncRun.started_at >= since, SyncRun.finished_at.isnot(None))
+    if vcenter_id:
+        q = q.filter(SyncRun.vcenter_id == vcenter_id)
+    rows = q.group_by(SyncRun.vcenter_id, day).order_by(day.asc(), SyncRun.vcenter_id.asc()).all()
+
+    def _num(value, places=3):
+        return round(float(value), places) if value is not None else None
+
+    return [
+        {
+            'vcenter_id': row[0],
+            'vcenter_name': row[1],
+            'day': row[2].date().isoformat() if row[2] else None,
+            'runs': row[3],
+            'failed': int(row[4] or 0),
+            'max_vm_count': row[5],
+            'avg_round_trips': _num(row[6], 1),
+            'avg_bytes_received': _num(row[7], 0),
+            'avg_phases': {phase: _num(value) for phase, value in zip(SyncRun.PHASES, row[8:])},
+        }
+        for row in rows
+    ]
+
+
+@vcenter_bp.route('/runs')
+@login_required
+@require_roles('superadmin')
+def sync_runs():
+    days = min(max(request.args.get('days', 14, type=int), 1), 365)
+    vcenter_id = request.args.get('vcenter_id', type=int)
+    q = SyncRun.query
+    if vcenter_id:
+        q = q.filter(SyncRun.vcenter_id == vcenter_id)
+    runs = q.order_by(SyncRun.started_at.desc()).limit(200).all()
+    configs = VCenterConfig.query.order_by(VCenterConfig.name.asc()).all()
+    return render_template('vcenter/runs.html', runs=runs, trends=_sync_run_trends(days, vcenter_id),
+                           configs=configs, days=days, vcenter_id=vcenter_id, phases=SyncRun.PHASES)
+
+
+@vcenter_bp.route('/runs/api')
+@login_required
+@require_roles('superadmin')
+def sync_runs_api():
+    days = min(max(request.args.get('days', 14, type=int), 1), 365)
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 1000)
+    vcenter_id = request.args.get('vcenter_id', type=int)
+    status = (request.args.get('status') or '').strip()
+    q = SyncRun.query
+    if vcenter_id:
+        q = q.filter(SyncRun.vcenter_id == vcenter_id)
+    if status:
+        q = q.filter(SyncRun.status == status)
+    runs = q.order_by(SyncRun.started_at.desc()).limit(limit).all()
+    return jsonify({
+        'runs': [run.to_dict() for run in runs],
+        'trends': _sync_run_trends(days, vcenter_id),
+    })
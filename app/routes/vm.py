@@ -1,12 +1,24 @@
-from flask import Blueprint, render_template, jsonify, request
+import ipaddress
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, render_template, jsonify, request, current_app, stream_with_context, url_for
 from flask_login import login_required
+from itsdangerous import BadSignature, URLSafeSerializer
 from ..utils.roles import require_roles
-from ..models.vm import VM
+from ..models.vm import VM, VMIPAddress
 from ..models.owner import Owner
 from ..models.tag import Tag
+from ..models.vm_change import VMChange
+from ..models.stats_snapshot import StatsSnapshot
 from .. import db
 from ..utils.audit import log_audit_event
-from sqlalchemy import func
+from ..utils.data_versions import bump_data_version, conditional_on
+from ..utils.vcenter_sync import refresh_vms, REFRESH_MAX_VMS, normalize_ip, normalize_mac
+from ..utils.vm_stats import compute_vm_stats, latest_stats_snapshot, record_stats_snapshot
+from ..utils.vm_search import refresh_search_documents, search_vms, SEARCH_MAX_RESULTS
+from ..utils.vm_export import EXPORT_FORMATS, iter_export_chunks, iter_csv, iter_ndjson, iter_xlsx, gzip_stream
+from sqlalchemy import cast, func, text
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import INET
 
 vm_bp = Blueprint('vm', __name__)
 
@@ -14,19 +26,200 @@ vm_bp = Blueprint('vm', __name__)
 @vm_bp.route('/')
 @login_required
 def list_vms():
-    vms = VM.query.order_by(VM.name.asc()).all()
-    owners = Owner.query.order_by(Owner.name.asc()).all()
-    tags = Tag.query.order_by(Tag.name.asc()).all()
-    return render_template('vms/list.html', vms=vms, owners=owners, tags=tags)
+    # Rows are loaded page by page from /vms/api/table; only counts and filter options here
+    total, powered_on, powered_off = db.session.query(
+        func.count(VM.id),
+        func.count(VM.id).filter(VM.power_state == 'poweredOn'),
+        func.count(VM.id).filter(VM.power_state == 'poweredOff'),
+    ).filter(VM.removed_at.is_(None)).one()
+    owners = db.session.query(Owner.name).order_by(Owner.name.asc()).all()
+    tags = db.session.query(Tag.name).order_by(Tag.name.asc()).all()
+    return render_template('vms/list.html', total_vms=total, powered_on=powered_on, powered_off=powered_off,
+                           owners=owners, tags=tags)
+
+
+# DataTables column index -> sort expressions (None: not sortable)
+TABLE_SORT_COLUMNS = {
+    1: (VM.name,),
+    2: (VM.power_state,),
+    3: (VM.cpu, VM.memory_mb),
+    4: (VM.guest_os,),
+    5: (VM.hypervisor,),
+}
+
+
+def _table_column_filter(index: int, value: str):
+    """SQL condition for a DataTables per-column search value."""
+    if index == 1:
+        return VM.name.ilike(f"%{value}%")
+    if index == 2:
+        return VM.power_state == value
+    if index == 4:
+        return VM.guest_os.ilike(f"%{value}%")
+    if index == 5:
+        return VM.hypervisor.ilike(f"%{value}%")
+    if index == 6:
+        return VM.owners.any(Owner.name == value)
+    if index == 7:
+        return VM.tags.any(Tag.name == value)
+    return None
+
+
+@vm_bp.route('/api/table')
+@login_required
+@conditional_on('vms', 'owners', 'tags')
+def vms_table_api():
+    """DataTables server-side processing: paging, sorting and filtering in SQL."""
+    args = request.args
+    draw = args.get('draw', 0, type=int)
+    start = max(args.get('start', 0, type=int), 0)
+    length = args.get('length', 25, type=int)
+    length = 500 if length < 0 else min(max(length, 1), 500)
+
+    conditions = []
+    search = (args.get('search[value]') or '').strip()
+    if search:
+        pattern = f"%{search}%"
+        conditions.append(db.or_(VM.name.ilike(pattern), VM.guest_os.ilike(pattern), VM.hypervisor.ilike(pattern)))
+    for index in range(9):
+        value = (args.get(f'columns[{index}][search][value]') or '').strip()
+        if value:
+            condition = _table_column_filter(index, value)
+            if condition is not None:
+                conditions.append(condition)
+    q = VM.active().filter(*conditions)
+
+    order_by = []
+    for i in range(len(TABLE_SORT_COLUMNS)):
+        index = args.get(f'order[{i}][column]', type=int)
+        if index is None:
+            break
+        descending = args.get(f'order[{i}][dir]') == 'desc'
+        for column in TABLE_SORT_COLUMNS.get(index, ()):
+            order_by.append(column.desc().nullslast() if descending else column.asc().nullslast())
+    order_by.extend([VM.name.asc(), VM.id.asc()])
+
+    vms = (
+        q.options(selectinload(VM.owners), selectinload(VM.tags))
+        .order_by(*order_by)
+        .offset(start)
+        .limit(length)
+        .all()
+    )
+    total = VM.active().count()
+    return jsonify({
+        'draw': draw,
+        'recordsTotal': total,
+        'recordsFiltered': q.count() if conditions else total,
+        'data': [
+            {
+                'id': vm.id,
+                'name': vm.name,
+                'power_state': vm.power_state,
+                'cpu': vm.cpu,
+                'memory_mb': vm.memory_mb,
+                'guest_os': vm.guest_os,
+                'hypervisor': vm.hypervisor,
+                'owners': [o.name for o in vm.owners],
+                'tags': [t.name for t in vm.tags],
+            }
+            for vm in vms
+        ],
+    })
+
+
+VMS_API_MAX_PAGE_SIZE = 5000
+
+# vms_api query parameter -> SQL condition for its value
+VMS_API_FILTERS = {
+    'name': lambda value: VM.name.ilike(f"%{value}%"),
+    'power_state': lambda value: VM.power_state == value,
+    'guest_os': lambda value: VM.guest_os.ilike(f"%{value}%"),
+    'hypervisor': lambda value: VM.hypervisor.ilike(f"%{value}%"),
+    'vcenter_id': lambda value: VM.vcenter_id == int(value),
+    # Exact, case-insensitive matches
+    'owner': lambda value: VM.owners.any(
+        db.or_(db.func.lower(Owner.email) == value.lower(), db.func.lower(Owner.name) == value.lower())
+    ),
+    'tag': lambda value: VM.tags.any(db.func.lower(Tag.name) == value.lower()),
+}
+
+
+def _vms_api_conditions(args):
+    """SQL conditions for the ``VMS_API_FILTERS`` present in ``args``; raises ValueError."""
+    conditions = []
+    for param, condition in VMS_API_FILTERS.items():
+        value = (args.get(param) or '').strip()
+        if value:
+            conditions.append(condition(value))
+    return conditions
+
+
+def _cursor_serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='vms-api-cursor')
+
+
+def _encode_cursor(vm, direction: str) -> str:
+    return _cursor_serializer().dumps([vm.name, vm.id, direction])
+
+
+def _decode_cursor(cursor: str):
+    """``(name, id, direction)`` of a cursor from ``_encode_cursor``; raises BadSignature."""
+    name, vm_id, direction = _cursor_serializer().loads(cursor)
+    if direction not in ('next', 'prev'):
+        raise BadSignature('invalid cursor direction')
+    return name, vm_id, direction
 
 
 @vm_bp.route('/api')
 @login_required
+@conditional_on('vms', 'owners', 'tags')
 def vms_api():
-    q = VM.query
-    name = request.args.get('name')
-    if name:
-        q = q.filter(VM.name.ilike(f"%{name}%"))
+    """Active VMs ordered by ``(name, id)``, one keyset page at a time.
+
+    The body stays a plain list; ``Link`` headers carry the ``next`` and
+    ``prev`` page URLs with an opaque ``cursor`` and the same filters. Pages
+    seek on the (name, id) index, so page 200 costs the same as page 1.
+    """
+    args = request.args
+    limit = args.get('limit', current_app.config.get('VMS_API_PAGE_SIZE', 500), type=int)
+    limit = min(max(limit, 1), VMS_API_MAX_PAGE_SIZE)
+
+    try:
+        conditions = _vms_api_conditions(args)
+    except ValueError:
+        return jsonify({'error': 'vcenter_id must be an integer'}), 400
+    q = VM.active().filter(*conditions)
+
+    cursor = args.get('cursor')
+    direction = 'next'
+    if cursor:
+        try:
+            name, vm_id, direction = _decode_cursor(cursor)
+        except (BadSignature, TypeError, ValueError):
+            return jsonify({'error': 'invalid cursor'}), 400
+        key = db.tuple_(VM.name, VM.id)
+        q = q.filter(key > db.tuple_(name, vm_id) if direction == 'next' else key < db.tuple_(name, vm_id))
+    if direction == 'next':
+        q = q.order_by(VM.name.asc(), VM.id.asc())
+    else:
+        q = q.order_by(VM.name.desc(), VM.id.desc())
+
+    vms = q.limit(limit + 1).all()
+    has_more = len(vms) > limit
+    vms = vms[:limit]
+    if direction == 'prev':
+        vms.reverse()
+
+    links = []
+    page_args = {k: v for k, v in args.items() if k != 'cursor'}
+    if vms and (has_more if direction == 'next' else True):
+        links.append((_encode_cursor(vms[-1], 'next'), 'next'))
+    if vms and cursor and (has_more if direction == 'prev' else True):
+        links.append((_encode_cursor(vms[0], 'prev'), 'prev'))
+    if cursor:
+        links.append((None, 'first'))
+
     data = [
         {
             'id': vm.id,
@@ -37,13 +230,58 @@ def vms_api():
             'power_state': vm.power_state,
             'hypervisor': vm.hypervisor,
         }
-        for vm in q.limit(500).all()
+        for vm in vms
     ]
-    return jsonify(data)
+    response = jsonify(data)
+    if links:
+        response.headers['Link'] = ', '.join(
+            f'<{url_for("vm.vms_api", _external=True, **page_args, **({"cursor": c} if c else {}))}>; rel="{rel}"'
+            for c, rel in links
+        )
+    return response
+
+
+@vm_bp.route('/export')
+@login_required
+def export_vms():
+    """Stream all active VMs (with owners, tags, disks and NICs) as CSV, NDJSON or XLSX.
+
+    Accepts the ``/vms/api`` filters; ``gzip=1`` compresses CSV and NDJSON.
+    """
+    fmt = (request.args.get('format') or 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    compress = (request.args.get('gzip') or '').lower() in ('1', 'true', 'yes')
+    if compress and fmt == 'xlsx':
+        return jsonify({'error': 'xlsx is already compressed'}), 400
+    try:
+        conditions = _vms_api_conditions(request.args)
+    except ValueError:
+        return jsonify({'error': 'vcenter_id must be an integer'}), 400
+
+    filters = ', '.join(f"{k}={v}" for k, v in request.args.items() if k in VMS_API_FILTERS)
+    log_audit_event(action='vm.export', entity='vm', details=f"format={fmt}; gzip={compress}; filters={filters}")
+    db.session.commit()
+
+    content_type, extension = EXPORT_FORMATS[fmt]
+    writer = {'csv': iter_csv, 'ndjson': iter_ndjson, 'xlsx': iter_xlsx}[fmt]
+    body = writer(iter_export_chunks(conditions, int(current_app.config.get('VM_EXPORT_CHUNK_SIZE', 1000))))
+    filename = f"nimbus-vms-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{extension}"
+    if compress:
+        body = gzip_stream(body)
+        content_type = 'application/gzip'
+        filename += '.gz'
+    response = Response(stream_with_context(body), content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Let Nginx pass chunks through instead of buffering the whole export
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @vm_bp.route('/api/<string:vm_id>')
 @login_required
+@conditional_on('vms', 'owners', 'tags')
 def vm_detail(vm_id: str):
     vm = VM.query.get_or_404(vm_id)
     return jsonify({
@@ -54,6 +292,11 @@ def vm_detail(vm_id: str):
         'guest_os': vm.guest_os,
         'power_state': vm.power_state,
         'hypervisor': vm.hypervisor,
+        'vcenter_id': vm.vcenter_id,
+        'moref': vm.moref,
+        'first_seen_at': vm.first_seen_at.isoformat() if vm.first_seen_at else None,
+        'last_seen_at': vm.last_seen_at.isoformat() if vm.last_seen_at else None,
+        'removed_at': vm.removed_at.isoformat() if vm.removed_at else None,
         'owners': [ { 'id': o.id, 'name': o.name, 'email': o.email, 'department': o.department } for o in vm.owners ],
         'tags': [ { 'id': t.id, 'name': t.name } for t in vm.tags ],
         'disks': [ { 'label': d.label, 'size_gb': float(d.size_gb or 0) } for d in vm.disks ],
@@ -61,6 +304,197 @@ def vm_detail(vm_id: str):
     })
 
 
+# Upper bound on addresses per bulk lookup
+LOOKUP_MAX_ADDRESSES = 10000
+
+# Resolves IPs and MACs to active VMs and their owners in one statement
+_LOOKUP_SQL = text("""
+    WITH hits AS (
+        SELECT 'ip' AS kind, host(q.ip) AS address, a.vm_id
+        FROM unnest(CAST(:ips AS inet[])) AS q(ip)
+        JOIN vm_ip_addresses a ON a.ip = q.ip
+        UNION
+        SELECT 'mac', q.mac, n.vm_id
+        FROM unnest(CAST(:macs AS text[])) AS q(mac)
+        -- Stored MACs keep vCenter's case and separators (served by ix_vm_nics_mac_digits)
+        JOIN vm_nics n ON lower(translate(n.mac, ':-.', '')) = replace(q.mac, ':', '')
+    )
+    SELECT h.kind, h.address, v.id, v.name,
+           COALESCE((SELECT json_agg(json_build_object('id', o.id, 'name', o.name, 'email', o.email) ORDER BY o.name)
+                     FROM vm_owners vo JOIN owners o ON o.id = vo.owner_id
+                     WHERE vo.vm_id = v.id), '[]'::json) AS owners
+    FROM hits h
+    JOIN vms v ON v.id = h.vm_id AND v.removed_at IS NULL
+    ORDER BY h.kind, h.address, v.name
+""")
+
+
+@vm_bp.route('/api/lookup', methods=['POST'])
+@login_required
+def lookup_addresses():
+    data = request.get_json() or {}
+    ips, macs = data.get('ips') or [], data.get('macs') or []
+    if not isinstance(ips, list) or not isinstance(macs, list):
+        return jsonify({'error': 'ips and macs must be lists'}), 400
+    if len(ips) + len(macs) > LOOKUP_MAX_ADDRESSES:
+        return jsonify({'error': f'at most {LOOKUP_MAX_ADDRESSES} addresses per lookup'}), 400
+
+    invalid = []
+    wanted = {'ip': {}, 'mac': {}}
+    for kind, values, normalize in (('ip', ips, normalize_ip), ('mac', macs, normalize_mac)):
+        for value in values:
+            normalized = normalize(value)
+            if normalized is None:
+                invalid.append(value)
+            else:
+                wanted[kind][normalized] = value
+
+    results = {'ips': {}, 'macs': {}}
+    if wanted['ip'] or wanted['mac']:
+        rows = db.session.execute(_LOOKUP_SQL, {'ips': list(wanted['ip']), 'macs': list(wanted['mac'])})
+        for kind, address, vm_id, name, owners in rows:
+            results[f'{kind}s'].setdefault(address, []).append({'vm_id': vm_id, 'name': name, 'owners': owners})
+    not_found = [wanted['ip'][ip] for ip in wanted['ip'] if ip not in results['ips']] + \
+                [wanted['mac'][mac] for mac in wanted['mac'] if mac not in results['macs']]
+    return jsonify({**results, 'not_found': not_found, 'invalid': invalid})
+
+
+@vm_bp.route('/api/ips')
+@login_required
+@conditional_on('vms')
+def ips_in_network():
+    """Guest IPs of active VMs inside ``cidr`` (served by the GiST index)."""
+    cidr = (request.args.get('cidr') or '').strip()
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), LOOKUP_MAX_ADDRESSES)
+    try:
+        network = str(ipaddress.ip_network(cidr, strict=False))
+    except ValueError:
+        return jsonify({'error': 'cidr must be a network such as 10.2.0.0/16'}), 400
+    rows = (
+        db.session.query(func.host(VMIPAddress.ip), VMIPAddress.mac, VM.id, VM.name)
+        .join(VM, VM.id == VMIPAddress.vm_id)
+        .filter(VM.removed_at.is_(None), VMIPAddress.ip.op('<<=')(cast(network, INET)))
+        .order_by(VMIPAddress.ip)
+        .limit(limit)
+        .all()
+    )
+    return jsonify({
+        'cidr': network,
+        'addresses': [{'ip': ip, 'mac': mac, 'vm_id': vm_id, 'name': name} for ip, mac, vm_id, name in rows],
+    })
+
+
+@vm_bp.route('/api/search')
+@login_required
+@conditional_on('vms', 'owners', 'tags')
+def search_vms_api():
+    """Ranked search over name, guest OS, host, MACs, IPs, owners and tags."""
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    limit = min(max(request.args.get('limit', 25, type=int), 1), SEARCH_MAX_RESULTS)
+    return jsonify({'q': q, 'results': search_vms(q, limit)})
+
+
+def _refresh_response(vm_ids, vcenter_id=None):
+    result = refresh_vms(vm_ids, vcenter_id=vcenter_id)
+    log_audit_event(
+        action='vm.refresh', entity='vm', entity_id=vm_ids[0] if len(vm_ids) == 1 else None,
+        details=f"refreshed={len(result['refreshed'])}; removed={len(result['removed'])}; "
+                f"not_found={len(result['not_found'])}",
+    )
+    db.session.commit()
+    if result['refreshed'] or result['removed']:
+        record_stats_snapshot('refresh')
+    if not result['refreshed'] and not result['removed'] and result['busy'] and not result['errors']:
+        return jsonify(dict(result, error='sync in progress')), 409
+    status = 502 if result['errors'] and not result['refreshed'] and not result['removed'] else 200
+    return jsonify(result), status
+
+
+@vm_bp.route('/api/refresh', methods=['POST'])
+@login_required
+@require_roles('editor', 'superadmin')
+def refresh_vms_api():
+    data = request.get_json() or {}
+    vm_ids = data.get('vm_ids') or []
+    if isinstance(vm_ids, str):
+        vm_ids = [v.strip() for v in vm_ids.split(',') if v.strip()]
+    if not vm_ids:
+        return jsonify({'error': 'vm_ids is required'}), 400
+    if len(vm_ids) > REFRESH_MAX_VMS:
+        return jsonify({'error': f'at most {REFRESH_MAX_VMS} VMs per refresh; run a sync instead'}), 400
+    vcenter_id = data.get('vcenter_id')
+    if vcenter_id is not None and not isinstance(vcenter_id, int):
+        return jsonify({'error': 'vcenter_id must be an integer'}), 400
+    return _refresh_response(vm_ids, vcenter_id)
+
+
+@vm_bp.route('/api/<string:vm_id>/refresh', methods=['POST'])
+@login_required
+@require_roles('editor', 'superadmin')
+def refresh_vm(vm_id: str):
+    return _refresh_response([vm_id])
+
+
+def _parse_timestamp(value):
+    """Parse an ISO 8601 query parameter; naive values are taken as UTC."""
+    ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+@vm_bp.route('/api/<string:vm_id>/history')
+@login_required
+@conditional_on('vms')
+def vm_history(vm_id: str):
+    """Field changes of one VM, newest (highest id) first; page with ``before=<last id>``.
+
+    Ordered by id alone: ``changed_at`` is taken per batch, so concurrent
+    writers can store it out of id order, which would break the id cursor.
+    """
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    q = VMChange.query.filter(VMChange.vm_id == vm_id)
+    before = request.args.get('before', type=int)
+    if before:
+        q = q.filter(VMChange.id < before)
+    changes = q.order_by(VMChange.id.desc()).limit(limit).all()
+    return jsonify({
+        'vm_id': vm_id,
+        'changes': [c.to_dict() for c in changes],
+        'next_before': changes[-1].id if len(changes) == limit else None,
+    })
+
+
+@vm_bp.route('/api/changes')
+@login_required
+def vm_changes():
+    """What changed between ``since`` and ``until`` (default: the last 24 hours)."""
+    try:
+        until = _parse_timestamp(request.args['until']) if request.args.get('until') else datetime.now(timezone.utc)
+        since = _parse_timestamp(request.args['since']) if request.args.get('since') else until - timedelta(hours=24)
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO 8601 timestamps'}), 400
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+    q = (
+        db.session.query(VMChange, VM.name)
+        .join(VM, VM.id == VMChange.vm_id)
+        .filter(VMChange.changed_at >= since, VMChange.changed_at < until)
+    )
+    field = request.args.get('field')
+    if field:
+        q = q.filter(VMChange.field == field)
+    vcenter_id = request.args.get('vcenter_id', type=int)
+    if vcenter_id:
+        q = q.filter(VM.vcenter_id == vcenter_id)
+    rows = q.order_by(VMChange.changed_at.desc(), VMChange.id.desc()).limit(limit).all()
+    return jsonify({
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'changes': [dict(change.to_dict(), vm_name=name) for change, name in rows],
+        'truncated': len(rows) == limit,
+    })
+
+
 @vm_bp.route('/api/<string:vm_id>/owners', methods=['POST'])
 @login_required
 @require_roles('editor', 'superadmin')
@@ -71,6 +505,7 @@ def assign_vm_owners(vm_id: str):
     if isinstance(emails, str):
         emails = [e.strip() for e in emails.split(',') if e.strip()]
     new_owners = []
+    created = False
     for email in emails:
         owner = Owner.query.filter(Owner.email.ilike(email)).first()
         if not owner:
@@ -78,11 +513,16 @@ def assign_vm_owners(vm_id: str):
             owner = Owner(name=email.split('@')[0], email=email)
             db.session.add(owner)
             db.session.flush()
+            created = True
         new_owners.append(owner)
     vm.owners = new_owners
     detail_owners = ','.join([o.email for o in vm.owners])
     log_audit_event(action='vm.assign_owners', entity='vm', entity_id=vm.id, details=f"owners={detail_owners}")
+    refresh_search_documents([vm.id])
+    bump_data_version('owners')
     db.session.commit()
+    if created:
+        record_stats_snapshot('owners')
     return jsonify({'status': 'ok', 'owners': [ {'id': o.id, 'name': o.name, 'email': o.email } for o in vm.owners ]})
 
 
@@ -112,6 +552,8 @@ def unassign_vm_owner(vm_id: str):
         entity_id=vm.id,
         details=f"email={owner.email}; reason={reason}"
     )
+    refresh_search_documents([vm.id])
+    bump_data_version('owners')
     db.session.commit()
     return jsonify({'status': 'ok', 'owners': [ {'id': o.id, 'name': o.name, 'email': o.email, 'department': o.department } for o in vm.owners ]})
 
@@ -125,17 +567,23 @@ def assign_vm_tags(vm_id: str):
     if isinstance(tags, str):
         tags = [t.strip() for t in tags.split(',') if t.strip()]
     new_tags = []
+    created = False
     for name in tags:
         tag = Tag.query.filter(Tag.name.ilike(name)).first()
         if not tag:
             tag = Tag(name=name)
             db.session.add(tag)
             db.session.flush()
+            created = True
         new_tags.append(tag)
     vm.tags = new_tags
     detail_tags = ','.join([t.name for t in vm.tags])
     log_audit_event(action='vm.assign_tags', entity='vm', entity_id=vm.id, details=f"tags={detail_tags}")
+    refresh_search_documents([vm.id])
+    bump_data_version('tags')
     db.session.commit()
+    if created:
+        record_stats_snapshot('tags')
     return jsonify({'status': 'ok', 'tags': [ {'id': t.id, 'name': t.name } for t in vm.tags ]})
 
 
@@ -160,147 +608,31 @@ def unassign_vm_tag(vm_id: str):
         return jsonify({'error': 'tag not assigned'}), 404
     vm.tags = remaining
     log_audit_event(action='vm.unassign_tag', entity='vm', entity_id=vm.id, details=f"tag={removed.name}")
+    refresh_search_documents([vm.id])
+    bump_data_version('tags')
     db.session.commit()
     return jsonify({'status': 'ok', 'tags': [ {'id': t.id, 'name': t.name } for t in vm.tags ]})
 
 
 @vm_bp.route('/api/stats')
 @login_required
+@conditional_on('stats')
 def vm_stats():
-    """API endpoint to provide VM statistics for dashboard"""
-    
-    # Total VM count
-    total_vms = VM.query.count()
-    
-    # Power state statistics
-    power_stats = db.session.query(
-        VM.power_state,
-        func.count(VM.id).label('count')
-    ).group_by(VM.power_state).all()
-    
-    # Convert power stats to dictionary
-    power_on = 0
-    power_off = 0
-    for stat in power_stats:
-        if stat.power_state and stat.power_state.lower() in ['poweredon', 'powered on', 'running']:
-            power_on = stat.count
-        elif stat.power_state and stat.power_state.lower() in ['poweredoff', 'powered off', 'stopped']:
-            power_off = stat.count
-    
-    # OS statistics
-    os_stats = db.session.query(
-        VM.guest_os,
-        VM.power_state,
-        func.count(VM.id).label('count')
-    ).group_by(VM.guest_os, VM.power_state).all()
-    
-    # Categorize OS types and count by power state
-    windows_total = 0
-    windows_on = 0
-    windows_off = 0
-    linux_total = 0
-    linux_on = 0
-    linux_off = 0
-    other_total = 0
-    other_on = 0
-    other_off = 0
-    
-    for stat in os_stats:
-        guest_os = stat.guest_os or ''
-        power_state = stat.power_state or ''
-        count = stat.count
-        
-        # Categorize OS
-        is_windows = 'windows' in guest_os.lower()
-        is_linux = any(os_type in guest_os.lower() for os_type in ['linux', 'ubuntu', 'centos', 'redhat', 'debian', 'fedora'])
-        
-        # Categorize power state
-        is_on = power_state.lower() in ['poweredon', 'powered on', 'running']
-        is_off = power_state.lower() in ['poweredoff', 'powered off', 'stopped']
-        
-        if is_windows:
-            windows_total += count
-            if is_on:
-                windows_on += count
-            elif is_off:
-                windows_off += count
-        elif is_linux:
-            linux_total += count
-            if is_on:
-                linux_on += count
-            elif is_off:
-                linux_off += count
-        else:
-            other_total += count
-            if is_on:
-                other_on += count
-            elif is_off:
-                other_off += count
-    
-    # Additional metrics
-    from ..models.owner import Owner
-    from ..models.tag import Tag
-    from ..models.vcenter import VCenterConfig
-    
-    # Calculate average CPU and memory
-    avg_cpu = db.session.query(func.avg(VM.cpu)).scalar() or 0
-    avg_memory_mb = db.session.query(func.avg(VM.memory_mb)).scalar() or 0
-    avg_memory_gb = avg_memory_mb / 1024 if avg_memory_mb else 0
-    
-    # Count unique hypervisors from VM records (excluding null/empty values)
-    unique_hypervisors = db.session.query(func.count(func.distinct(VM.hypervisor)))\
-        .filter(VM.hypervisor.isnot(None), VM.hypervisor != '').scalar() or 0
-    
-    # Get hypervisor breakdown (hypervisor name -> VM count)
-    hypervisor_stats = db.session.query(
-        VM.hypervisor,
-        func.count(VM.id).label('vm_count')
-    ).filter(VM.hypervisor.isnot(None), VM.hypervisor != '')\
-     .group_by(VM.hypervisor)\
-     .order_by(func.count(VM.id).desc())\
-     .limit(10).all()
-    
-    hypervisor_breakdown = [
-        {'hypervisor': stat.hypervisor, 'vm_count': stat.vm_count}
-        for stat in hypervisor_stats
-    ]
-    
-    # Count active owners and tags
-    total_owners = Owner.query.count()
-    total_tags = Tag.query.count()
-    total_hypervisors = VCenterConfig.query.filter_by(enabled=True).count()
-    
-    return jsonify({
-        'total_vms': total_vms,
-        'power_stats': {
-            'powered_on': power_on,
-            'powered_off': power_off
-        },
-        'os_breakdown': {
-            'windows': {
-                'total': windows_total,
-                'powered_on': windows_on,
-                'powered_off': windows_off
-            },
-            'linux': {
-                'total': linux_total,
-                'powered_on': linux_on,
-                'powered_off': linux_off
-            },
-            'other': {
-                'total': other_total,
-                'powered_on': other_on,
-                'powered_off': other_off
-            }
-        },
-        'additional_metrics': {
-            'avg_cpu': round(avg_cpu, 1),
-            'avg_memory_gb': round(avg_memory_gb, 1),
-            'total_owners': total_owners,
-            'total_tags': total_tags,
-            'total_hypervisors': total_hypervisors,
-            'unique_hypervisors': unique_hypervisors
-        },
-        'hypervisor_breakdown': hypervisor_breakdown
-    })
+    """API endpoint to provide VM statistics for dashboard (latest stats snapshot)"""
+    snapshot = latest_stats_snapshot()
+    if snapshot is None:
+        return jsonify(compute_vm_stats())
+    return jsonify({**snapshot.data, 'snapshot_at': snapshot.taken_at.isoformat()})
+
+
+@vm_bp.route('/api/stats/history')
+@login_required
+@conditional_on('stats')
+def vm_stats_history():
+    """Headline counts of the stats snapshots of the last ``days`` days, oldest first."""
+    days = max(1, min(request.args.get('days', 30, type=int), 3650))
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    snapshots = StatsSnapshot.query.filter(StatsSnapshot.taken_at >= since)\
+        .order_by(StatsSnapshot.taken_at.asc()).all()
+    return jsonify({'days': days, 'snapshots': [snapshot.to_dict() for snapshot in snapshots]})
 
@@ -0,0 +1,158 @@
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import literal_column, tuple_ as db_tuple
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..models.sync_request import SyncRequest
+from ..models.sync_run import SyncRun
+
+
+def enqueue_sync(vcenter_id: Optional[int] = None, full: bool = False,
+                 requested_by: Optional[str] = None) -> Tuple[int, bool]:
+    """Queue a sync for the sync worker; ``vcenter_id=None`` means all vCenters.
+
+    A request for a target that already has one queued is merged into it (a
+    full resync wins over an incremental one), as is a request for a single
+    vCenter while an all-vCenters request is queued. Returns
+    ``(request_id, merged)``; the caller commits.
+    """
+    from .. import db
+
+    if vcenter_id is not None:
+        pending_all = (
+            SyncRequest.query.filter_by(status='queued', vcenter_id=None)
+            .with_for_update().first()
+        )
+        if pending_all is not None:
+            pending_all.full = pending_all.full or full
+            return pending_all.id, True
+
+    # ux_sync_requests_queued_target makes this atomic across web processes
+    table = SyncRequest.__table__
+    stmt = pg_insert(table).values(
+        vcenter_id=vcenter_id, full=full, requested_by=requested_by,
+        requested_at=datetime.now(timezone.utc), status='queued',
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[db.func.coalesce(table.c.vcenter_id, 0)],
+        index_where=table.c.status == 'queued',
+        set_={'full': table.c.full | stmt.excluded.full},
+    ).returning(table.c.id, literal_column('xmax') != 0)
+    req_id, merged = db.session.execute(stmt).one()
+    return req_id, bool(merged)
+
+
+def _claim_next_request() -> Optional[int]:
+    """Mark the oldest queued request running and return its id.
+
+    ``FOR UPDATE SKIP LOCKED`` lets several workers poll the same queue
+    without claiming a request twice.
+    """
+    from .. import db
+
+    req = (
+        SyncRequest.query.filter_by(status='queued')
+        .order_by(SyncRequest.requested_at.asc(), SyncRequest.id.asc())
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if req is None:
+        db.session.rollback()
+        return None
+    req.status = 'running'
+    req.started_at = datetime.now(timezone.utc)
+    db.session.commit()
+    return req.id
+
+
+def process_next_sync_request(app) -> bool:
+    """Run the oldest queued sync request; returns False if the queue was empty."""
+    from .. import db
+    from .tasks import sync_vcenter_job, _sync_one_vcenter
+
+    with app.app_context():
+        try:
+            req_id = _claim_next_request()
+            if req_id is None:
+                return False
+            req = db.session.get(SyncRequest, req_id)
+            vcenter_id, full = req.vcenter_id, req.full
+            current_app.logger.info(
+                f"Processing sync request {req_id} ({'all vCenters' if vcenter_id is None else f'vCenter {vcenter_id}'}"
+                f"{', full' if full else ''})"
+            )
+            error = None
+            try:
+                if vcenter_id is None:
+                    statuses = sync_vcenter_job(full=full, request_id=req_id, wait=True)
+                else:
+                    statuses = {vcenter_id: _sync_one_vcenter(app, vcenter_id, full, request_id=req_id, wait=True)}
+                if 'failed' in statuses.values():
+                    failed = SyncRun.query.filter_by(request_id=req_id, status='failed').all()
+                    error = '; '.join(f"{run.vcenter_name}: {run.error}" for run in failed) or 'sync failed'
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+                current_app.logger.error(f"Sync request {req_id} failed: {e}")
+                db.session.rollback()
+
+            req = db.session.get(SyncRequest, req_id)
+            if req is not None:
+                req.status = 'failed' if error else 'succeeded'
+                req.error = error
+                req.finished_at = datetime.now(timezone.utc)
+                db.session.commit()
+            return True
+        finally:
+            db.session.remove()
+
+
+def sync_request_progress(req: SyncRequest) -> Dict:
+    """Status, queue position, current phase and VMs processed for ``req``."""
+    runs = SyncRun.query.filter_by(request_id=req.id).order_by(SyncRun.id.asc()).all()
+    position = None
+    if req.status == 'queued':
+        position = SyncRequest.query.filter(
+            SyncRequest.status == 'queued',
+            db_tuple(SyncRequest.requested_at, SyncRequest.id) <= db_tuple(req.requested_at, req.id),
+        ).count()
+    return {
+        'id': req.id,
+        'vcenter_id': req.vcenter_id,
+        'full': req.full,
+        'status': req.status,
+        'queue_position': position,
+        'requested_by': req.requested_by,
+        'requested_at': req.requested_at.isoformat() if req.requested_at else None,
+        'started_at': req.started_at.isoformat() if req.started_at else None,
+        'finished_at': req.finished_at.isoformat() if req.finished_at else None,
+        'vms_processed': sum(run.vm_count or 0 for run in runs),
+        'runs': [
+            {'vcenter_id': run.vcenter_id, 'vcenter_name': run.vcenter_name, 'status': run.status,
+             'phase': run.phase, 'mode': run.mode, 'vm_count': run.vm_count or 0, 'error': run.error}
+            for run in runs
+        ],
+        'error': req.error,
+    }
+
+
+def drain_sync_queue(app) -> None:
+    """Process queued sync requests until the queue is empty."""
+    while process_next_sync_request(app):
+        pass
+
+
+def schedule_sync_queue(scheduler, app) -> None:
+    """Poll the sync request queue from ``scheduler`` (single-process deployments)."""
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    scheduler.add_job(
+        func=drain_sync_queue,
+        args=[app],
+        trigger=IntervalTrigger(seconds=max(1, int(app.config.get('SYNC_WORKER_POLL_SECONDS', 2)))),
+        id='sync_request_queue',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
@@ -1,77 +1,379 @@
+import time
+import random
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from apscheduler.triggers.interval import IntervalTrigger
 from flask import current_app
-from ..utils.vcenter_sync import fetch_vms_from_vcenter, upsert_vm_records
+from ..utils.vcenter_sync import (
+    iter_vms_from_vcenter, iter_vm_changes, upsert_vm_records, reconcile_removed_vms, peak_rss_mb, timed,
+    reset_incremental_state, LOCK_KEY,
+)
+from ..utils.vcenter_session import release_sessions
+from ..utils.vm_stats import record_stats_snapshot
 from ..models.vcenter import VCenterConfig
+from ..models.sync_run import SyncRun
 
 
-def sync_vcenter_job():
-    from flask import current_app
-    from sqlalchemy import text
+def _start_sync_run(cfg: VCenterConfig, request_id=None):
+    """Insert a ``running`` sync_runs row for ``cfg`` and return its id."""
     from .. import db
 
-    # Prevent concurrent syncs across threads/processes using a DB advisory lock
-    LOCK_KEY = 872345  # arbitrary constant for vcenter sync
     try:
-        acquired = db.session.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_KEY}).scalar()
+        run = SyncRun(vcenter_id=cfg.id, vcenter_name=cfg.name, request_id=request_id,
+                      started_at=datetime.now(timezone.utc), status='running', phase='connect')
+        db.session.add(run)
+        db.session.commit()
+        return run.id
     except Exception as e:
-        current_app.logger.error(f"Failed to try advisory lock: {e}")
-        return
+        db.session.rollback()
+        current_app.logger.warning(f"Could not record sync run for {cfg.name}: {e}")
+        return None
+
 
-    if not acquired:
-        current_app.logger.info("vCenter sync skipped: another sync is in progress")
+def _set_run_progress(run_id, phase: str, processed=None) -> None:
+    """Publish the current phase (and VMs processed so far) of a running sync."""
+    from .. import db
+
+    if run_id is None:
         return
+    values = {SyncRun.phase: phase}
+    if processed is not None:
+        values[SyncRun.vm_count] = processed
+    try:
+        SyncRun.query.filter_by(id=run_id).update(values, synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.debug(f"Could not update progress of sync run {run_id}: {e}")
+
 
+def _finish_sync_run(run_id, result: dict, counters: dict, error=None) -> None:
+    """Store the outcome, counts and phase timings of a sync run.
+
+    Retrieve time is what the upsert waited on the vCenter stream, less the
+    connect and transform time spent inside it.
+    """
+    from .. import db
+
+    if run_id is None:
+        return
     try:
-        configs = VCenterConfig.query.filter_by(enabled=True).all()
-        
-        if not configs:
-            current_app.logger.info("No enabled vCenter configurations found")
+        run = db.session.get(SyncRun, run_id)
+        if run is None:
             return
-        
-        for cfg in configs:
+        fetch_s = result.get('fetch_s', 0.0)
+        run.finished_at = datetime.now(timezone.utc)
+        run.status = 'failed' if error else 'succeeded'
+        run.phase = None
+        run.error = error
+        run.mode = 'full' if result.get('was_full') else 'incremental'
+        run.connect_seconds = round(result.get('connect_s', 0.0), 3)
+        run.transform_seconds = round(result.get('transform_s', 0.0), 3)
+        run.retrieve_seconds = round(max(0.0, fetch_s - run.connect_seconds - run.transform_seconds), 3)
+        run.upsert_seconds = round(counters.get('upsert_s', 0.0), 3)
+        run.commit_seconds = round(counters.get('commit_s', 0.0), 3)
+        run.vm_count = counters.get('processed', 0)
+        run.created_count = counters.get('created', 0)
+        run.changed_count = counters.get('changed', 0)
+        run.unchanged_count = counters.get('unchanged', 0)
+        run.skipped_count = counters.get('skipped', 0)
+        run.errored_count = result.get('errored', 0)
+        run.removed_count = counters.get('removed', 0)
+        run.round_trips = result.get('round_trips', 0)
+        run.bytes_received = result.get('bytes_received', 0)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Could not finish sync run {run_id}: {e}")
+
+
+def _sync_one_vcenter(app, cfg_id: int, full: bool = False, request_id=None, wait: bool = False):
+    """Sync a single vCenter in its own app context and DB session.
+
+    Holds ``pg_try_advisory_lock(LOCK_KEY, cfg_id)`` on a dedicated connection
+    for the whole run so the lock survives the session's commits, and skips
+    the vCenter if another thread or process is already syncing it. With
+    ``wait=True`` it waits for that sync to finish and then runs.
+
+    Returns ``'succeeded'``, ``'failed'`` or ``'skipped'``.
+    """
+    from sqlalchemy import text
+    from .. import db
+
+    with app.app_context():
+        try:
+            lock_conn = db.engine.connect()
+        except Exception as e:
+            current_app.logger.error(f"Failed to open lock connection for vCenter {cfg_id}: {e}")
+            return 'failed'
+        try:
             try:
-                current_app.logger.info(f"Starting sync for vCenter: {cfg.name}")
-                vms = fetch_vms_from_vcenter(cfg)
-                updated_count = upsert_vm_records(vms)
-                current_app.logger.info(f"Sync completed for {cfg.name}: {updated_count} VMs updated")
+                if wait:
+                    lock_conn.execute(text("SELECT pg_advisory_lock(:k, :id)"), {"k": LOCK_KEY, "id": cfg_id})
+                    acquired = True
+                else:
+                    acquired = lock_conn.execute(
+                        text("SELECT pg_try_advisory_lock(:k, :id)"), {"k": LOCK_KEY, "id": cfg_id}
+                    ).scalar()
+                lock_conn.commit()
             except Exception as e:
-                # Reset session so future iterations/requests are not poisoned
+                current_app.logger.error(f"Failed to try advisory lock for vCenter {cfg_id}: {e}")
+                return 'failed'
+
+            if not acquired:
+                current_app.logger.info(f"vCenter sync skipped for {cfg_id}: another sync is in progress")
+                return 'skipped'
+
+            try:
+                cfg = db.session.get(VCenterConfig, cfg_id)
+                if cfg is None or not cfg.enabled:
+                    return 'skipped'
+                current_app.logger.info(f"Starting sync for vCenter: {cfg.name}")
+                run_id = _start_sync_run(cfg, request_id)
+                result, counters, error = {}, {}, None
                 try:
-                    db.session.rollback()
+                    if current_app.config.get('VCENTER_SYNC_INCREMENTAL', True):
+                        records = iter_vm_changes(cfg, full=full, result=result)
+                    else:
+                        records = iter_vms_from_vcenter(cfg, stats=result)
+                        result['was_full'] = True
+                    _set_run_progress(run_id, 'retrieve')
+                    # Fetch and upsert are pipelined: each page is written before the next is read
+                    seen_ids = set()
+                    updated_count = upsert_vm_records(
+                        timed(records, result, 'fetch_s'), counters=counters, vcenter_id=cfg_id, seen_ids=seen_ids,
+                        on_batch=lambda c: _set_run_progress(run_id, 'upsert', c['processed']),
+                        sync_run_id=run_id,
+                    )
+                    # VMs that failed to transform still exist; without an id for each we cannot tell which
+                    errored_ids = result.get('errored_ids', set())
+                    if result.get('was_full') and result.get('errored', 0) > len(errored_ids):
+                        current_app.logger.warning(
+                            f"Skipping removal reconcile for {cfg.name}: {result['errored']} VMs failed to process"
+                        )
+                    elif result.get('was_full'):
+                        _set_run_progress(run_id, 'reconcile', counters['processed'])
+                        started = time.perf_counter()
+                        counters['removed'] += reconcile_removed_vms(cfg_id, seen_ids | errored_ids)
+                        counters['upsert_s'] += time.perf_counter() - started
+                    current_app.logger.info(
+                        f"Sync completed for {cfg.name}: {updated_count} VMs updated (peak RSS {peak_rss_mb()} MB)"
+                    )
+                except Exception as e:
+                    # Reset session so the pooled connection is not poisoned
+                    try:
+                        db.session.rollback()
+                    except Exception:
+                        pass
+                    error = str(e) or e.__class__.__name__
+                    current_app.logger.error(f"Sync failed for vCenter {cfg_id}: {e}")
+                finally:
+                    _finish_sync_run(run_id, result, counters, error)
+                if counters.get('processed') or counters.get('removed'):
+                    record_stats_snapshot('sync')
+                return 'failed' if error else 'succeeded'
+            finally:
+                try:
+                    lock_conn.execute(text("SELECT pg_advisory_unlock(:k, :id)"), {"k": LOCK_KEY, "id": cfg_id})
+                    lock_conn.commit()
                 except Exception:
                     pass
-                current_app.logger.error(f"Sync failed for {cfg.name}: {e}")
-                continue
-    finally:
-        try:
-            db.session.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
-            db.session.commit()
-        except Exception:
-            # In case of transaction state errors, make best effort to rollback
-            try:
-                db.session.rollback()
-            except Exception:
-                pass
+        finally:
+            lock_conn.close()
+            db.session.remove()  # return connections to the pool
 
 
-def schedule_vcenter_sync(scheduler, app):
-    interval_minutes = app.config.get('VCENTER_SYNC_INTERVAL', 30)
+def sync_vcenter_job(full: bool = False, request_id=None, wait: bool = False):
+    """Sync every enabled vCenter concurrently.
+
+    Each vCenter runs on its own worker thread (at most
+    ``VCENTER_SYNC_CONCURRENCY`` at a time) with its own advisory lock and
+    DB session, so total wall time approaches the slowest vCenter rather
+    than the sum. With ``VCENTER_SYNC_INCREMENTAL`` enabled only VMs changed
+    since the previous run are fetched; ``full=True`` forces a complete
+    resync. ``request_id`` and ``wait`` are passed to each vCenter's sync.
+    Returns ``{cfg_id: status}``.
+    """
+    from flask import current_app
+
+    configs = VCenterConfig.query.filter_by(enabled=True).order_by(VCenterConfig.id.asc()).all()
+
+    if not configs:
+        current_app.logger.info("No enabled vCenter configurations found")
+        return {}
+
+    cfg_ids = [cfg.id for cfg in configs]
+    app = current_app._get_current_object()
+    max_workers = max(1, min(int(current_app.config.get('VCENTER_SYNC_CONCURRENCY', 4)), len(cfg_ids)))
 
-    def job_wrapper():
-        # Ensure app context and session cleanup for background threads
-        from .. import db
-        with app.app_context():
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vcenter-sync') as pool:
+        futures = {
+            pool.submit(_sync_one_vcenter, app, cfg_id, full, request_id, wait): cfg_id for cfg_id in cfg_ids
+        }
+        for future in as_completed(futures):
             try:
-                sync_vcenter_job()
-            finally:
-                db.session.remove()  # return connections to the pool
+                statuses[futures[future]] = future.result()
+            except Exception as e:
+                statuses[futures[future]] = 'failed'
+                current_app.logger.error(f"Sync worker for vCenter {futures[future]} crashed: {e}")
+    return statuses
+
+
+def _job_id(cfg_id: int) -> str:
+    return f"vcenter_sync_{cfg_id}"
+
+
+# (base interval, adaptive) each scheduled job was last configured with
+_job_settings = {}
+
+# How often scheduled jobs are reconciled with vcenter_configs (picks up
+# changes made by other processes)
+JOB_REFRESH_SECONDS = 60
+
+
+def _base_interval(app, cfg: VCenterConfig) -> int:
+    return max(1, int(cfg.sync_interval_minutes or app.config.get('VCENTER_SYNC_INTERVAL', 30)))
+
+
+def _interval_trigger(app, minutes: int) -> IntervalTrigger:
+    jitter = int(app.config.get('VCENTER_SYNC_JITTER_SECONDS', 30))
+    return IntervalTrigger(minutes=minutes, jitter=jitter or None)
+
+
+def _next_interval(app, cfg: VCenterConfig, current: int) -> int:
+    """Pick the next adaptive interval from the vCenter's recent sync runs.
+
+    Doubles the interval after ``VCENTER_ADAPTIVE_WINDOW`` runs without any
+    change, halves it when the latest run saw at least
+    ``VCENTER_ADAPTIVE_BUSY_CHANGES`` created/changed/removed VMs and goes
+    back to the configured interval otherwise. The result stays within
+    ``VCENTER_SYNC_MIN_INTERVAL``..``VCENTER_SYNC_MAX_INTERVAL`` minutes,
+    widened to include the configured interval so adapting never makes a
+    busy vCenter sync less often, or an idle one more often, than configured.
+    """
+    window = max(1, int(app.config.get('VCENTER_ADAPTIVE_WINDOW', 3)))
+    runs = (
+        SyncRun.query.filter_by(vcenter_id=cfg.id, status='succeeded')
+        .order_by(SyncRun.started_at.desc())
+        .limit(window)
+        .all()
+    )
+    if len(runs) < window:
+        return current
+    base = _base_interval(app, cfg)
+    changes = [(r.created_count or 0) + (r.changed_count or 0) + (r.removed_count or 0) for r in runs]
+    if not any(changes):
+        proposed = current * 2
+    elif changes[0] >= int(app.config.get('VCENTER_ADAPTIVE_BUSY_CHANGES', 25)):
+        proposed = current // 2
+    else:
+        proposed = base
+    low = min(int(app.config.get('VCENTER_SYNC_MIN_INTERVAL', 5)), base)
+    high = max(int(app.config.get('VCENTER_SYNC_MAX_INTERVAL', 240)), base)
+    return max(low, min(high, proposed))
+
+
+def _run_scheduled_sync(scheduler, app, cfg_id: int) -> None:
+    """Scheduled job body: sync one vCenter, then adapt its interval if enabled."""
+    from .. import db
+
+    _sync_one_vcenter(app, cfg_id)
+    with app.app_context():
+        try:
+            cfg = db.session.get(VCenterConfig, cfg_id)
+            job = scheduler.get_job(_job_id(cfg_id))
+            if cfg is None or job is None or not cfg.adaptive_sync:
+                return
+            current = int(job.trigger.interval.total_seconds() // 60)
+            minutes = _next_interval(app, cfg, current)
+            if minutes != current:
+                scheduler.reschedule_job(job.id, trigger=_interval_trigger(app, minutes))
+                current_app.logger.info(f"Adaptive sync interval for {cfg.name}: {current} -> {minutes} min")
+        except Exception as e:
+            current_app.logger.warning(f"Could not adapt sync interval for vCenter {cfg_id}: {e}")
+        finally:
+            db.session.remove()
 
+
+def unschedule_vcenter_job(scheduler, cfg_id: int) -> None:
+    """Remove the scheduled sync job of one vCenter, if any."""
+    _job_settings.pop(cfg_id, None)
+    if scheduler.get_job(_job_id(cfg_id)):
+        scheduler.remove_job(_job_id(cfg_id))
+
+
+def schedule_vcenter_job(scheduler, app, cfg: VCenterConfig) -> None:
+    """Add, reschedule or remove the sync job of one vCenter to match its config.
+
+    New jobs start after a random delay of up to
+    ``VCENTER_SYNC_STARTUP_JITTER_SECONDS`` (capped at one interval) so
+    vCenters do not all sync at the same moment. Existing jobs are only
+    rescheduled when the interval or adaptive setting changed.
+    """
+    if not cfg.enabled:
+        unschedule_vcenter_job(scheduler, cfg.id)
+        return
+    minutes = _base_interval(app, cfg)
+    settings = (minutes, bool(cfg.adaptive_sync))
+    job = scheduler.get_job(_job_id(cfg.id))
+    if job is not None:
+        if _job_settings.get(cfg.id) != settings:
+            scheduler.reschedule_job(job.id, trigger=_interval_trigger(app, minutes))
+            _job_settings[cfg.id] = settings
+        return
+
+    window = min(int(app.config.get('VCENTER_SYNC_STARTUP_JITTER_SECONDS', 300)), minutes * 60)
     scheduler.add_job(
-        func=job_wrapper,
-        trigger=IntervalTrigger(minutes=interval_minutes),
-        id='vcenter_sync',
+        func=_run_scheduled_sync,
+        args=[scheduler, app, cfg.id],
+        trigger=_interval_trigger(app, minutes),
+        next_run_time=datetime.now(timezone.utc) + timedelta(seconds=random.uniform(0, window)),
+        id=_job_id(cfg.id),
+        name=f"vCenter sync: {cfg.name}",
         replace_existing=True,
         max_instances=1,
         coalesce=True,
     )
+    _job_settings[cfg.id] = settings
+
+
+def refresh_vcenter_jobs(scheduler, app) -> None:
+    """Align per-vCenter jobs with vcenter_configs: add, reschedule or drop."""
+    from .. import db
 
+    with app.app_context():
+        try:
+            configs = VCenterConfig.query.all()
+            wanted = {cfg.id for cfg in configs if cfg.enabled}
+            for cfg in configs:
+                schedule_vcenter_job(scheduler, app, cfg)
+            for job in scheduler.get_jobs():
+                if job.id.startswith('vcenter_sync_'):
+                    cfg_id = int(job.id.rsplit('_', 1)[1])
+                    if cfg_id not in wanted:
+                        unschedule_vcenter_job(scheduler, cfg_id)
+                        # Disabled or deleted: free the collector and session held for it
+                        reset_incremental_state(cfg_id)
+                        release_sessions(cfg_id)
+        except Exception as e:
+            current_app.logger.warning(f"Could not refresh vCenter sync jobs: {e}")
+        finally:
+            db.session.remove()
+
+
+def schedule_vcenter_sync(scheduler, app):
+    """Schedule one sync job per enabled vCenter and keep them in step with config changes."""
+    if scheduler.get_job('vcenter_sync'):
+        scheduler.remove_job('vcenter_sync')
+    refresh_vcenter_jobs(scheduler, app)
+    scheduler.add_job(
+        func=refresh_vcenter_jobs,
+        args=[scheduler, app],
+        trigger=IntervalTrigger(seconds=JOB_REFRESH_SECONDS),
+        id='vcenter_jobs_refresh',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
@@ -0,0 +1,60 @@
+import signal
+import threading
+from datetime import datetime, timezone
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from .tasks import schedule_vcenter_sync
+from .queue import process_next_sync_request
+
+
+def _fail_interrupted_requests(app) -> None:
+    """Mark requests left running by a previous worker as failed."""
+    from .. import db
+    from ..models.sync_request import SyncRequest
+
+    with app.app_context():
+        try:
+            count = SyncRequest.query.filter_by(status='running').update(
+                {SyncRequest.status: 'failed', SyncRequest.error: 'interrupted by worker restart',
+                 SyncRequest.finished_at: datetime.now(timezone.utc)},
+                synchronize_session=False,
+            )
+            db.session.commit()
+            if count:
+                app.logger.warning(f"Marked {count} interrupted sync requests as failed")
+        finally:
+            db.session.remove()
+
+
+def run_sync_worker(app, poll_seconds: float = 2.0) -> None:
+    """Own all vCenter sync execution in this process until SIGINT/SIGTERM.
+
+    Runs the per-vCenter scheduled jobs and drains the ``sync_requests``
+    queue filled by the web app, one request at a time. Run a single worker
+    per deployment.
+    """
+    stop = threading.Event()
+
+    def _stop(signum, frame):
+        app.logger.info("Sync worker stopping")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    _fail_interrupted_requests(app)
+    scheduler = BackgroundScheduler()
+    schedule_vcenter_sync(scheduler, app)
+    scheduler.start()
+    app.logger.info("Sync worker started")
+    try:
+        while not stop.is_set():
+            try:
+                if process_next_sync_request(app):
+                    continue
+            except Exception as e:
+                app.logger.error(f"Sync worker failed to process queue: {e}")
+            stop.wait(poll_seconds)
+    finally:
+        scheduler.shutdown(wait=True)
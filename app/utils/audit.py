@@ -2,6 +2,7 @@ from flask import request
 from flask_login import current_user
 from .. import db
 from ..models.audit import AuditLog
+from .data_versions import bump_data_version
 
 
 def _get_source_ip() -> str:
@@ -34,6 +35,7 @@ def log_audit_event(action: str, entity: str = None, entity_id: str = None, deta
             details=details,
         )
         db.session.add(audit)
+        bump_data_version('audit')
         # Do not commit here; let the surrounding request/handler own the transaction
     except Exception:
         # Never break the request flow due to audit logging
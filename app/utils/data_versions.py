@@ -0,0 +1,87 @@
+import hashlib
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import event, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .. import db
+from ..models.data_version import DataVersion
+
+ENTITIES = ('vms', 'owners', 'tags', 'audit', 'stats')
+
+_PENDING_KEY = 'data_versions_bumped'
+
+
+def bump_data_version(*entities: str) -> None:
+    """Mark ``entities`` as changed by the current transaction.
+
+    The counters are incremented when the session commits, in the same
+    transaction, so a rolled back change never bumps a version.
+    """
+    for entity in entities:
+        if entity not in ENTITIES:
+            raise ValueError(f"Unknown data version entity: {entity}")
+    db.session.info.setdefault(_PENDING_KEY, set()).update(entities)
+
+
+def _apply_bumps(session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    table = DataVersion.__table__
+    # Sorted so concurrent transactions lock the counter rows in the same order
+    stmt = pg_insert(table).values([
+        {'entity': entity, 'version': 1, 'updated_at': func.now()} for entity in sorted(pending)
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.entity],
+        set_={'version': table.c.version + 1, 'updated_at': func.now()},
+    )
+    session.execute(stmt)
+
+
+def _discard_bumps(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def data_etag(*entities: str) -> str:
+    """ETag for data that depends only on ``entities``.
+
+    Hashes the update times along with the counters, so versions restarting
+    from zero (a recreated database) do not produce a previously used tag.
+    """
+    rows = db.session.query(DataVersion.entity, DataVersion.version, DataVersion.updated_at)\
+        .filter(DataVersion.entity.in_(entities)).order_by(DataVersion.entity).all()
+    key = ';'.join(f"{entity}:{version}:{updated_at.timestamp()}" for entity, version, updated_at in rows)
+    return hashlib.sha1(f"{','.join(sorted(entities))}|{key}".encode()).hexdigest()[:20]
+
+
+def conditional_on(*entities: str):
+    """Answer GETs with ``304 Not Modified`` while ``entities`` are unchanged.
+
+    The ETag is computed from the ``data_versions`` counters before the view
+    runs, so a matching ``If-None-Match`` never reaches the entity tables.
+    Apply below ``login_required``/``require_roles``.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            etag = data_etag(*entities)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapped
+    return decorator
+
+
+def init_data_versions() -> None:
+    """Apply bumped data versions on every commit of ``db.session``."""
+    if not event.contains(db.session, 'before_commit', _apply_bumps):
+        event.listen(db.session, 'before_commit', _apply_bumps)
+        event.listen(db.session, 'after_rollback', _discard_bumps)
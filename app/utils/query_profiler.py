@@ -0,0 +1,178 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Recent request profiles for the superadmin debug view (per process)
+_history: deque = deque(maxlen=200)
+_history_lock = threading.Lock()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAM_LISTS = re.compile(r"\((?:\s*(?:%\(\w+\)s|\?|:\w+)\s*,?)+\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Statement text with literals, bind parameters and IN lists collapsed.
+
+    Two executions of the same query with different values share a
+    fingerprint, which is what makes per-row (N+1) queries stand out.
+    """
+    text = _LITERALS.sub("?", statement)
+    text = _PARAM_LISTS.sub("(...)", text)
+    text = re.sub(r"%\(\w+\)s|:\w+", "?", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class QueryProfile:
+    """Statements executed while a profile is active, with DB time per fingerprint."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints: Counter = Counter()
+        self.fingerprint_seconds: Dict[str, float] = {}
+
+    def record(self, statement: str, seconds: float) -> None:
+        key = fingerprint(statement)
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[key] += 1
+        self.fingerprint_seconds[key] = self.fingerprint_seconds.get(key, 0.0) + seconds
+
+    def repeated(self, threshold: int = 2) -> List[Dict]:
+        """Fingerprints executed at least ``threshold`` times, most frequent first."""
+        return [
+            {"statement": key, "count": count, "ms": round(self.fingerprint_seconds[key] * 1000, 2)}
+            for key, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+    def summary(self) -> str:
+        lines = [f"{self.count} statements, {self.seconds * 1000:.1f} ms"]
+        lines.extend(f"  {r['count']}x {r['statement'][:200]}" for r in self.repeated())
+        return "\n".join(lines)
+
+
+# Profiles that receive statements from the engine listeners. Request
+# profiles live on flask.g; query_budget() profiles are thread-local.
+_local = threading.local()
+
+
+def _active_profiles() -> List[QueryProfile]:
+    profiles = list(getattr(_local, "profiles", ()))
+    if has_request_context():
+        profile = g.get("_sql_profile")
+        if profile is not None:
+            profiles.append(profile)
+    return profiles
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiles = _active_profiles()
+    if profiles:
+        elapsed = time.perf_counter() - getattr(context, "_query_started", time.perf_counter())
+        for profile in profiles:
+            profile.record(statement, elapsed)
+
+
+def _listen(engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def query_budget(max_queries: int, engine=None) -> Iterator[QueryProfile]:
+    """Fail with AssertionError if the block runs more than ``max_queries`` statements.
+
+    For tests: ``with query_budget(6): client.get('/owners/api')``. Counts
+    statements on ``engine`` (default: the app's) from this thread, and the
+    error lists repeated statements, so an N+1 regression shows its query.
+    """
+    from .. import db
+
+    _listen(engine or db.engine)
+    profile = QueryProfile()
+    stack = _local.__dict__.setdefault("profiles", [])
+    stack.append(profile)
+    try:
+        yield profile
+    finally:
+        stack.remove(profile)
+    if profile.count > max_queries:
+        raise AssertionError(f"Query budget of {max_queries} exceeded: {profile.summary()}")
+
+
+def recent_profiles() -> List[Dict]:
+    """Recent request profiles of this process, newest first."""
+    with _history_lock:
+        return list(reversed(_history))
+
+
+def init_query_profiler(app) -> None:
+    """Profile SQL per request when ``SQL_PROFILER`` is enabled.
+
+    Adds ``X-SQL-Queries``, ``X-SQL-Time-Ms`` and ``X-SQL-Max-Repeat``
+    response headers (and a ``Server-Timing`` entry), keeps the last
+    ``SQL_PROFILER_HISTORY`` profiles for the superadmin view and logs a
+    warning for requests repeating one statement at least
+    ``SQL_PROFILER_REPEAT_THRESHOLD`` times.
+    """
+    global _history
+    if not app.config.get("SQL_PROFILER"):
+        return
+    from .. import db
+
+    with app.app_context():
+        _listen(db.engine)
+    with _history_lock:
+        _history = deque(_history, maxlen=int(app.config.get("SQL_PROFILER_HISTORY", 200)))
+    threshold = int(app.config.get("SQL_PROFILER_REPEAT_THRESHOLD", 5))
+
+    @app.before_request
+    def start_sql_profile():
+        g._sql_profile = QueryProfile()
+        g._sql_profile_started = time.perf_counter()
+
+    @app.after_request
+    def finish_sql_profile(response):
+        profile = g.pop("_sql_profile", None)
+        if profile is None:
+            return response
+        repeated = profile.repeated(threshold)
+        max_repeat = max(profile.fingerprints.values(), default=0)
+        db_ms = profile.seconds * 1000
+        response.headers["X-SQL-Queries"] = str(profile.count)
+        response.headers["X-SQL-Time-Ms"] = f"{db_ms:.1f}"
+        response.headers["X-SQL-Max-Repeat"] = str(max_repeat)
+        response.headers.add("Server-Timing", f'db;dur={db_ms:.1f};desc="{profile.count} queries"')
+        if repeated:
+            app.logger.warning(
+                f"Possible N+1 in {request.method} {request.path}: "
+                + "; ".join(f"{r['count']}x {r['statement'][:120]}" for r in repeated[:3])
+            )
+        with _history_lock:
+            _history.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "queries": profile.count,
+                "db_ms": round(db_ms, 2),
+                "total_ms": round((time.perf_counter() - g.pop("_sql_profile_started")) * 1000, 2),
+                "max_repeat": max_repeat,
+                "repeated": repeated[:10],
+            })
+        return response
@@ -0,0 +1,222 @@
+import ssl
+import time
+import atexit
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from pyVim.connect import SmartConnect, Disconnect
+from flask import current_app
+
+from ..models.vcenter import VCenterConfig
+
+
+class VCenterSession:
+    """A logged-in vCenter session cached for reuse across syncs and probes.
+
+    ``generation`` increases on every login for the same configuration, so
+    holders of session-scoped server objects (PropertyCollectors, views) can
+    tell that those objects died with the previous session.
+    """
+
+    def __init__(self, key: Tuple, si, generation: int, ssl_verified: bool):
+        self.key = key
+        self.si = si
+        self.content = si.RetrieveContent()
+        self.generation = generation
+        self.ssl_verified = ssl_verified
+        self.checked_at = time.monotonic()
+        # Response bytes read from vCenter over this session (as sent on the wire)
+        self.bytes_received = 0
+        _count_response_bytes(si, self)
+
+
+class _CountingResponse:
+    """Proxy for an HTTP response that adds bytes read to a session counter."""
+
+    def __init__(self, response, session: VCenterSession):
+        self._response = response
+        self._session = session
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._session.bytes_received += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+def _count_response_bytes(si, session: VCenterSession) -> None:
+    """Wrap the SOAP stub's pooled connections so responses are counted."""
+    stub = getattr(si, "_stub", None)
+    get_connection = getattr(stub, "GetConnection", None)
+    if get_connection is None:
+        return
+
+    def counting_get_connection():
+        conn = get_connection()
+        if not getattr(conn, "_counts_bytes", False):
+            getresponse = conn.getresponse
+            conn.getresponse = lambda *a, **kw: _CountingResponse(getresponse(*a, **kw), session)
+            conn._counts_bytes = True
+        return conn
+
+    stub.GetConnection = counting_get_connection
+
+
+# Per-process session cache keyed by VCenterConfig id
+_sessions: Dict[int, VCenterSession] = {}
+_generations: Dict[int, int] = {}
+# SSL mode that last worked per host: True for verified, False for unverified
+_ssl_modes: Dict[str, bool] = {}
+# Connect functions registered per host, used instead of SmartConnect
+# (e.g. to point a configuration at a SimulatedVCenter)
+_connectors: Dict[str, Callable] = {}
+# One lock per vCenter so concurrent callers share a single login
+_config_locks: Dict[int, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def _config_lock(cfg_id: int) -> threading.Lock:
+    with _lock:
+        return _config_locks.setdefault(cfg_id, threading.Lock())
+
+
+def _config_key(cfg: VCenterConfig) -> Tuple:
+    return (cfg.host, cfg.username, cfg.password, bool(cfg.disable_ssl))
+
+
+def register_connector(host: str, connect: Callable) -> None:
+    """Route logins for ``host`` to ``connect(cfg)`` instead of SmartConnect."""
+    _connectors[host] = connect
+
+
+def unregister_connector(host: str) -> None:
+    _connectors.pop(host, None)
+
+
+def _smart_connect(cfg: VCenterConfig, verified: bool):
+    return SmartConnect(
+        host=cfg.host,
+        user=cfg.username,
+        pwd=cfg.password,
+        sslContext=None if verified else ssl._create_unverified_context(),
+        port=443,  # Default vCenter port
+        httpConnectionTimeout=int(current_app.config.get("VCENTER_HTTP_TIMEOUT", 30)),
+    )
+
+
+def _login(cfg: VCenterConfig) -> Tuple[object, bool]:
+    """Log in to vCenter and return ``(service_instance, ssl_verified)``.
+
+    Tries verified SSL first (unless disabled), then falls back to an
+    unverified context. The mode that worked is remembered per host, so
+    later logins go straight to it. Timeouts apply to this connection only.
+    """
+    connect = _connectors.get(cfg.host)
+    if connect is not None:
+        return connect(cfg), False
+
+    if cfg.disable_ssl:
+        modes = [False]
+    elif _ssl_modes.get(cfg.host) is False:
+        modes = [False, True]
+    else:
+        modes = [True, False]
+
+    for i, verified in enumerate(modes):
+        try:
+            si = _smart_connect(cfg, verified)
+        except Exception as e:
+            if i == len(modes) - 1:
+                current_app.logger.error(f"vCenter connect failed for {cfg.name}: {e}")
+                raise
+            continue
+        if not cfg.disable_ssl:
+            _ssl_modes[cfg.host] = verified
+        return si, verified
+
+
+def _is_alive(session: VCenterSession) -> bool:
+    try:
+        return session.content.sessionManager.currentSession is not None
+    except Exception:
+        return False
+
+
+def _logout(session: Optional[VCenterSession]) -> None:
+    if session is None:
+        return
+    try:
+        Disconnect(session.si)
+    except Exception:
+        pass
+
+
+def get_session(cfg: VCenterConfig, check: bool = False, stats: Optional[Dict] = None) -> VCenterSession:
+    """Return a live session for ``cfg``, logging in only when needed.
+
+    A cached session idle for longer than ``VCENTER_SESSION_CHECK_SECONDS``
+    (or any cached session when ``check`` is set) is verified with one
+    ``currentSession`` call and replaced transparently if it expired. A
+    changed host, username, password or SSL setting also forces a new login.
+    ``stats['round_trips']`` counts the calls made and ``stats['connect_s']``
+    the time spent.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("round_trips", 0)
+    started = time.perf_counter()
+    key = _config_key(cfg)
+    max_idle = int(current_app.config.get("VCENTER_SESSION_CHECK_SECONDS", 60))
+
+    with _config_lock(cfg.id):
+        session = _sessions.get(cfg.id)
+        if session is not None and session.key != key:
+            _logout(session)
+            session = None
+        if session is not None and (check or time.monotonic() - session.checked_at > max_idle):
+            stats["round_trips"] += 1
+            if _is_alive(session):
+                session.checked_at = time.monotonic()
+            else:
+                current_app.logger.info(f"vCenter session for {cfg.name} expired; logging in again")
+                session = None
+
+        if session is None:
+            si, verified = _login(cfg)
+            stats["round_trips"] += 2
+            generation = _generations.get(cfg.id, 0) + 1
+            _generations[cfg.id] = generation
+            session = VCenterSession(key, si, generation, verified)
+            _sessions[cfg.id] = session
+    stats["connect_s"] = stats.get("connect_s", 0.0) + time.perf_counter() - started
+    return session
+
+
+def invalidate_session(cfg_id: int, session: Optional[VCenterSession] = None) -> None:
+    """Forget the cached session for ``cfg_id`` so the next use logs in again.
+
+    When ``session`` is given, only that session is dropped; a newer one
+    cached by another thread is left alone.
+    """
+    with _config_lock(cfg_id):
+        current = _sessions.get(cfg_id)
+        if current is None or (session is not None and current is not session):
+            return
+        del _sessions[cfg_id]
+
+
+def release_sessions(cfg_id: Optional[int] = None) -> None:
+    """Log out and forget the cached session for one vCenter (or all)."""
+    with _lock:
+        if cfg_id is None:
+            sessions = list(_sessions.values())
+            _sessions.clear()
+        else:
+            sessions = [_sessions.pop(cfg_id, None)]
+    for session in sessions:
+        _logout(session)
+
+
+atexit.register(release_sessions)
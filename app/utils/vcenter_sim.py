@@ -0,0 +1,305 @@
+import time
+import random
+import itertools
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from pyVmomi import vim, vmodl
+
+PC = vmodl.query.PropertyCollector
+
+
+class _SimStub:
+    """pyVmomi stub adapter that routes every call to a :class:`SimulatedVCenter`."""
+
+    def __init__(self, sim: "SimulatedVCenter"):
+        self.sim = sim
+
+    def InvokeMethod(self, mo, info, args):
+        return self.sim._invoke(mo, info.name, list(args))
+
+    def InvokeAccessor(self, mo, info):
+        return self.sim._access(mo, info.name)
+
+
+class SimulatedVCenter:
+    """In-process stand-in for a vCenter, for benchmarks and offline testing.
+
+    Builds a synthetic estate of ``vms`` virtual machines, each with ``nics``
+    NICs and ``disks`` disks, spread over ``hosts`` ESXi hosts,
+    ``portgroups`` distributed portgroups and ``networks`` standard networks.
+    Real pyVmomi managed objects are bound to a stub that answers the calls
+    the sync makes (container views, ``RetrievePropertiesEx`` paging,
+    ``WaitForUpdatesEx`` with versions and truncation, session checks and
+    ``FindByUuid``), so the sync code runs unmodified.
+
+    Every call counts as one round-trip in ``round_trips`` and sleeps
+    ``latency`` seconds. ``modify_vms``, ``delete_vms`` and ``create_vm``
+    change the estate between syncs.
+    """
+
+    def __init__(self, vms: int = 1000, nics: int = 1, disks: int = 1, portgroups: int = 4,
+                 networks: int = 2, hosts: int = 4, latency: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.seed = seed
+        self.round_trips = 0
+        self.logged_in = False
+        self.rng = random.Random(seed)
+        self.stub = _SimStub(self)
+        self.props: Dict = {}
+        self.modified: Dict = {}
+        self.views: Dict = {}
+        self.results: Dict = {}
+        self.collectors: Dict = {}
+        self.seq = 0
+        self.vm_seq = itertools.count(1)
+        self.ids = itertools.count(1)
+        self.nic_count = nics
+        self.disk_count = disks
+
+        s = self.stub
+        self.si = vim.ServiceInstance('ServiceInstance', s)
+        self.root = vim.Folder('group-d1', s)
+        self.dc = vim.Datacenter('datacenter-1', s)
+        self.content = vim.ServiceInstanceContent(
+            rootFolder=self.root,
+            propertyCollector=vim.PropertyCollector('propertyCollector', s),
+            viewManager=vim.view.ViewManager('ViewManager', s),
+            sessionManager=vim.SessionManager('SessionManager', s),
+            searchIndex=vim.SearchIndex('SearchIndex', s),
+        )
+        self.hosts: List = []
+        for i in range(hosts):
+            h = vim.HostSystem(f'host-{i}', s)
+            self.props[h] = {'name': f'esx{i}.sim.local'}
+            self.hosts.append(h)
+        self.nets: List = []
+        for i in range(portgroups):
+            pg = vim.dvs.DistributedVirtualPortgroup(f'dvportgroup-{i}', s)
+            self.props[pg] = {'name': f'PG-{i}', 'key': f'dvportgroup-{i}'}
+            self.nets.append(pg)
+        for i in range(networks):
+            n = vim.Network(f'network-{i}', s)
+            self.props[n] = {'name': f'VM Network {i}'}
+            self.nets.append(n)
+        self.props[self.root] = {'childEntity': vim.ManagedEntity.Array([self.dc])}
+        self.props[self.dc] = {'network': vim.Network.Array(self.nets), 'name': 'DC1'}
+        for _ in range(vms):
+            self.create_vm()
+
+    def connect(self, cfg=None):
+        """Log in and return the service instance (connector for the session pool)."""
+        self.logged_in = True
+        return self.si
+
+    # -- estate changes ----------------------------------------------------
+
+    def _bump(self, obj) -> None:
+        self.seq += 1
+        self.modified[obj] = self.seq
+
+    def create_vm(self):
+        """Add one VM to the estate and return its managed object."""
+        n = next(self.vm_seq)
+        vm = vim.VirtualMachine(f'vm-{n}', self.stub)
+        devices = []
+        guest_nics = []
+        vm_nets = []
+        for j in range(self.nic_count):
+            mac = '00:50:56:%02x:%02x:%02x' % ((n >> 16) & 255, (n >> 8) & 255, (n + j) & 255)
+            net = self.nets[(n + j) % len(self.nets)] if self.nets else None
+            if net is not None and net not in vm_nets:
+                vm_nets.append(net)
+            if isinstance(net, vim.dvs.DistributedVirtualPortgroup):
+                backing = vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo(
+                    port=vim.dvs.PortConnection(portgroupKey=net._moId, switchUuid='sim'))
+            else:
+                backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
+                    deviceName=self.props[net]['name'] if net else None)
+            devices.append(vim.vm.device.VirtualVmxnet3(
+                key=4000 + j, macAddress=mac, backing=backing,
+                deviceInfo=vim.Description(label=f'Network adapter {j + 1}', summary=''),
+                connectable=vim.vm.device.VirtualDevice.ConnectInfo(
+                    connected=True, startConnected=True, allowGuestControl=True)))
+            guest_nics.append(vim.vm.GuestInfo.NicInfo(
+                macAddress=mac, ipAddress=[f'10.{(n >> 8) & 255}.{n & 255}.{j + 1}'],
+                connected=True, deviceConfigId=4000 + j))
+        for j in range(self.disk_count):
+            devices.append(vim.vm.device.VirtualDisk(
+                key=2000 + j, capacityInKB=(20 + j * 10) * 1024 * 1024,
+                deviceInfo=vim.Description(label=f'Hard disk {j + 1}', summary='')))
+        created = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=n)
+        self.props[vm] = {
+            'summary.config.instanceUuid': '5000%04x-0000-0000-0000-%012x' % (self.seed & 0xffff, n),
+            'summary.config.name': f'sim-vm-{n:06d}',
+            'summary.config.numCpu': 2,
+            'summary.config.memorySizeMB': 4096,
+            'summary.config.guestFullName': 'Ubuntu Linux (64-bit)' if n % 3 else 'Microsoft Windows Server 2022 (64-bit)',
+            'summary.runtime.powerState': 'poweredOn' if n % 5 else 'poweredOff',
+            'summary.runtime.bootTime': created,
+            'summary.runtime.host': self.hosts[n % len(self.hosts)] if self.hosts else None,
+            'config.createDate': created,
+            'config.hardware.device': vim.vm.device.VirtualDevice.Array(devices),
+            'guest.net': vim.vm.GuestInfo.NicInfo.Array(guest_nics),
+            'network': vim.Network.Array(vm_nets),
+            'name': f'sim-vm-{n:06d}',
+        }
+        self._bump(vm)
+        return vm
+
+    def vms(self) -> List:
+        return [o for o in self.props if isinstance(o, vim.VirtualMachine)]
+
+    def modify_vms(self, count: int) -> None:
+        """Toggle the power state of ``count`` random VMs."""
+        for vm in self.rng.sample(self.vms(), min(count, len(self.vms()))):
+            p = self.props[vm]
+            p['summary.runtime.powerState'] = 'poweredOff' if p['summary.runtime.powerState'] == 'poweredOn' else 'poweredOn'
+            self._bump(vm)
+
+    def delete_vms(self, count: int) -> None:
+        """Remove ``count`` random VMs from the estate."""
+        for vm in self.rng.sample(self.vms(), min(count, len(self.vms()))):
+            del self.props[vm]
+            self._bump(vm)
+
+    # -- SOAP surface ------------------------------------------------------
+
+    def _tick(self) -> None:
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _access(self, mo, name: str):
+        self._tick()
+        if mo == self.si and name == 'content':
+            return self.content
+        if isinstance(mo, vim.SessionManager) and name == 'currentSession':
+            return vim.UserSession(key='sim', userName='sim') if self.logged_in else None
+        return self.props.get(mo, {}).get(name)
+
+    def _objects_for(self, spec) -> List:
+        found = []
+        for object_spec in spec.objectSet:
+            if isinstance(object_spec.obj, vim.view.ContainerView) and object_spec.skip:
+                types = tuple(self.views.get(object_spec.obj, ()))
+                found.extend(o for o in self.props if isinstance(o, types))
+            elif object_spec.obj in self.props:
+                found.append(object_spec.obj)
+        result = []
+        for obj in found:
+            paths = []
+            for prop_spec in spec.propSet:
+                if isinstance(obj, prop_spec.type):
+                    paths.extend(p for p in (prop_spec.pathSet or []) if p not in paths)
+            if paths:
+                result.append((obj, paths))
+        return result
+
+    def _object_content(self, obj, paths):
+        p = self.props[obj]
+        return PC.ObjectContent(
+            obj=obj, propSet=[vmodl.DynamicProperty(name=k, val=p[k]) for k in paths if p.get(k) is not None])
+
+    def _page(self, token: str):
+        pending, size = self.results.pop(token)
+        page, rest = pending[:size], pending[size:]
+        next_token = None
+        if rest:
+            next_token = f'token-{next(self.ids)}'
+            self.results[next_token] = (rest, size)
+        return PC.RetrieveResult(token=next_token, objects=[self._object_content(o, p) for o, p in page])
+
+    def _invoke(self, mo, name: str, args: List):
+        self._tick()
+        if name == 'RetrieveContent':
+            return self.content
+        if name == 'CreateContainerView':
+            view = vim.view.ContainerView(f'session[sim]view-{next(self.ids)}', self.stub)
+            self.views[view] = args[1]
+            return view
+        if name == 'Destroy':
+            self.views.pop(mo, None)
+            return None
+        if name == 'RetrievePropertiesEx':
+            pending = []
+            for spec in args[0]:
+                pending.extend(self._objects_for(spec))
+            if not pending:
+                return None
+            token = f'token-{next(self.ids)}'
+            self.results[token] = (pending, args[1].maxObjects if args[1] and args[1].maxObjects else 100)
+            return self._page(token)
+        if name == 'ContinueRetrievePropertiesEx':
+            return self._page(args[0])
+        if name == 'CancelRetrievePropertiesEx':
+            self.results.pop(args[0], None)
+            return None
+        if name == 'CreatePropertyCollector':
+            collector = vim.PropertyCollector(f'session[sim]pc-{next(self.ids)}', self.stub)
+            self.collectors[collector] = {'filters': [], 'version': None}
+            return collector
+        if name == 'DestroyPropertyCollector':
+            self.collectors.pop(mo, None)
+            return None
+        if name == 'CreateFilter':
+            flt = vim.PropertyCollector.Filter(f'session[sim]filter-{next(self.ids)}', self.stub)
+            self.collectors[mo]['filters'].append((flt, args[0], {}))
+            return flt
+        if name == 'WaitForUpdatesEx':
+            return self._wait_for_updates(mo, args[0], args[1])
+        if name == 'Logout':
+            self.logged_in = False
+            self.collectors.clear()
+            return None
+        if name == 'SessionIsActive':
+            return self.logged_in
+        if name == 'FindByUuid':
+            for obj, p in self.props.items():
+                if isinstance(obj, vim.VirtualMachine) and p.get('summary.config.instanceUuid') == args[1]:
+                    return obj
+            return None
+        raise NotImplementedError(f"SimulatedVCenter does not implement {name}")
+
+    def _wait_for_updates(self, collector, version: Optional[str], options):
+        state = self.collectors.get(collector)
+        if state is None:
+            raise vmodl.fault.ManagedObjectNotFound(obj=collector)
+        if version and version != state['version']:
+            raise vmodl.query.InvalidCollectorVersion()
+        remaining = options.maxObjectUpdates if options and options.maxObjectUpdates else None
+        truncated = False
+        filter_sets = []
+        for flt, spec, delivered in state['filters']:
+            current = dict(self._objects_for(spec))
+            updates = []
+            for obj, paths in current.items():
+                seq = self.modified.get(obj, 0)
+                if obj not in delivered:
+                    updates.append(('enter', obj, paths, seq))
+                elif seq > delivered[obj]:
+                    updates.append(('modify', obj, paths, seq))
+            for obj in list(delivered):
+                if obj not in current:
+                    updates.append(('leave', obj, None, None))
+            if remaining is not None and len(updates) > remaining:
+                updates = updates[:remaining]
+                truncated = True
+            object_updates = []
+            for kind, obj, paths, seq in updates:
+                if kind == 'leave':
+                    delivered.pop(obj, None)
+                    object_updates.append(PC.ObjectUpdate(kind=kind, obj=obj))
+                else:
+                    delivered[obj] = seq
+                    p = self.props[obj]
+                    object_updates.append(PC.ObjectUpdate(kind=kind, obj=obj, changeSet=[
+                        PC.Change(name=k, op='assign', val=p[k]) for k in paths if p.get(k) is not None]))
+            if remaining is not None:
+                remaining -= len(object_updates)
+            if object_updates:
+                filter_sets.append(PC.FilterUpdate(filter=flt, objectSet=object_updates))
+        if not filter_sets:
+            return None
+        state['version'] = str(next(self.ids))
+        return PC.UpdateSet(version=state['version'], filterSet=filter_sets, truncated=truncated)
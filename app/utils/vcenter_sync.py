@@ -1,72 +1,96 @@
-import ssl
-import socket
-from datetime import datetime
+import json
+import time
+import hashlib
+import ipaddress
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal, ROUND_HALF_UP
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Tuple
 
-from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 from flask import current_app
 
-from ..models.vm import VM, VMDisks, VMNic
+from ..models.vm import VM, VMDisks, VMNic, VMIPAddress
+from ..models.vm_change import VMChange
 from ..models.vcenter import VCenterConfig
+from .vcenter_session import get_session, invalidate_session
+from .data_versions import bump_data_version
+from .vm_search import refresh_search_documents
 
 
-def _connect_vcenter(cfg: VCenterConfig):
-    """Connect to vCenter and return a service instance.
+# Properties read for every VM in one PropertyCollector traversal
+VM_PROPERTIES = [
+    "summary.config.instanceUuid",
+    "summary.config.name",
+    "summary.config.numCpu",
+    "summary.config.memorySizeMB",
+    "summary.config.guestFullName",
+    "summary.runtime.powerState",
+    "summary.runtime.bootTime",
+    "summary.runtime.host",
+    "config.createDate",
+    "config.hardware.device",
+    "guest.net",
+]
 
-    Tries verified SSL first (unless disabled), then falls back to an
-    unverified context if needed. Sets a conservative socket timeout.
-    """
-    context = None
-    if cfg.disable_ssl:
-        context = ssl._create_unverified_context()
 
-    # Set socket timeout globally (pyVmomi uses sockets internally)
-    socket.setdefaulttimeout(30)  # 30 second timeout
+def _build_inventory_maps(content, page_size: int = 500, stats: Optional[Dict] = None,
+                          objects: Optional[List] = None) -> Dict:
+    """Build moref/key -> name maps for hosts, portgroups and standard networks.
 
-    try:
-        return SmartConnect(
-            host=cfg.host,
-            user=cfg.username,
-            pwd=cfg.password,
-            sslContext=context,
-            port=443,  # Default vCenter port
-        )
-    except Exception as e:
-        # If SSL fails, try with unverified context if not already attempted
-        if not cfg.disable_ssl:
-            try:
-                context = ssl._create_unverified_context()
-                return SmartConnect(
-                    host=cfg.host,
-                    user=cfg.username,
-                    pwd=cfg.password,
-                    sslContext=context,
-                    port=443,
-                )
-            except Exception as e2:
-                current_app.logger.error(f"vCenter connect failed (fallback): {e2}")
-                raise
+    All three come from one paged PropertyCollector retrieval, so resolving
+    NIC networks and VM hosts afterwards costs no further round-trips.
+    ``objects`` limits the maps to those hosts and networks.
+    Lookup hits and misses are counted in ``maps['hits']``/``maps['misses']``.
+    """
+    maps = {"hosts": {}, "portgroups": {}, "networks": {}, "hits": 0, "misses": 0}
+    prop_paths = {
+        vim.HostSystem: ["name"],
+        vim.dvs.DistributedVirtualPortgroup: ["key", "name"],
+        vim.Network: ["name"],
+    }
+    if objects is not None and not objects:
+        return maps
+    for obj, props in _retrieve_properties(content, content.rootFolder, prop_paths, page_size, stats, objects):
+        if isinstance(obj, vim.HostSystem):
+            maps["hosts"][obj] = props.get("name")
+        elif isinstance(obj, vim.dvs.DistributedVirtualPortgroup):
+            maps["portgroups"][props.get("key") or obj._moId] = props.get("name")
         else:
-            current_app.logger.error(f"vCenter connect failed: {e}")
-            raise
+            maps["networks"][obj] = props.get("name")
+    return maps
+
 
+def _lookup(maps: Dict, kind: str, key):
+    name = maps[kind].get(key)
+    if name is None:
+        maps["misses"] += 1
+    else:
+        maps["hits"] += 1
+    return name
 
-def _resolve_network_name(dev, content):
-    if hasattr(dev.backing, "deviceName"):
-        return dev.backing.deviceName
-    if hasattr(dev.backing, "port"):
-        portgroup_key = getattr(dev.backing.port, "portgroupKey", None)
+
+def _resolve_network_name(dev, maps: Dict):
+    backing = dev.backing
+    if getattr(backing, "deviceName", None):
+        return backing.deviceName
+    if getattr(backing, "network", None) is not None:
+        return _lookup(maps, "networks", backing.network)
+    if hasattr(backing, "port"):
+        portgroup_key = getattr(backing.port, "portgroupKey", None)
         if portgroup_key:
-            for dc in content.rootFolder.childEntity:
-                if hasattr(dc, "network"):
-                    for net in dc.network:
-                        if hasattr(net, "key") and net.key == portgroup_key:
-                            return net.name
+            return _lookup(maps, "portgroups", portgroup_key)
     return None
 
 
+def _log_map_usage(cfg: VCenterConfig, maps: Dict) -> None:
+    current_app.logger.info(
+        f"Inventory maps for {cfg.name}: {len(maps['hosts'])} hosts, {len(maps['portgroups'])} portgroups, "
+        f"{len(maps['networks'])} networks; {maps['hits']} lookup hits, {maps['misses']} misses"
+    )
+
+
 def _normalize_decimal(num: Optional[float], places: str = "0.01") -> Optional[Decimal]:
     """Normalize float/None to Decimal with fixed precision for reliable comparisons."""
     if num is None:
@@ -78,295 +102,1205 @@ def _normalize_decimal(num: Optional[float], places: str = "0.01") -> Optional[D
         return None
 
 
-def fetch_vms_from_vcenter(cfg: VCenterConfig) -> List[Dict]:
-    """Fetch VM inventory from vCenter with robust per-VM error handling.
+def _filter_spec(view, prop_paths: Dict, objects: Optional[List] = None):
+    """Build a PropertyCollector FilterSpec over a container view or explicit objects.
+
+    ``prop_paths`` maps each managed object type to the property paths to read.
+    """
+    prop_set = [
+        vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=path_set, all=False)
+        for obj_type, path_set in prop_paths.items()
+    ]
+    if objects is not None:
+        object_set = [vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False) for obj in objects]
+    else:
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(
+            name="traverseView", path="view", skip=False, type=vim.view.ContainerView
+        )
+        object_set = [vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])]
+    return vmodl.query.PropertyCollector.FilterSpec(objectSet=object_set, propSet=prop_set)
+
+
+def _retrieve_properties(content, container, prop_paths: Dict,
+                         page_size: int = 500, stats: Optional[Dict] = None,
+                         objects: Optional[List] = None) -> Iterator[Tuple[object, Dict]]:
+    """Yield ``(moref, {path: value})`` for every object of the types in
+    ``prop_paths`` below ``container``.
+
+    Uses a single PropertyCollector filter over a temporary container view (or
+    over ``objects`` when given) and pages through the result with
+    ``ContinueRetrievePropertiesEx``, so the number of round-trips grows with
+    the number of pages rather than with the number of objects times
+    properties. ``stats['round_trips']`` is incremented for every SOAP call.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("round_trips", 0)
+
+    pc = content.propertyCollector
+    view = None
+    if objects is None:
+        view = content.viewManager.CreateContainerView(container, list(prop_paths), True)
+        stats["round_trips"] += 1
+    token = None
+    try:
+        filter_spec = _filter_spec(view, prop_paths, objects)
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+
+        result = pc.RetrievePropertiesEx([filter_spec], options)
+        stats["round_trips"] += 1
+        while result:
+            token = result.token
+            for obj_content in result.objects:
+                yield obj_content.obj, {p.name: p.val for p in (obj_content.propSet or [])}
+            if not token:
+                break
+            result = pc.ContinueRetrievePropertiesEx(token)
+            stats["round_trips"] += 1
+        token = None
+    finally:
+        # Release the server-side result set if the caller stopped early
+        if token:
+            try:
+                pc.CancelRetrievePropertiesEx(token)
+                stats["round_trips"] += 1
+            except Exception:
+                pass
+        if view is not None:
+            try:
+                view.Destroy()
+                stats["round_trips"] += 1
+            except Exception:
+                pass
+
+
+def _build_vm_info(props: Dict, maps: Dict) -> Dict:
+    """Build a ``vm_info`` dict from one VM's retrieved property set."""
+    nics = []
+    disks = []
+    for dev in props.get("config.hardware.device") or []:
+        if isinstance(dev, vim.vm.device.VirtualEthernetCard):
+            nics.append({
+                "label": getattr(dev.deviceInfo, "label", None),
+                "mac": getattr(dev, "macAddress", None),
+                "network": _resolve_network_name(dev, maps),
+                "connected": getattr(getattr(dev, "connectable", None), "connected", False),
+                "nic_type": type(dev).__name__,
+            })
+        elif isinstance(dev, vim.vm.device.VirtualDisk):
+            disks.append({
+                "label": getattr(dev.deviceInfo, "label", None),
+                "size_gb": round(dev.capacityInKB / (1024 ** 2), 2),
+            })
+
+    # Build MAC -> IP addresses map from guest info
+    guest_net = list(props.get("guest.net") or [])
+    mac_to_ips = {}
+    for net in guest_net:
+        mac = getattr(net, "macAddress", None)
+        if mac:
+            mac_to_ips[mac] = list(getattr(net, "ipAddress", []) or [])
+
+    # Attach IPs to NIC entries by MAC (fallback: index order)
+    for idx, nic in enumerate(nics):
+        mac = nic.get("mac")
+        if mac and mac in mac_to_ips:
+            nic["ip_addresses"] = mac_to_ips[mac]
+        elif idx < len(guest_net):
+            nic["ip_addresses"] = list(getattr(guest_net[idx], "ipAddress", []) or [])
+
+    host = props.get("summary.runtime.host")
+    host_name = None
+    if host:
+        host_name = _lookup(maps, "hosts", host) or str(host)
 
-    - Ensures the container view is destroyed
+    return {
+        "vm_id": props.get("summary.config.instanceUuid"),
+        "name": props.get("summary.config.name"),
+        "cpu": props.get("summary.config.numCpu"),
+        "memoryMB": props.get("summary.config.memorySizeMB"),
+        "assigned_disks": disks,
+        "power_state": props.get("summary.runtime.powerState"),
+        "guestOS": props.get("summary.config.guestFullName"),
+        "nics": nics,
+        "created_date": props.get("config.createDate"),
+        "last_booted_date": props.get("summary.runtime.bootTime"),
+        "hypervisor": host_name,
+    }
+
+
+def _transform_vm(vm, props: Dict, maps: Dict, stats: Dict) -> Optional[Dict]:
+    """Build one ``vm_info`` dict, timing it into ``stats['transform_s']``.
+
+    Per-VM errors are logged and counted in ``stats['errored']``; the VM is
+    skipped and None returned. The ids of skipped VMs, where known, are
+    added to ``stats['errored_ids']`` so a full sync does not treat them as
+    gone.
+    """
+    started = time.perf_counter()
+    try:
+        vm_info = _build_vm_info(props, maps)
+        vm_info["moref"] = getattr(vm, "_moId", None)
+        return vm_info
+    except Exception as vm_err:
+        current_app.logger.error(f"Failed to process VM {getattr(vm, '_moId', vm)}: {vm_err}")
+        stats["errored"] = stats.get("errored", 0) + 1
+        vm_id = props.get("summary.config.instanceUuid")
+        if vm_id:
+            stats.setdefault("errored_ids", set()).add(vm_id)
+        return None
+    finally:
+        stats["transform_s"] = stats.get("transform_s", 0.0) + time.perf_counter() - started
+
+
+def timed(items: Iterable, stats: Dict, key: str) -> Iterator:
+    """Yield from ``items``, adding the time spent producing them to ``stats[key]``.
+
+    Wrapping a streaming fetch measures the time the consumer waits on it
+    while fetch and upsert are pipelined.
+    """
+    iterator = iter(items)
+    stats.setdefault(key, 0.0)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stats[key] += time.perf_counter() - started
+        yield item
+
+
+def iter_vms_from_vcenter(cfg: VCenterConfig, stats: Optional[Dict] = None) -> Iterator[Dict]:
+    """Stream the VM inventory from vCenter using bulk PropertyCollector retrieval.
+
+    - Reads every VM's properties in pages of ``VCENTER_RETRIEVE_PAGE_SIZE``
+      and yields ``vm_info`` dicts as each page arrives, so only one page is
+      held in memory
+    - Resolves hosts and networks from per-sync lookup maps
     - Associates IPs to NICs by MAC address when possible
     - Logs and continues on per-VM errors
+    - Reuses the cached vCenter session instead of logging in each run
     """
-    si = _connect_vcenter(cfg)
+    if stats is None:
+        stats = {}
+    session = get_session(cfg, stats=stats)
+    bytes_before = session.bytes_received
     try:
-        content = si.RetrieveContent()
-        vm_list: List[Dict] = []
+        content = session.content
+        page_size = int(current_app.config.get("VCENTER_RETRIEVE_PAGE_SIZE", 500))
 
-        for datacenter in content.rootFolder.childEntity:
-            if not hasattr(datacenter, "vmFolder"):
+        maps = _build_inventory_maps(content, page_size, stats)
+
+        count = 0
+        for vm, props in _retrieve_properties(
+            content, content.rootFolder, {vim.VirtualMachine: VM_PROPERTIES}, page_size, stats
+        ):
+            vm_info = _transform_vm(vm, props, maps, stats)
+            if vm_info is None:
                 continue
+            count += 1
+            yield vm_info
 
-            vm_folder = datacenter.vmFolder
-            vm_view = content.viewManager.CreateContainerView(
-                vm_folder, [vim.VirtualMachine], True
-            )
+        _log_map_usage(cfg, maps)
+        current_app.logger.info(
+            f"Retrieved {count} VMs from {cfg.name} in {stats['round_trips']} round-trips"
+        )
+    except vim.fault.NotAuthenticated:
+        invalidate_session(cfg.id, session)
+        raise
+    finally:
+        stats["bytes_received"] = stats.get("bytes_received", 0) + session.bytes_received - bytes_before
+
+
+def fetch_vms_from_vcenter(cfg: VCenterConfig) -> List[Dict]:
+    """Fetch the full VM inventory from vCenter as a list."""
+    return list(iter_vms_from_vcenter(cfg))
+
+
+def fetch_vms_by_uuid(cfg: VCenterConfig, vm_ids: List[str], morefs: Optional[Dict[str, str]] = None,
+                      stats: Optional[Dict] = None) -> Tuple[List[Dict], List[str]]:
+    """Fetch only the VMs with the given instanceUuids from one vCenter.
+
+    VMs with a stored moref in ``morefs`` are read directly; the others (and
+    any whose moref no longer points at them) are located with
+    ``SearchIndex.FindByUuid``. Hosts and networks are resolved from just
+    the objects those VMs reference, so the cost does not depend on the
+    size of the estate. Returns ``(vm_infos, missing_ids)``.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("round_trips", 0)
+    morefs = morefs or {}
+    session = get_session(cfg, stats=stats)
+    bytes_before = session.bytes_received
+    try:
+        content = session.content
+        prop_paths = {vim.VirtualMachine: VM_PROPERTIES + ["network"]}
+        found: Dict[str, Tuple] = {}
+
+        def retrieve(vms: List) -> None:
+            if not vms:
+                return
             try:
-                for vm in vm_view.view:
-                    try:
-                        summary = vm.summary
-
-                        # Build NIC list (hardware-defined)
-                        nics = []
-                        if vm.config and vm.config.hardware:
-                            for dev in vm.config.hardware.device:
-                                if isinstance(dev, vim.vm.device.VirtualEthernetCard):
-                                    network_name = _resolve_network_name(dev, content)
-                                    nics.append({
-                                        "label": getattr(dev.deviceInfo, "label", None),
-                                        "mac": getattr(dev, "macAddress", None),
-                                        "network": network_name,
-                                        "connected": getattr(getattr(dev, "connectable", None), "connected", False),
-                                        "nic_type": type(dev).__name__,
-                                    })
-
-                        # Build MAC -> IP addresses map from guest info
-                        mac_to_ips = {}
-                        if vm.guest and vm.guest.net:
-                            for net in vm.guest.net:
-                                mac = getattr(net, "macAddress", None)
-                                ips = list(getattr(net, "ipAddress", []) or [])
-                                if mac:
-                                    mac_to_ips[mac] = ips
-
-                        # Attach IPs to NIC entries by MAC (fallback: index order)
-                        for idx, nic in enumerate(nics):
-                            mac = nic.get("mac")
-                            if mac and mac in mac_to_ips:
-                                nic["ip_addresses"] = mac_to_ips[mac]
-                            else:
-                                # Fallback to index-based guest.net if available
-                                if vm.guest and vm.guest.net and idx < len(vm.guest.net):
-                                    nic["ip_addresses"] = list(getattr(vm.guest.net[idx], "ipAddress", []) or [])
-
-                        # Disks
-                        disks = []
-                        if vm.config and vm.config.hardware:
-                            for dev in vm.config.hardware.device:
-                                if isinstance(dev, vim.vm.device.VirtualDisk):
-                                    size_gb = round(dev.capacityInKB / (1024 ** 2), 2)
-                                    disks.append({
-                                        "label": getattr(dev.deviceInfo, "label", None),
-                                        "size_gb": size_gb,
-                                    })
-
-                        host_name = None
-                        if summary.runtime.host:
-                            try:
-                                host_name = summary.runtime.host.name
-                            except Exception:
-                                host_name = str(summary.runtime.host)
-
-                        vm_info = {
-                            "vm_id": getattr(summary.config, "instanceUuid", None),
-                            "name": getattr(summary.config, "name", None),
-                            "cpu": getattr(summary.config, "numCpu", None),
-                            "memoryMB": getattr(summary.config, "memorySizeMB", None),
-                            "assigned_disks": disks,
-                            "power_state": getattr(summary.runtime, "powerState", None),
-                            "guestOS": getattr(summary.config, "guestFullName", None),
-                            "nics": nics,
-                            "created_date": getattr(summary.config, "createDate", None),
-                            "last_booted_date": getattr(summary.runtime, "bootTime", None),
-                            "hypervisor": host_name,
-                        }
-
-                        vm_list.append(vm_info)
-                    except Exception as vm_err:
-                        current_app.logger.error(f"Failed to process VM in {getattr(datacenter, 'name', 'Unknown DC')}: {vm_err}")
-                        continue
-            finally:
-                vm_view.Destroy()
-
-        return vm_list
+                for vm, props in _retrieve_properties(content, None, prop_paths, len(vms), stats, objects=vms):
+                    vm_id = props.get("summary.config.instanceUuid")
+                    if vm_id in vm_ids and vm_id not in found:
+                        found[vm_id] = (vm, props)
+            except vmodl.fault.ManagedObjectNotFound:
+                # A stale moref fails the whole call; the rest are found by uuid below
+                pass
+
+        retrieve([vim.VirtualMachine(morefs[vm_id], session.si._stub) for vm_id in vm_ids if morefs.get(vm_id)])
+        located = []
+        for vm_id in vm_ids:
+            if vm_id in found:
+                continue
+            vm = content.searchIndex.FindByUuid(None, vm_id, True, True)
+            stats["round_trips"] += 1
+            if vm is not None:
+                located.append(vm)
+        retrieve(located)
+
+        referenced = set()
+        for vm, props in found.values():
+            if props.get("summary.runtime.host") is not None:
+                referenced.add(props["summary.runtime.host"])
+            referenced.update(props.get("network") or [])
+        maps = _build_inventory_maps(content, max(1, len(referenced)), stats, objects=list(referenced))
+
+        vm_infos = []
+        for vm, props in found.values():
+            vm_info = _transform_vm(vm, props, maps, stats)
+            if vm_info is not None:
+                vm_infos.append(vm_info)
+        missing = [vm_id for vm_id in vm_ids if vm_id not in found]
+        current_app.logger.info(
+            f"Refreshed {len(vm_infos)} of {len(vm_ids)} VMs from {cfg.name} in {stats['round_trips']} round-trips"
+        )
+        return vm_infos, missing
+    except vim.fault.NotAuthenticated:
+        invalidate_session(cfg.id, session)
+        raise
     finally:
+        stats["bytes_received"] = stats.get("bytes_received", 0) + session.bytes_received - bytes_before
+
+
+# Per-process incremental sync state keyed by VCenterConfig id. Each entry
+# owns a dedicated PropertyCollector with one filter over all VMs, created in
+# a pooled session, and the last change version returned by WaitForUpdatesEx.
+_incremental_state: Dict[int, Dict] = {}
+_incremental_lock = threading.Lock()
+
+
+def _drop_incremental_state(state: Optional[Dict]) -> None:
+    """Destroy the collector and view held by an incremental state."""
+    if not state:
+        return
+    for release in (
+        lambda: state["collector"].DestroyPropertyCollector(),
+        lambda: state["view"].Destroy(),
+    ):
         try:
-            Disconnect(si)
+            release()
         except Exception:
             pass
 
 
-def upsert_vm_records(vms: List[Dict]) -> int:
-    """Upsert VM records with proper validation and type normalization.
+def reset_incremental_state(cfg_id: Optional[int] = None) -> None:
+    """Forget incremental state for one vCenter (or all), forcing a full resync."""
+    with _incremental_lock:
+        if cfg_id is None:
+            states = list(_incremental_state.values())
+            _incremental_state.clear()
+        else:
+            states = [_incremental_state.pop(cfg_id, None)]
+    for state in states:
+        _drop_incremental_state(state)
+
+
+def _create_incremental_state(session, stats: Dict) -> Dict:
+    content = session.content
+    collector = content.propertyCollector.CreatePropertyCollector()
+    view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+    try:
+        collector.CreateFilter(_filter_spec(view, {vim.VirtualMachine: VM_PROPERTIES}), partialUpdates=False)
+    except Exception:
+        _drop_incremental_state({"collector": collector, "view": view})
+        raise
+    stats["round_trips"] += 3
+    return {
+        "generation": session.generation,
+        "content": content,
+        "collector": collector,
+        "view": view,
+        "version": "",
+        "uuid_by_moref": {},
+    }
+
+
+def _iter_update_pages(state: Dict, page_size: int, stats: Dict) -> Iterator[Tuple[Dict, set, set]]:
+    """Yield one ``(entered, modified, left)`` tuple per WaitForUpdatesEx page.
 
-    Key fixes:
-    - Initialize all fields (including disks/NICs) for new VMs
-    - Normalize disk sizes to Decimal for stable comparisons
-    - Avoid storing string "None" for power_state
-    - Log and skip invalid entries cleanly
+    ``entered`` maps morefs of VMs that entered the filter to their full
+    property sets; ``modified`` and ``left`` hold morefs of changed and
+    removed VMs. The stored version advances after every page, which is
+    the resume point the server expects for truncated results.
     """
+    options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0, maxObjectUpdates=page_size)
+    while True:
+        update_set = state["collector"].WaitForUpdatesEx(state["version"], options)
+        stats["round_trips"] += 1
+        if update_set is None:
+            return
+        entered: Dict = {}
+        modified = set()
+        left = set()
+        for filter_update in update_set.filterSet or []:
+            for obj_update in filter_update.objectSet or []:
+                obj = obj_update.obj
+                if obj_update.kind == "leave":
+                    entered.pop(obj, None)
+                    modified.discard(obj)
+                    left.add(obj)
+                elif obj_update.kind == "enter":
+                    left.discard(obj)
+                    entered[obj] = {c.name: c.val for c in (obj_update.changeSet or []) if c.op == "assign"}
+                elif obj not in entered:
+                    modified.add(obj)
+        state["version"] = update_set.version
+        yield entered, modified, left
+        if not update_set.truncated:
+            return
+
+
+def iter_vm_changes(cfg: VCenterConfig, full: bool = False, result: Optional[Dict] = None) -> Iterator[Dict]:
+    """Stream VMs created, modified or deleted since the previous call.
+
+    Keeps a PropertyCollector filter per vCenter and calls
+    ``WaitForUpdatesEx`` with the last change version. The first call, a lost
+    version, a new login (session expired or configuration changed) and
+    ``full=True`` all start from an empty version, which returns the full
+    inventory.
+
+    Yields ``vm_info`` dicts page by page, and ``{"vm_id": ..., "deleted":
+    True}`` tombstones for VMs removed from vCenter. ``result`` receives
+    ``round_trips``, ``was_full``, ``deleted`` and ``bytes_received``, plus
+    ``connect_s``/``transform_s`` timings and ``errored``. If the stream is
+    not consumed to the end the state is dropped, so the next call resyncs
+    in full.
+    """
+    if result is None:
+        result = {}
+    result.setdefault("round_trips", 0)
+    page_size = int(current_app.config.get("VCENTER_RETRIEVE_PAGE_SIZE", 500))
+
+    with _incremental_lock:
+        state = _incremental_state.pop(cfg.id, None)
+
+    completed = False
+    session = None
+    bytes_before = 0
+    try:
+        session = get_session(cfg, stats=result)
+        bytes_before = session.bytes_received
+        if state and (full or state["generation"] != session.generation):
+            # Collectors are session-scoped; after a new login the old one is gone
+            _drop_incremental_state(state)
+            state = None
+        was_full = state is None
+        if state is None:
+            state = _create_incremental_state(session, result)
+        try:
+            pages = _iter_update_pages(state, page_size, result)
+            first = next(pages, None)
+        except (vmodl.query.InvalidCollectorVersion, vmodl.fault.ManagedObjectNotFound,
+                vim.fault.NotAuthenticated) as e:
+            current_app.logger.warning(f"Incremental state lost for {cfg.name} ({e}); running full resync")
+            _drop_incremental_state(state)
+            state = None
+            if isinstance(e, vim.fault.NotAuthenticated):
+                invalidate_session(cfg.id, session)
+                result["bytes_received"] = result.get("bytes_received", 0) + session.bytes_received - bytes_before
+                session = get_session(cfg, stats=result)
+                bytes_before = session.bytes_received
+            state = _create_incremental_state(session, result)
+            was_full = True
+            pages = _iter_update_pages(state, page_size, result)
+            first = next(pages, None)
+        result["was_full"] = was_full
+
+        content = state["content"]
+        uuid_by_moref = state["uuid_by_moref"]
+        maps = None
+        changed_count = 0
+        deleted_count = 0
+        for entered, modified, left in (itertools.chain([first], pages) if first else ()):
+            if (entered or modified) and maps is None:
+                maps = _build_inventory_maps(content, page_size, result)
+            # Modified VMs only report the changed paths; re-read their full property set
+            changed = list(entered.items())
+            if modified:
+                changed.extend(_retrieve_properties(
+                    content, None, {vim.VirtualMachine: VM_PROPERTIES}, page_size, result, objects=list(modified)
+                ))
+            for vm, props in changed:
+                vm_info = _transform_vm(vm, props, maps, result)
+                if vm_info is None:
+                    continue
+                if vm_info.get("vm_id"):
+                    uuid_by_moref[vm] = vm_info["vm_id"]
+                changed_count += 1
+                yield vm_info
+            for vm in left:
+                vm_id = uuid_by_moref.pop(vm, None)
+                if vm_id:
+                    deleted_count += 1
+                    yield {"vm_id": vm_id, "deleted": True}
+
+        if maps is not None:
+            _log_map_usage(cfg, maps)
+        result["deleted"] = deleted_count
+        current_app.logger.info(
+            f"Retrieved {changed_count} changed and {deleted_count} deleted VMs from {cfg.name} "
+            f"({'full' if was_full else 'incremental'}) in {result['round_trips']} round-trips"
+        )
+        completed = True
+    finally:
+        if session is not None:
+            result["bytes_received"] = result.get("bytes_received", 0) + session.bytes_received - bytes_before
+        if completed:
+            with _incremental_lock:
+                _incremental_state[cfg.id] = state
+        else:
+            _drop_incremental_state(state)
+
+
+# Rows per multi-row INSERT ... ON CONFLICT statement
+UPSERT_CHUNK_SIZE = 1000
+
+# VM columns written by the sync; compared with IS DISTINCT FROM on conflict
+VM_SYNC_COLUMNS = [
+    "name", "cpu", "memory_mb", "guest_os", "power_state",
+    "created_date", "last_booted_date", "hypervisor", "vcenter_id", "moref",
+]
+
+# Synced columns whose changes are recorded in vm_changes (plus "ip_addresses")
+JOURNAL_FIELDS = [col for col in VM_SYNC_COLUMNS if col != "moref"]
+
+# Columns added after VMs were first synced: NULL means not recorded yet, so
+# filling them in on the first sync after an upgrade is not a change
+BACKFILLED_COLUMNS = {"vcenter_id", "moref"}
+
+
+def _vm_row(vm_id: str, data: Dict, vcenter_id: Optional[int] = None) -> Dict:
+    """Normalize one ``vm_info`` dict into a ``vms`` row."""
+    ps_raw = data.get("power_state")
+    cd = data.get("created_date")
+    bd = data.get("last_booted_date")
+    return {
+        "id": vm_id,
+        "name": data.get("name") or vm_id,
+        "cpu": data.get("cpu"),
+        "memory_mb": data.get("memoryMB"),
+        "guest_os": data.get("guestOS"),
+        # Avoid storing string "None" for power_state
+        "power_state": str(ps_raw) if ps_raw is not None else None,
+        "created_date": cd if isinstance(cd, datetime) else None,
+        "last_booted_date": bd if isinstance(bd, datetime) else None,
+        "hypervisor": data.get("hypervisor"),
+        "vcenter_id": vcenter_id,
+        "moref": data.get("moref"),
+    }
+
+
+def _disk_set(disks) -> set:
+    return {(d.get("label"), _normalize_decimal(d.get("size_gb"))) for d in disks}
+
+
+def _nic_set(nics) -> set:
+    return {
+        (
+            n.get("label"),
+            n.get("mac"),
+            n.get("network"),
+            bool(n.get("connected")),
+            n.get("nic_type"),
+            tuple(n.get("ip_addresses", []) or ()),
+        )
+        for n in nics
+    }
+
+
+def _vm_fingerprint(row: Dict, data: Dict) -> str:
+    """Stable hash over a VM's normalized synced columns, disks and NICs.
+
+    Uses the same normalized forms the upsert compares, so equal
+    fingerprints mean the stored VM needs no write at all.
+    """
+    scalars = [row[col] for col in VM_SYNC_COLUMNS]
+    disks = sorted(json.dumps(d, default=str) for d in _disk_set(data.get("assigned_disks", [])))
+    nics = sorted(json.dumps(n, default=str) for n in _nic_set(data.get("nics", [])))
+    blob = json.dumps([scalars, disks, nics], default=str, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _load_fingerprints(ids: List[str]) -> Dict[str, Optional[str]]:
+    """Return ``{vm_id: fingerprint}`` for stored, not-removed VMs among ``ids``.
+
+    Reads only ``id, fingerprint`` (one statement per ``UPSERT_CHUNK_SIZE``
+    ids), never the VM rows or their relationships. Removed VMs are left
+    out so a VM that reappears is always written back.
+    """
+    from sqlalchemy import select
+    from .. import db
+
+    table = VM.__table__
+    stored: Dict[str, Optional[str]] = {}
+    for start in range(0, len(ids), UPSERT_CHUNK_SIZE):
+        chunk = ids[start:start + UPSERT_CHUNK_SIZE]
+        stored.update(db.session.execute(
+            select(table.c.id, table.c.fingerprint)
+            .where(table.c.id.in_(chunk), table.c.removed_at.is_(None))
+        ).all())
+    return stored
+
+
+def _bulk_upsert_vms(rows: List[Dict]) -> Tuple[set, set]:
+    """Upsert ``vms`` rows with multi-row ``INSERT ... ON CONFLICT DO UPDATE``.
+
+    Conflicting rows are only rewritten when a synced column differs or the
+    VM was marked removed, so unchanged VMs produce no row versions. New rows
+    get first/last-seen times; rewritten rows are un-removed. Returns
+    ``(inserted_ids, updated_ids)``.
+    """
+    from sqlalchemy import or_, literal_column
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
     from .. import db
 
-    updated = 0
-    changed = 0
-    skipped = 0
+    table = VM.__table__
+    inserted, updated = set(), set()
+    seen_at = datetime.now(timezone.utc)
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = [dict(row, first_seen_at=seen_at, last_seen_at=seen_at) for row in rows[start:start + UPSERT_CHUNK_SIZE]]
+        stmt = pg_insert(table).values(chunk)
+        compared = VM_SYNC_COLUMNS + ["fingerprint"]
+        set_ = {col: stmt.excluded[col] for col in compared}
+        set_["updated_at"] = datetime.utcnow()
+        set_["last_seen_at"] = stmt.excluded.last_seen_at
+        set_["removed_at"] = None
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_=set_,
+            where=or_(
+                table.c.removed_at.isnot(None),
+                *[table.c[col].is_distinct_from(stmt.excluded[col]) for col in compared],
+            ),
+        ).returning(table.c.id, literal_column("xmax = 0").label("inserted"))
+        for vm_id, was_inserted in db.session.execute(stmt):
+            (inserted if was_inserted else updated).add(vm_id)
+    return inserted, updated
+
+
+# Child tables diffed row by row: (model, payload key, compared columns, match key)
+CHILD_TABLES = {
+    "disks": (VMDisks, "assigned_disks", ["label", "size_gb"], lambda r: r.get("label")),
+    "nics": (VMNic, "nics", ["label", "mac", "network", "connected", "nic_type", "ip_addresses"],
+             lambda r: ("mac", r["mac"]) if r.get("mac") else ("label", r.get("label"))),
+}
+
+
+def _disk_values(d: Dict) -> Dict:
+    return {"label": d.get("label"), "size_gb": _normalize_decimal(d.get("size_gb"))}
+
+
+def _nic_values(n: Dict) -> Dict:
+    return {
+        "label": n.get("label"),
+        "mac": n.get("mac"),
+        "network": n.get("network"),
+        "connected": bool(n.get("connected")),
+        "nic_type": n.get("nic_type"),
+        "ip_addresses": n.get("ip_addresses"),
+    }
+
 
-    # Deduplicate payload by vm_id to avoid double INSERTs within one transaction
-    seen_ids = set()
+def _comparable(column: str, value):
+    if column == "ip_addresses":
+        return tuple(value or ())
+    if column == "connected":
+        return bool(value)
+    if column == "size_gb" and value is not None:
+        return _normalize_decimal(float(value))
+    return value
 
-    for data in vms:
+
+def _keyed(rows: List[Dict], key_fn) -> Dict:
+    """Key child rows by ``key_fn``, numbering repeats of the same key."""
+    keyed = {}
+    occurrences: Dict = {}
+    for row in rows:
+        key = key_fn(row)
+        n = occurrences.get(key, 0)
+        occurrences[key] = n + 1
+        keyed[(key, n)] = row
+    return keyed
+
+
+def _sync_children(payload: Dict[str, Dict], counters: Dict) -> set:
+    """Diff disks and NICs of ``payload`` VMs against stored rows, row by row.
+
+    Disks are matched by label and NICs by MAC (or label when the MAC is
+    missing). Only differing rows are touched: updates, inserts and deletes
+    run as one batched statement each per table. Per-table counts are added
+    to ``counters`` as ``<table>_inserted/_updated/_deleted``. Returns the ids
+    of VMs whose disks or NICs changed.
+    """
+    from sqlalchemy import select, delete, insert, update, bindparam
+    from .. import db
+
+    ids = list(payload)
+    changed_vms: set = set()
+    for kind, (model, payload_key, columns, key_fn) in CHILD_TABLES.items():
+        table = model.__table__
+        to_value = _disk_values if kind == "disks" else _nic_values
+
+        stored: Dict[str, List[Dict]] = {}
+        for start in range(0, len(ids), UPSERT_CHUNK_SIZE):
+            chunk = ids[start:start + UPSERT_CHUNK_SIZE]
+            query = select(table.c.id, table.c.vm_id, *[table.c[c] for c in columns]) \
+                .where(table.c.vm_id.in_(chunk)).order_by(table.c.id)
+            for row in db.session.execute(query).mappings():
+                stored.setdefault(row["vm_id"], []).append(dict(row))
+
+        inserts, updates, deletes = [], [], []
+        for vm_id, data in payload.items():
+            current = _keyed(stored.get(vm_id, []), key_fn)
+            incoming = _keyed([to_value(d) for d in data.get(payload_key, []) or []], key_fn)
+            for key, values in incoming.items():
+                old = current.pop(key, None)
+                if old is None:
+                    inserts.append(dict(values, vm_id=vm_id))
+                    changed_vms.add(vm_id)
+                elif any(_comparable(c, old[c]) != _comparable(c, values[c]) for c in columns):
+                    updates.append(dict({f"b_{c}": values[c] for c in columns}, b_id=old["id"]))
+                    changed_vms.add(vm_id)
+            for old in current.values():
+                deletes.append(old["id"])
+                changed_vms.add(vm_id)
+
+        if updates:
+            stmt = update(table).where(table.c.id == bindparam("b_id")) \
+                .values({c: bindparam(f"b_{c}") for c in columns})
+            db.session.execute(stmt, updates)
+        if inserts:
+            db.session.execute(insert(table), inserts)
+        if deletes:
+            db.session.execute(delete(table).where(table.c.id.in_(deletes)))
+
+        counters[f"{kind}_inserted"] = counters.get(f"{kind}_inserted", 0) + len(inserts)
+        counters[f"{kind}_updated"] = counters.get(f"{kind}_updated", 0) + len(updates)
+        counters[f"{kind}_deleted"] = counters.get(f"{kind}_deleted", 0) + len(deletes)
+    return changed_vms
+
+
+def normalize_ip(value) -> Optional[str]:
+    """Canonical text form of an IPv4/IPv6 address, or None if it is not one.
+
+    IPv6 zone ids (``fe80::1%eth0``) are dropped.
+    """
+    if not value:
+        return None
+    try:
+        return str(ipaddress.ip_address(str(value).strip().split("%", 1)[0]))
+    except ValueError:
+        return None
+
+
+def normalize_mac(value) -> Optional[str]:
+    """Lower-case, colon-separated MAC address, or None if it is not one."""
+    if not value:
+        return None
+    digits = "".join(ch for ch in str(value).lower() if ch in "0123456789abcdef")
+    if len(digits) != 12:
+        return None
+    return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def _ip_rows(vm_id: str, nics) -> Dict[str, Dict]:
+    """``{ip: row}`` for the valid guest IPs on ``nics`` (first NIC wins)."""
+    rows: Dict[str, Dict] = {}
+    for nic in nics or []:
+        mac = normalize_mac(nic.get("mac"))
+        for value in nic.get("ip_addresses") or []:
+            ip = normalize_ip(value)
+            if ip and ip not in rows:
+                rows[ip] = {"vm_id": vm_id, "ip": ip, "mac": mac}
+    return rows
+
+
+def _sync_ip_addresses(payload: Dict[str, Dict], counters: Dict) -> Dict[str, Tuple[List[str], List[str]]]:
+    """Diff ``vm_ip_addresses`` of ``payload`` VMs against their NICs' guest IPs.
+
+    One read per ``UPSERT_CHUNK_SIZE`` VMs, then at most one multi-row
+    insert, one batched update and one delete. Counts are added to
+    ``counters`` as ``ips_inserted/_updated/_deleted``. Returns ``{vm_id:
+    (old_ips, new_ips)}`` for VMs whose set of addresses changed.
+    """
+    from sqlalchemy import select, delete, insert, update, bindparam
+    from .. import db
+
+    table = VMIPAddress.__table__
+    ids = list(payload)
+    stored: Dict[str, Dict[str, Tuple[int, Optional[str]]]] = {}
+    for start in range(0, len(ids), UPSERT_CHUNK_SIZE):
+        chunk = ids[start:start + UPSERT_CHUNK_SIZE]
+        query = select(table.c.id, table.c.vm_id, db.func.host(table.c.ip), table.c.mac) \
+            .where(table.c.vm_id.in_(chunk))
+        for row_id, vm_id, ip, mac in db.session.execute(query):
+            stored.setdefault(vm_id, {})[normalize_ip(ip)] = (row_id, mac)
+
+    inserts, updates, deletes = [], [], []
+    changed: Dict[str, Tuple[List[str], List[str]]] = {}
+    for vm_id, data in payload.items():
+        current = stored.get(vm_id, {})
+        incoming = _ip_rows(vm_id, data.get("nics"))
+        if set(current) != set(incoming):
+            changed[vm_id] = (sorted(current), sorted(incoming))
+        for ip, row in incoming.items():
+            old = current.pop(ip, None)
+            if old is None:
+                inserts.append(row)
+            elif old[1] != row["mac"]:
+                updates.append({"b_id": old[0], "b_mac": row["mac"]})
+        deletes.extend(row_id for row_id, _ in current.values())
+
+    if updates:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam("b_id")).values(mac=bindparam("b_mac")), updates
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    if deletes:
+        db.session.execute(delete(table).where(table.c.id.in_(deletes)))
+
+    counters["ips_inserted"] = counters.get("ips_inserted", 0) + len(inserts)
+    counters["ips_updated"] = counters.get("ips_updated", 0) + len(updates)
+    counters["ips_deleted"] = counters.get("ips_deleted", 0) + len(deletes)
+    return changed
+
+
+def rebuild_ip_addresses(batch_size: int = 5000) -> int:
+    """Repopulate ``vm_ip_addresses`` from the stored ``VMNic.ip_addresses``.
+
+    For databases synced before the table existed; the sync only writes IPs
+    of VMs that change. Returns the number of addresses indexed.
+    """
+    from sqlalchemy import select, delete
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+    from .. import db
+
+    nic_table = VMNic.__table__
+    db.session.execute(delete(VMIPAddress.__table__))
+    query = select(nic_table.c.vm_id, nic_table.c.mac, nic_table.c.ip_addresses) \
+        .where(nic_table.c.ip_addresses.isnot(None)).order_by(nic_table.c.vm_id, nic_table.c.id)
+    total = 0
+    pending: Dict[Tuple[str, str], Dict] = {}
+    for vm_id, mac, ips in db.session.execute(query.execution_options(yield_per=batch_size)):
+        for ip, row in _ip_rows(vm_id, [{"mac": mac, "ip_addresses": ips}]).items():
+            pending.setdefault((vm_id, ip), row)
+        if len(pending) >= batch_size:
+            db.session.execute(pg_insert(VMIPAddress.__table__).on_conflict_do_nothing(), list(pending.values()))
+            total += len(pending)
+            pending = {}
+    if pending:
+        db.session.execute(pg_insert(VMIPAddress.__table__).on_conflict_do_nothing(), list(pending.values()))
+        total += len(pending)
+    bump_data_version("vms")
+    db.session.commit()
+    return total
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except Exception:
+        return None
+
+
+def _load_previous_values(ids: List[str]) -> Dict[str, Dict]:
+    """Return the stored ``VM_SYNC_COLUMNS`` and ``removed_at`` of the existing VMs among ``ids``."""
+    from sqlalchemy import select
+    from .. import db
+
+    table = VM.__table__
+    stored: Dict[str, Dict] = {}
+    for start in range(0, len(ids), UPSERT_CHUNK_SIZE):
+        chunk = ids[start:start + UPSERT_CHUNK_SIZE]
+        columns = [table.c[col] for col in VM_SYNC_COLUMNS] + [table.c.removed_at]
+        query = select(table.c.id, *columns).where(table.c.id.in_(chunk))
+        for row in db.session.execute(query).mappings():
+            stored[row["id"]] = dict(row)
+    return stored
+
+
+def _changed_columns(old: Dict, row: Dict) -> List[str]:
+    """``VM_SYNC_COLUMNS`` whose value in ``row`` differs from the stored one, ignoring backfills."""
+    return [
+        col for col in VM_SYNC_COLUMNS
+        if old[col] != row[col] and not (old[col] is None and col in BACKFILLED_COLUMNS)
+    ]
+
+
+def _journal_value(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value)
+    return str(value)
+
+
+def _write_journal(changes: List[Dict], counters: Dict) -> None:
+    """Insert the batch's ``vm_changes`` rows with one multi-row INSERT."""
+    from sqlalchemy import insert
+    from .. import db
+
+    if changes:
+        db.session.execute(insert(VMChange.__table__), changes)
+    counters["journaled"] = counters.get("journaled", 0) + len(changes)
+
+
+def _upsert_batch(batch: List[Dict], counters: Dict, vcenter_id: Optional[int] = None,
+                  seen_ids: Optional[set] = None, sync_run_id: Optional[int] = None) -> None:
+    """Upsert one batch of ``vm_info`` dicts (and tombstones) and commit it."""
+    from .. import db
+
+    payload: Dict[str, Dict] = {}
+    unresolved: Dict[str, Dict] = {}
+    deleted_ids = set()
+
+    for data in batch:
         vm_id = data.get("vm_id")
         vm_name = data.get("name")
 
-        if vm_id:
-            if vm_id in seen_ids:
-                current_app.logger.debug(f"Duplicate VM in payload skipped: {vm_name} ({vm_id})")
-                continue
-            seen_ids.add(vm_id)
+        if data.get("deleted"):
+            deleted_ids.add(vm_id)
+            payload.pop(vm_id, None)
+            continue
 
         # Basic validation
         if not vm_id and not vm_name:
             current_app.logger.warning("Skipping VM with missing vm_id and name")
-            skipped += 1
+            counters["skipped"] += 1
             continue
 
-        # Try resolve by name if id missing
-        if not vm_id and vm_name:
-            with db.session.no_autoflush:
-                existing_by_name = VM.query.filter_by(name=vm_name).first()
-            if existing_by_name:
-                current_app.logger.info(
-                    f"Found existing VM with name '{vm_name}', using id '{existing_by_name.id}'"
-                )
-                vm_id = existing_by_name.id
-            else:
-                current_app.logger.warning(f"Skipping VM '{vm_name}' due to missing vm_id")
-                skipped += 1
-                continue
+        if not vm_id:
+            unresolved.setdefault(vm_name, data)
+            continue
+
+        # Deduplicate payload by vm_id to avoid double INSERTs within one statement
+        if vm_id in payload:
+            current_app.logger.debug(f"Duplicate VM in payload skipped: {vm_name} ({vm_id})")
+            continue
+        deleted_ids.discard(vm_id)
+        payload[vm_id] = data
 
-        # Load or create VM using SELECT FOR UPDATE to avoid race-conditions
+    # Try resolve by name if id missing (one lookup for all of them)
+    if unresolved:
         with db.session.no_autoflush:
-            vm: Optional[VM] = VM.query.with_for_update(of=VM).get(vm_id)
-
-        is_new = vm is None
-        if is_new:
-            # Double-check not created by another transaction after the SELECT
-            with db.session.no_autoflush:
-                vm = VM.query.get(vm_id)
-            if vm is None:
-                vm = VM(id=vm_id, name=vm_name or vm_id)
-                db.session.add(vm)
-
-        fields_changed = False
-
-        # Update basic fields for both new and existing VMs
-        if vm.name != data.get("name"):
-            vm.name = data.get("name")
-            fields_changed = True
-
-        if vm.cpu != data.get("cpu"):
-            vm.cpu = data.get("cpu")
-            fields_changed = True
-
-        memory_mb = data.get("memoryMB")
-        if vm.memory_mb != memory_mb:
-            vm.memory_mb = memory_mb
-            fields_changed = True
-
-        if vm.guest_os != data.get("guestOS"):
-            vm.guest_os = data.get("guestOS")
-            fields_changed = True
-
-        ps_raw = data.get("power_state")
-        ps_val = str(ps_raw) if ps_raw is not None else None
-        if vm.power_state != ps_val:
-            vm.power_state = ps_val
-            fields_changed = True
-
-        if vm.hypervisor != data.get("hypervisor"):
-            vm.hypervisor = data.get("hypervisor")
-            fields_changed = True
-
-        # Dates
-        cd = data.get("created_date")
-        bd = data.get("last_booted_date")
-        created_date = cd if isinstance(cd, datetime) else None
-        last_booted_date = bd if isinstance(bd, datetime) else None
-
-        if vm.created_date != created_date:
-            vm.created_date = created_date
-            fields_changed = True
-
-        if vm.last_booted_date != last_booted_date:
-            vm.last_booted_date = last_booted_date
-            fields_changed = True
-
-        # Disks: normalize to Decimal for stable comparisons
-        current_disks = {(d.label, _normalize_decimal(float(d.size_gb))) for d in vm.disks}
-        new_disks = {
-            (
-                d.get("label"),
-                _normalize_decimal(d.get("size_gb")),
+            by_name = dict(
+                db.session.query(VM.name, VM.id).filter(VM.name.in_(list(unresolved))).all()
             )
-            for d in data.get("assigned_disks", [])
-        }
-
-        if current_disks != new_disks:
-            vm.disks.clear()
-            for d in data.get("assigned_disks", []):
-                vm.disks.append(
-                    VMDisks(
-                        label=d.get("label"),
-                        size_gb=_normalize_decimal(d.get("size_gb")),
-                    )
-                )
-            fields_changed = True
-
-        # NICs
-        current_nics = {
-            (
-                n.label,
-                n.mac,
-                n.network,
-                bool(n.connected),
-                n.nic_type,
-                tuple(n.ip_addresses) if n.ip_addresses else (),
-            )
-            for n in vm.nics
-        }
-        new_nics = {
-            (
-                n.get("label"),
-                n.get("mac"),
-                n.get("network"),
-                bool(n.get("connected")),
-                n.get("nic_type"),
-                tuple(n.get("ip_addresses", []) or ()),
-            )
-            for n in data.get("nics", [])
-        }
-
-        if current_nics != new_nics:
-            vm.nics.clear()
-            for n in data.get("nics", []):
-                vm.nics.append(
-                    VMNic(
-                        label=n.get("label"),
-                        mac=n.get("mac"),
-                        network=n.get("network"),
-                        connected=bool(n.get("connected")),
-                        nic_type=n.get("nic_type"),
-                        ip_addresses=n.get("ip_addresses"),
-                    )
+        for vm_name, data in unresolved.items():
+            vm_id = by_name.get(vm_name)
+            if vm_id and vm_id not in payload:
+                current_app.logger.info(f"Found existing VM with name '{vm_name}', using id '{vm_id}'")
+                payload[vm_id] = data
+            else:
+                current_app.logger.warning(f"Skipping VM '{vm_name}' due to missing vm_id")
+                counters["skipped"] += 1
+
+    created_ids: set = set()
+    changed_ids: set = set()
+    try:
+        rows = []
+        if payload:
+            stored = _load_fingerprints(list(payload))
+            for vm_id, data in payload.items():
+                row = _vm_row(vm_id, data, vcenter_id)
+                row["fingerprint"] = _vm_fingerprint(row, data)
+                if stored.get(vm_id) != row["fingerprint"]:
+                    rows.append(row)
+        if rows:
+            pending = {row["id"]: payload[row["id"]] for row in rows}
+            previous = _load_previous_values(list(pending))
+            created_ids, updated_ids = _bulk_upsert_vms(rows)
+            # Rewritten rows only count as changed for real data, not a new fingerprint or a backfill
+            rows_by_id = {row["id"]: row for row in rows}
+            changed_ids = {
+                vm_id for vm_id in updated_ids
+                if vm_id not in previous or previous[vm_id]["removed_at"] is not None
+                or _changed_columns(previous[vm_id], rows_by_id[vm_id])
+            }
+            changed_ids |= _sync_children(pending, counters) - created_ids
+            ip_changes = _sync_ip_addresses(pending, counters)
+            refresh_search_documents(pending)
+
+            # Field-level history of existing VMs, collected here and written in one statement
+            changed_at = datetime.now(timezone.utc)
+            changes = []
+            for row in rows:
+                old = previous.get(row["id"])
+                if old is None:
+                    continue
+                fields = [(col, old[col], row[col]) for col in _changed_columns(old, row) if col in JOURNAL_FIELDS]
+                if row["id"] in ip_changes:
+                    fields.append(("ip_addresses", *ip_changes[row["id"]]))
+                changes.extend(
+                    {"vm_id": row["id"], "sync_run_id": sync_run_id, "field": field,
+                     "old_value": _journal_value(old_value), "new_value": _journal_value(new_value),
+                     "changed_at": changed_at}
+                    for field, old_value, new_value in fields
                 )
-            fields_changed = True
+            _write_journal(changes, counters)
 
-        if is_new or fields_changed:
-            changed += 1
-            updated += 1
-            lvl = current_app.logger.info if is_new else current_app.logger.debug
-            lvl(f"{'Created' if is_new else 'Updated'} VM: {vm.name} ({vm_id})")
+        removed = 0
+        if deleted_ids:
+            removed = VM.active().filter(VM.id.in_(list(deleted_ids))) \
+                .update({VM.removed_at: datetime.now(timezone.utc)}, synchronize_session=False)
+        if rows or removed:
+            bump_data_version("vms")
 
-    # Commit all changes at once for efficiency and handle failures cleanly
-    from .. import db as _db
-    try:
-        _db.session.commit()
+        started = time.perf_counter()
+        db.session.commit()
+        counters["commit_s"] += time.perf_counter() - started
     except Exception as commit_err:
         current_app.logger.error(f"Commit failed during VM upsert: {commit_err}")
         try:
-            _db.session.rollback()
+            db.session.rollback()
         except Exception:
             pass
         raise
 
+    for vm_id in created_ids:
+        current_app.logger.info(f"Created VM: {payload[vm_id].get('name')} ({vm_id})")
+
+    counters["processed"] += len(payload)
+    counters["created"] += len(created_ids)
+    counters["changed"] += len(changed_ids)
+    counters["unchanged"] += len(payload) - len(created_ids) - len(changed_ids)
+    counters["removed"] += removed
+    if seen_ids is not None:
+        seen_ids.update(payload)
+
+
+def upsert_vm_records(vms: Iterable[Dict], batch_size: Optional[int] = None,
+                      counters: Optional[Dict] = None, vcenter_id: Optional[int] = None,
+                      seen_ids: Optional[set] = None, on_batch: Optional[Callable[[Dict], None]] = None,
+                      sync_run_id: Optional[int] = None) -> int:
+    """Upsert VM records with set-based statements and type normalization.
+
+    - Consumes ``vms`` (a list or a streaming generator) in batches of
+      ``VCENTER_SYNC_BATCH_SIZE`` and commits after each batch, so memory
+      and time-to-first-write do not grow with inventory size
+    - Skips VMs whose stored fingerprint matches the incoming one without
+      loading them, so an unchanged estate costs one read and no writes
+    - Writes ``vms`` rows with multi-row ``INSERT ... ON CONFLICT DO UPDATE``
+      that only touches rows whose synced columns differ
+    - Diffs disks (by label) and NICs (by MAC) row by row from one read per
+      table, normalizing disk sizes to Decimal, and only updates, inserts or
+      deletes the rows that differ
+    - Avoids storing string "None" for power_state
+    - Logs and skips invalid entries cleanly
+    - Marks VMs removed for ``{"vm_id": ..., "deleted": True}`` tombstones
+    - Records ``vcenter_id`` as the source of every written VM and adds the
+      ids seen to ``seen_ids`` for :func:`reconcile_removed_vms`
+    - Calls ``on_batch(counters)`` after each committed batch (progress)
+    - Records each changed field of an existing VM (and its set of guest
+      IPs) in ``vm_changes`` under ``sync_run_id``, one INSERT per batch
+
+    ``counters`` (if given) receives processed/created/changed/unchanged/
+    skipped/removed/batches counts, per-table disk and NIC
+    inserted/updated/deleted counts and ``upsert_s``/``commit_s`` seconds. Returns the number of VMs created or
+    changed.
+    """
+    if batch_size is None:
+        batch_size = int(current_app.config.get("VCENTER_SYNC_BATCH_SIZE", 500))
+    if counters is None:
+        counters = {}
+    for key in ("processed", "created", "changed", "unchanged", "skipped", "removed", "batches"):
+        counters.setdefault(key, 0)
+    for kind in CHILD_TABLES:
+        for op in ("inserted", "updated", "deleted"):
+            counters.setdefault(f"{kind}_{op}", 0)
+    for key in ("upsert_s", "commit_s"):
+        counters.setdefault(key, 0.0)
+
+    for batch in _batched(vms, max(1, batch_size)):
+        started, committed = time.perf_counter(), counters["commit_s"]
+        try:
+            _upsert_batch(batch, counters, vcenter_id, seen_ids, sync_run_id)
+        finally:
+            counters["upsert_s"] += time.perf_counter() - started - (counters["commit_s"] - committed)
+        counters["batches"] += 1
+        if on_batch is not None:
+            on_batch(counters)
+
+    updated = counters["created"] + counters["changed"]
     current_app.logger.info(
-        f"Sync completed: {updated} VMs processed, {changed} created/changed, {skipped} skipped"
+        f"Sync completed: {counters['processed']} VMs processed in {counters['batches']} batches, "
+        f"{counters['created']} created, {counters['changed']} changed, {counters['unchanged']} unchanged, "
+        f"{counters['skipped']} skipped, {counters['removed']} removed; "
+        + ", ".join(
+            f"{kind} +{counters[kind + '_inserted']} ~{counters[kind + '_updated']} -{counters[kind + '_deleted']}"
+            for kind in CHILD_TABLES
+        )
     )
-    return updated
\ No newline at end of file
+    return updated
+
+
+def reconcile_removed_vms(vcenter_id: int, seen_ids: set) -> int:
+    """Mark VMs of one vCenter that a full sync did not see as removed.
+
+    Loads the seen ids into a temporary table, refreshes ``last_seen_at``
+    for seen VMs whose timestamp is older than
+    ``VM_LAST_SEEN_RESOLUTION_MINUTES`` and then sets ``removed_at`` with a
+    single anti-join ``UPDATE``. Only call this after a successful full sync.
+    Returns the number of VMs marked removed.
+    """
+    from sqlalchemy import text, table, column, insert
+    from .. import db
+
+    if not seen_ids:
+        current_app.logger.warning(f"Skipping removal reconcile for vCenter {vcenter_id}: no VMs seen")
+        return 0
+
+    now = datetime.now(timezone.utc)
+    resolution = timedelta(minutes=int(current_app.config.get("VM_LAST_SEEN_RESOLUTION_MINUTES", 60)))
+    seen_t = table("sync_seen_ids", column("id"))
+    try:
+        db.session.execute(text("CREATE TEMP TABLE sync_seen_ids (id VARCHAR(64) PRIMARY KEY) ON COMMIT DROP"))
+        db.session.execute(insert(seen_t), [{"id": vm_id} for vm_id in seen_ids])
+        touched = db.session.execute(text(
+            "UPDATE vms SET last_seen_at = :now FROM sync_seen_ids s "
+            "WHERE vms.id = s.id AND (vms.last_seen_at IS NULL OR vms.last_seen_at < :stale)"
+        ), {"now": now, "stale": now - resolution}).rowcount
+        removed = db.session.execute(text(
+            "UPDATE vms SET removed_at = :now "
+            "WHERE vms.vcenter_id = :vcenter_id AND vms.removed_at IS NULL "
+            "AND NOT EXISTS (SELECT 1 FROM sync_seen_ids s WHERE s.id = vms.id)"
+        ), {"now": now, "vcenter_id": vcenter_id}).rowcount
+        if touched or removed:
+            bump_data_version("vms")
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.error(f"Removal reconcile failed for vCenter {vcenter_id}: {e}")
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        raise
+
+    if removed:
+        current_app.logger.info(f"Marked {removed} VMs removed from vCenter {vcenter_id}")
+    return removed
+
+
+# Advisory lock namespace for vcenter sync; the second key is the VCenterConfig id.
+# Held by a sync for its whole run and by a targeted refresh while it writes.
+LOCK_KEY = 872345  # arbitrary constant for vcenter sync
+
+# Upper bound on VMs per targeted refresh; larger sets should use a sync
+REFRESH_MAX_VMS = 100
+
+
+def refresh_vms(vm_ids: List[str], vcenter_id: Optional[int] = None) -> Dict:
+    """Re-read the given VMs from vCenter and upsert them through the sync path.
+
+    Known VMs are read from the vCenter that last reported them (or
+    ``vcenter_id``); unknown ids are looked up in ``vcenter_id`` or in every
+    enabled vCenter. A known VM its vCenter no longer has is marked removed.
+
+    Each vCenter's VMs are read and written in one transaction holding
+    ``pg_try_advisory_xact_lock(LOCK_KEY, cfg_id)``, so a refresh never
+    writes alongside a sync of the same vCenter; vCenters being synced are
+    skipped and listed in ``busy``. Returns the ids refreshed, removed and
+    not found, busy vCenters, per-vCenter errors, the upsert counters and
+    the number of vCenter round-trips.
+    """
+    from sqlalchemy import text
+    from .. import db
+
+    vm_ids = list(dict.fromkeys(vm_ids))
+    stored = {
+        vm_id: (cfg_id, moref)
+        for vm_id, cfg_id, moref in db.session.query(VM.id, VM.vcenter_id, VM.moref).filter(VM.id.in_(vm_ids))
+    }
+    configs = VCenterConfig.query.filter_by(enabled=True).order_by(VCenterConfig.id).all()
+    if vcenter_id is not None:
+        configs = [cfg for cfg in configs if cfg.id == vcenter_id]
+
+    owned: Dict[int, List[str]] = {}
+    unplaced = []
+    for vm_id in vm_ids:
+        cfg_id = vcenter_id or stored.get(vm_id, (None, None))[0]
+        if cfg_id is not None:
+            owned.setdefault(cfg_id, []).append(vm_id)
+        else:
+            unplaced.append(vm_id)
+
+    result = {"refreshed": [], "removed": [], "not_found": [], "busy": [], "errors": {}}
+    counters: Dict = {}
+    stats: Dict = {"round_trips": 0}
+    for cfg in configs:
+        ids = owned.pop(cfg.id, []) + unplaced
+        if not ids:
+            continue
+        # Released by the upsert's commit (or the rollback below)
+        if not db.session.execute(
+            text("SELECT pg_try_advisory_xact_lock(:k, :id)"), {"k": LOCK_KEY, "id": cfg.id}
+        ).scalar():
+            current_app.logger.info(f"Targeted refresh from {cfg.name} skipped: a sync is in progress")
+            result["busy"].append(cfg.name)
+            continue
+        try:
+            vm_infos, missing = fetch_vms_by_uuid(
+                cfg, ids, {vm_id: stored[vm_id][1] for vm_id in ids if vm_id in stored}, stats
+            )
+        except Exception as e:
+            current_app.logger.error(f"Targeted refresh from {cfg.name} failed: {e}")
+            result["errors"][cfg.name] = str(e) or e.__class__.__name__
+            db.session.rollback()
+            continue
+        gone = [vm_id for vm_id in missing if stored.get(vm_id, (None, None))[0] == cfg.id]
+        records = vm_infos + [{"vm_id": vm_id, "deleted": True} for vm_id in gone]
+        # One batch, so every write happens before the commit that releases the lock
+        upsert_vm_records(records, batch_size=max(1, len(records)), counters=counters, vcenter_id=cfg.id)
+        db.session.commit()
+        result["refreshed"].extend(vm_info["vm_id"] for vm_info in vm_infos)
+        result["removed"].extend(gone)
+        unplaced = [vm_id for vm_id in missing if vm_id in unplaced]
+    # Owned by a disabled or deleted vCenter, or not found anywhere
+    for ids in owned.values():
+        result["not_found"].extend(ids)
+    result["not_found"].extend(unplaced)
+    result["counters"] = {key: counters.get(key, 0) for key in ("created", "changed", "unchanged", "removed")}
+    result["round_trips"] = stats["round_trips"]
+    return result
@@ -0,0 +1,158 @@
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import case, func, literal, or_, text
+
+from .. import db
+from ..models.vm import VM
+from ..models.vm_search import VMSearch
+
+SEARCH_FIELDS = ('name', 'guest_os', 'hypervisor', 'addresses', 'owners', 'tags')
+SEARCH_MAX_TERMS = 5
+SEARCH_MAX_RESULTS = 100
+
+# Weight of a term found in each field; the name also scores exact and prefix matches
+_FIELD_WEIGHTS = {'addresses': 3, 'owners': 2, 'tags': 2, 'guest_os': 1, 'hypervisor': 1}
+
+# One statement builds the documents of the given VMs from vms, NICs, the IP
+# index, owners and tags; ``:ids`` NULL rebuilds every VM
+_UPSERT_DOCUMENTS = text("""
+    INSERT INTO vm_search (vm_id, name, guest_os, hypervisor, addresses, owners, tags, document, updated_at)
+    SELECT d.id, d.name, d.guest_os, d.hypervisor, d.addresses, d.owners, d.tags,
+           concat_ws(' ', d.name, d.guest_os, d.hypervisor, d.addresses, d.owners, d.tags), now()
+    FROM (
+        SELECT v.id,
+               lower(v.name) AS name,
+               lower(coalesce(v.guest_os, '')) AS guest_os,
+               lower(coalesce(v.hypervisor, '')) AS hypervisor,
+               lower(coalesce((
+                   SELECT string_agg(DISTINCT a.value, ' ') FROM (
+                       SELECT n.mac AS value FROM vm_nics n WHERE n.vm_id = v.id AND n.mac IS NOT NULL
+                       UNION SELECT host(i.ip) FROM vm_ip_addresses i WHERE i.vm_id = v.id
+                   ) a), '')) AS addresses,
+               lower(coalesce((
+                   SELECT string_agg(o.name || ' ' || o.email, ' ' ORDER BY o.id)
+                   FROM vm_owners vo JOIN owners o ON o.id = vo.owner_id WHERE vo.vm_id = v.id), '')) AS owners,
+               lower(coalesce((
+                   SELECT string_agg(t.name, ' ' ORDER BY t.id)
+                   FROM vm_tags vt JOIN tags t ON t.id = vt.tag_id WHERE vt.vm_id = v.id), '')) AS tags
+        FROM vms v
+        WHERE CAST(:ids AS VARCHAR[]) IS NULL OR v.id = ANY(CAST(:ids AS VARCHAR[]))
+    ) d
+    ON CONFLICT (vm_id) DO UPDATE SET
+        name = EXCLUDED.name, guest_os = EXCLUDED.guest_os, hypervisor = EXCLUDED.hypervisor,
+        addresses = EXCLUDED.addresses, owners = EXCLUDED.owners, tags = EXCLUDED.tags,
+        document = EXCLUDED.document, updated_at = EXCLUDED.updated_at
+""")
+
+
+def refresh_search_documents(vm_ids: Iterable[str]) -> None:
+    """Rebuild the search documents of ``vm_ids`` in the current transaction.
+
+    Call after the VM, NIC, IP, owner or tag changes are in the session;
+    they are flushed first. The caller commits.
+    """
+    vm_ids = list(vm_ids)
+    if not vm_ids:
+        return
+    db.session.flush()
+    db.session.execute(_UPSERT_DOCUMENTS, {'ids': vm_ids})
+
+
+def owner_vm_ids(owner_id: int) -> List[str]:
+    from ..models.vm import vm_owners
+    return [row[0] for row in db.session.query(vm_owners.c.vm_id).filter(vm_owners.c.owner_id == owner_id)]
+
+
+def tag_vm_ids(tag_id: int) -> List[str]:
+    from ..models.vm import vm_tags
+    return [row[0] for row in db.session.query(vm_tags.c.vm_id).filter(vm_tags.c.tag_id == tag_id)]
+
+
+def rebuild_search_index() -> int:
+    """Rebuild the search documents of all VMs and commit; returns the row count."""
+    db.session.execute(_UPSERT_DOCUMENTS, {'ids': None})
+    db.session.commit()
+    return db.session.query(func.count(VMSearch.vm_id)).scalar()
+
+
+_trgm_available: Optional[bool] = None
+
+
+def trigram_search_available() -> bool:
+    """Whether pg_trgm is installed (checked once per process)."""
+    global _trgm_available
+    if _trgm_available is None:
+        try:
+            _trgm_available = db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not check for pg_trgm: {e}")
+            _trgm_available = False
+    return _trgm_available
+
+
+def _escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_vms(query: str, limit: int = 25) -> List[Dict]:
+    """Active VMs matching every term of ``query``, best match first.
+
+    A term matches as a substring of any searchable field, served by the
+    trigram GIN index on ``vm_search.document`` when pg_trgm is installed
+    (which also adds fuzzy matches on whole words); without it the narrow
+    ``vm_search`` table is scanned. Name matches rank above addresses,
+    owners and tags, which rank above guest OS and host.
+    """
+    terms = [term for term in query.lower().split() if term][:SEARCH_MAX_TERMS]
+    if not terms:
+        return []
+    fuzzy = trigram_search_available()
+
+    conditions = []
+    score = literal(0.0)
+    for term in terms:
+        pattern = f"%{_escape_like(term)}%"
+        matches = VMSearch.document.like(pattern, escape='\\')
+        if fuzzy and len(term) >= 3:
+            # word_similarity(term, document) above pg_trgm.word_similarity_threshold
+            matches = or_(matches, literal(term).op('<%')(VMSearch.document))
+            score = score + func.word_similarity(term, VMSearch.document) * 2
+        conditions.append(matches)
+        score = score + case(
+            (VMSearch.name == term, 10),
+            (VMSearch.name.like(f"{_escape_like(term)}%", escape='\\'), 6),
+            (VMSearch.name.like(pattern, escape='\\'), 4),
+            else_=0,
+        )
+        for field, weight in _FIELD_WEIGHTS.items():
+            score = score + case((getattr(VMSearch, field).like(pattern, escape='\\'), weight), else_=0)
+
+    score = score.label('score')
+    rows = (
+        db.session.query(VM, VMSearch, score)
+        .join(VMSearch, VMSearch.vm_id == VM.id)
+        .filter(VM.removed_at.is_(None), *conditions)
+        .order_by(score.desc(), VM.name.asc(), VM.id.asc())
+        .limit(max(1, min(limit, SEARCH_MAX_RESULTS)))
+        .all()
+    )
+    return [
+        {
+            'id': vm.id,
+            'name': vm.name,
+            'power_state': vm.power_state,
+            'guest_os': vm.guest_os,
+            'hypervisor': vm.hypervisor,
+            'score': round(float(row_score), 3),
+            # Fields containing at least one term (empty for fuzzy-only matches)
+            'matched': [
+                field for field in SEARCH_FIELDS
+                if any(term in getattr(document, field) for term in terms)
+            ],
+        }
+        for vm, document, row_score in rows
+    ]
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select
+
+from .. import db
+from .data_versions import bump_data_version
+from ..models.owner import Owner
+from ..models.stats_snapshot import StatsSnapshot
+from ..models.tag import Tag
+from ..models.vcenter import VCenterConfig
+from ..models.vm import VM
+
+POWERED_ON_STATES = ('poweredon', 'powered on', 'running')
+POWERED_OFF_STATES = ('poweredoff', 'powered off', 'stopped')
+LINUX_OS_NAMES = ('linux', 'ubuntu', 'centos', 'redhat', 'debian', 'fedora')
+OS_FAMILIES = ('windows', 'linux', 'other')
+
+
+def _os_family():
+    """SQL expression classifying ``guest_os`` as windows, linux or other."""
+    guest_os = func.lower(func.coalesce(VM.guest_os, ''))
+    return case(
+        (guest_os.contains('windows'), 'windows'),
+        (or_(*[guest_os.contains(name) for name in LINUX_OS_NAMES]), 'linux'),
+        else_='other',
+    )
+
+
+def compute_vm_stats() -> Dict:
+    """Dashboard statistics of active VMs, in the ``/vms/api/stats`` format.
+
+    One aggregate pass over ``vms`` (plus owner, tag and vCenter counts as
+    subqueries) and one grouped query for the top hypervisors.
+    """
+    active = VM.removed_at.is_(None)
+    power = func.lower(func.coalesce(VM.power_state, ''))
+    is_on = power.in_(POWERED_ON_STATES)
+    is_off = power.in_(POWERED_OFF_STATES)
+    family = _os_family()
+
+    columns = [
+        func.count(VM.id).label('total'),
+        func.count(VM.id).filter(is_on).label('on'),
+        func.count(VM.id).filter(is_off).label('off'),
+        func.avg(VM.cpu).label('avg_cpu'),
+        func.avg(VM.memory_mb).label('avg_memory_mb'),
+        func.count(func.distinct(VM.hypervisor)).filter(VM.hypervisor != '').label('hypervisors'),
+        select(func.count(Owner.id)).scalar_subquery().label('owners'),
+        select(func.count(Tag.id)).scalar_subquery().label('tags'),
+        select(func.count(VCenterConfig.id)).where(VCenterConfig.enabled.is_(True)).scalar_subquery().label('vcenters'),
+    ]
+    for name in OS_FAMILIES:
+        columns += [
+            func.count(VM.id).filter(family == name).label(f'{name}_total'),
+            func.count(VM.id).filter(and_(family == name, is_on)).label(f'{name}_on'),
+            func.count(VM.id).filter(and_(family == name, is_off)).label(f'{name}_off'),
+        ]
+    row = db.session.query(*columns).filter(active).one()._mapping
+
+    hypervisor_stats = db.session.query(
+        VM.hypervisor,
+        func.count(VM.id).label('vm_count')
+    ).filter(active, VM.hypervisor.isnot(None), VM.hypervisor != '')\
+     .group_by(VM.hypervisor)\
+     .order_by(func.count(VM.id).desc())\
+     .limit(10).all()
+
+    avg_memory_mb = float(row['avg_memory_mb'] or 0)
+    return {
+        'total_vms': row['total'],
+        'power_stats': {
+            'powered_on': row['on'],
+            'powered_off': row['off'],
+        },
+        'os_breakdown': {
+            name: {
+                'total': row[f'{name}_total'],
+                'powered_on': row[f'{name}_on'],
+                'powered_off': row[f'{name}_off'],
+            }
+            for name in OS_FAMILIES
+        },
+        'additional_metrics': {
+            'avg_cpu': round(float(row['avg_cpu'] or 0), 1),
+            'avg_memory_gb': round(avg_memory_mb / 1024, 1),
+            'total_owners': row['owners'],
+            'total_tags': row['tags'],
+            'total_hypervisors': row['vcenters'],
+            'unique_hypervisors': row['hypervisors'],
+        },
+        'hypervisor_breakdown': [
+            {'hypervisor': stat.hypervisor, 'vm_count': stat.vm_count}
+            for stat in hypervisor_stats
+        ],
+    }
+
+
+def record_stats_snapshot(reason: str) -> Optional[StatsSnapshot]:
+    """Recompute the dashboard stats and store them as the latest snapshot.
+
+    Nothing is written when the stats equal the latest snapshot, so history
+    only grows when something changed. Snapshots older than
+    ``STATS_SNAPSHOT_RETENTION_DAYS`` are pruned. Commits; failures are
+    logged and never raised, as callers have already committed their work.
+    """
+    try:
+        data = compute_vm_stats()
+        latest = StatsSnapshot.query.order_by(StatsSnapshot.id.desc()).first()
+        if latest is not None and latest.data == data:
+            db.session.rollback()
+            return latest
+        snapshot = StatsSnapshot(
+            taken_at=datetime.now(timezone.utc), reason=reason, data=data,
+            total_vms=data['total_vms'],
+            powered_on=data['power_stats']['powered_on'],
+            powered_off=data['power_stats']['powered_off'],
+        )
+        db.session.add(snapshot)
+        retention_days = int(current_app.config.get('STATS_SNAPSHOT_RETENTION_DAYS', 365))
+        if retention_days > 0:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+            StatsSnapshot.query.filter(StatsSnapshot.taken_at < cutoff).delete(synchronize_session=False)
+        bump_data_version('stats')
+        db.session.commit()
+        return snapshot
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Could not record stats snapshot ({reason}): {e}")
+        return None
+
+
+def latest_stats_snapshot() -> Optional[StatsSnapshot]:
+    """The newest stats snapshot, computing the first one if there is none."""
+    snapshot = StatsSnapshot.query.order_by(StatsSnapshot.id.desc()).first()
+    if snapshot is None:
+        snapshot = record_stats_snapshot('initial')
+    return snapshot
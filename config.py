@@ -10,6 +10,48 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SCHEDULER_API_ENABLED = False
     VCENTER_SYNC_INTERVAL = int(os.getenv("VCENTER_SYNC_INTERVAL", "30"))
+    # Objects returned per PropertyCollector page during vCenter retrieval
+    VCENTER_RETRIEVE_PAGE_SIZE = int(os.getenv("VCENTER_RETRIEVE_PAGE_SIZE", "500"))
+    # VMs upserted and committed per batch while streaming from vCenter
+    VCENTER_SYNC_BATCH_SIZE = int(os.getenv("VCENTER_SYNC_BATCH_SIZE", "500"))
+    # Only fetch VMs changed since the previous run (WaitForUpdatesEx)
+    VCENTER_SYNC_INCREMENTAL = os.getenv("VCENTER_SYNC_INCREMENTAL", "true").lower() in ("1", "true", "yes")
+    # Granularity of VM last_seen_at refreshes after a full sync (avoids rewriting every row each run)
+    VM_LAST_SEEN_RESOLUTION_MINUTES = int(os.getenv("VM_LAST_SEEN_RESOLUTION_MINUTES", "60"))
+    # Per-connection vCenter HTTP timeout in seconds
+    VCENTER_HTTP_TIMEOUT = int(os.getenv("VCENTER_HTTP_TIMEOUT", "30"))
+    # Idle seconds after which a cached vCenter session is re-checked before use
+    VCENTER_SESSION_CHECK_SECONDS = int(os.getenv("VCENTER_SESSION_CHECK_SECONDS", "60"))
+    # Random delay (seconds) added to every scheduled sync, and the window over which first runs are spread
+    VCENTER_SYNC_JITTER_SECONDS = int(os.getenv("VCENTER_SYNC_JITTER_SECONDS", "30"))
+    VCENTER_SYNC_STARTUP_JITTER_SECONDS = int(os.getenv("VCENTER_SYNC_STARTUP_JITTER_SECONDS", "300"))
+    # Adaptive intervals: bounds (minutes), runs considered and changes per run that count as busy
+    VCENTER_SYNC_MIN_INTERVAL = int(os.getenv("VCENTER_SYNC_MIN_INTERVAL", "5"))
+    VCENTER_SYNC_MAX_INTERVAL = int(os.getenv("VCENTER_SYNC_MAX_INTERVAL", "240"))
+    VCENTER_ADAPTIVE_WINDOW = int(os.getenv("VCENTER_ADAPTIVE_WINDOW", "3"))
+    VCENTER_ADAPTIVE_BUSY_CHANGES = int(os.getenv("VCENTER_ADAPTIVE_BUSY_CHANGES", "25"))
+    # Run scheduled and queued syncs inside the web process instead of the sync worker
+    SYNC_IN_WEB_PROCESS = os.getenv("SYNC_IN_WEB_PROCESS", "false").lower() in ("1", "true", "yes")
+    # Seconds between sync request queue polls
+    SYNC_WORKER_POLL_SECONDS = int(os.getenv("SYNC_WORKER_POLL_SECONDS", "2"))
+    # Maximum number of vCenters synced in parallel (each uses two DB connections)
+    VCENTER_SYNC_CONCURRENCY = int(os.getenv("VCENTER_SYNC_CONCURRENCY", "4"))
+
+    # Per-request SQL statement counts/timings in response headers and the superadmin SQL Profile view
+    SQL_PROFILER = os.getenv("SQL_PROFILER", "false").lower() in ("1", "true", "yes")
+    # Log a possible N+1 when one statement repeats this often in a request
+    SQL_PROFILER_REPEAT_THRESHOLD = int(os.getenv("SQL_PROFILER_REPEAT_THRESHOLD", "5"))
+    # Request profiles kept per process for the SQL Profile view
+    SQL_PROFILER_HISTORY = int(os.getenv("SQL_PROFILER_HISTORY", "200"))
+
+    # Default page size of /vms/api (clients may ask for up to 5000 with ?limit=)
+    VMS_API_PAGE_SIZE = int(os.getenv("VMS_API_PAGE_SIZE", "500"))
+
+    # VMs read (and relationships batch-loaded) per chunk by /vms/export
+    VM_EXPORT_CHUNK_SIZE = int(os.getenv("VM_EXPORT_CHUNK_SIZE", "1000"))
+
+    # Days of dashboard stats snapshots kept for trends (0 keeps them forever)
+    STATS_SNAPSHOT_RETENTION_DAYS = int(os.getenv("STATS_SNAPSHOT_RETENTION_DAYS", "365"))
 
     # Flask session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=int(os.getenv("SESSION_ABSOLUTE_HOURS", "3")))  # absolute timeout
@@ -2,12 +2,16 @@ from app import create_app, db, scheduler
 
 app = create_app()
 
-# Initialize scheduler after app is created to avoid circular imports
-from app.scheduler.tasks import schedule_vcenter_sync
-with app.app_context():
-    schedule_vcenter_sync(scheduler, app)
-    if not scheduler.running:
-        scheduler.start()
+# Syncs run in the dedicated worker (`flask --app app:create_app sync-worker`).
+# SYNC_IN_WEB_PROCESS runs them in this process instead, for single-process setups.
+if app.config.get('SYNC_IN_WEB_PROCESS'):
+    from app.scheduler.tasks import schedule_vcenter_sync
+    from app.scheduler.queue import schedule_sync_queue
+    with app.app_context():
+        schedule_vcenter_sync(scheduler, app)
+        schedule_sync_queue(scheduler, app)
+        if not scheduler.running:
+            scheduler.start()
 
 
 if __name__ == '__main__':
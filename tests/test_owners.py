@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app import db
+from app.models import VM, Owner
+from app.utils.query_profiler import query_budget
+
+
+@pytest.fixture
+def owners(app):
+    with app.app_context():
+        for i in range(20):
+            owner = Owner(name=f"Owner {i:02d}", email=f"owner{i}@example.com")
+            db.session.add_all([
+                VM(id=f"vm-{i}-active", name=f"vm-{i}-a", owners=[owner]),
+                VM(id=f"vm-{i}-removed", name=f"vm-{i}-r", owners=[owner], removed_at=datetime.now(timezone.utc)),
+            ])
+        db.session.add(Owner(name="Owner without VMs", email="idle@example.com"))
+        db.session.commit()
+
+
+def test_owners_api_counts_active_vms(client, owners):
+    response = client.get("/owners/api")
+
+    assert response.status_code == 200
+    counts = {owner["email"]: owner["vm_count"] for owner in response.get_json()}
+    assert counts["owner0@example.com"] == 1
+    assert counts["idle@example.com"] == 0
+    assert len(counts) == 21
+
+
+def test_owners_api_query_count_does_not_grow_with_owners(app, client, owners):
+    with app.app_context(), query_budget(6):
+        assert client.get("/owners/api").status_code == 200
+
+
+def test_owners_page_query_count_does_not_grow_with_owners(app, client, owners):
+    with app.app_context(), query_budget(6):
+        assert client.get("/owners/").status_code == 200
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import db
+from app.models import VCenterConfig
+from app.models.sync_run import SyncRun
+from app.scheduler.tasks import _next_interval
+
+
+@pytest.fixture
+def vcenter(app):
+    with app.app_context():
+        cfg = VCenterConfig(name="vc", host="vc", username="u", password="p", adaptive_sync=True)
+        db.session.add(cfg)
+        db.session.commit()
+        return cfg.id
+
+
+def _add_runs(cfg_id, changes):
+    now = datetime.now(timezone.utc)
+    for i, changed in enumerate(changes):
+        db.session.add(SyncRun(vcenter_id=cfg_id, status='succeeded', changed_count=changed,
+                               started_at=now - timedelta(minutes=i)))
+    db.session.commit()
+
+
+def _interval(app, cfg_id, base, current, changes):
+    with app.app_context():
+        cfg = db.session.get(VCenterConfig, cfg_id)
+        cfg.sync_interval_minutes = base
+        db.session.commit()
+        _add_runs(cfg_id, changes)
+        return _next_interval(app, cfg, current)
+
+
+def test_interval_below_minimum_is_not_lengthened(app, vcenter):
+    assert _interval(app, vcenter, base=2, current=2, changes=[3, 0, 0]) == 2
+
+
+def test_busy_vcenter_speeds_up_down_to_minimum(app, vcenter):
+    assert _interval(app, vcenter, base=30, current=30, changes=[100, 100, 100]) == 15
+    assert _interval(app, vcenter, base=30, current=8, changes=[100, 100, 100]) == 5
+    assert _interval(app, vcenter, base=2, current=2, changes=[100, 100, 100]) == 2
+
+
+def test_interval_above_maximum_is_not_shortened(app, vcenter):
+    assert _interval(app, vcenter, base=300, current=300, changes=[0, 0, 0]) == 300
+
+
+def test_idle_vcenter_backs_off_within_bounds(app, vcenter):
+    assert _interval(app, vcenter, base=30, current=30, changes=[0, 0, 0]) == 60
+    assert _interval(app, vcenter, base=30, current=200, changes=[0, 0, 0]) == 240
@@ -0,0 +1,71 @@
+from app import db
+from app.models import VM
+from app.models.sync_run import SyncRun
+from app.models.vm_change import VMChange
+from app.scheduler.tasks import _sync_one_vcenter
+from app.utils import vcenter_sync
+
+
+def test_full_sync_keeps_vms_that_fail_to_transform(app, simulated_vcenter, monkeypatch):
+    sim, cfg_id = simulated_vcenter(vms=5)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+    with app.app_context():
+        broken_id = VM.query.order_by(VM.id).first().id
+
+    build_vm_info = vcenter_sync._build_vm_info
+
+    def failing_build_vm_info(props, maps):
+        if props.get("summary.config.instanceUuid") == broken_id:
+            raise ValueError("unexpected device")
+        return build_vm_info(props, maps)
+
+    monkeypatch.setattr(vcenter_sync, "_build_vm_info", failing_build_vm_info)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+
+    with app.app_context():
+        assert db.session.get(VM, broken_id).removed_at is None
+        assert VM.active().count() == 5
+
+
+def test_full_sync_marks_vms_gone_from_vcenter_removed(app, simulated_vcenter):
+    sim, cfg_id = simulated_vcenter(vms=5)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+    sim.delete_vms(2)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+
+    with app.app_context():
+        assert VM.active().count() == 3
+        assert VM.query.filter(VM.removed_at.isnot(None)).count() == 2
+
+
+def test_first_sync_after_upgrade_does_not_journal_backfilled_vcenter_id(app, simulated_vcenter):
+    sim, cfg_id = simulated_vcenter(vms=5)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+    with app.app_context():
+        # VMs synced before vcenter_id and fingerprints existed
+        db.session.execute(db.text("UPDATE vms SET vcenter_id = NULL, fingerprint = NULL"))
+        db.session.commit()
+
+    sim.modify_vms(1)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+
+    with app.app_context():
+        assert VM.query.filter_by(vcenter_id=cfg_id).count() == 5
+        assert [change.field for change in VMChange.query.all()] == ["power_state"]
+
+
+def test_first_sync_after_upgrade_counts_only_real_changes(app, simulated_vcenter):
+    sim, cfg_id = simulated_vcenter(vms=5)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+    with app.app_context():
+        # VMs synced before fingerprints, vcenter_id and moref existed
+        db.session.execute(db.text("UPDATE vms SET vcenter_id = NULL, moref = NULL, fingerprint = NULL"))
+        db.session.commit()
+
+    sim.modify_vms(1)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+
+    with app.app_context():
+        run = SyncRun.query.order_by(SyncRun.id.desc()).first()
+        assert (run.created_count, run.changed_count, run.unchanged_count) == (0, 1, 4)
+        assert VM.query.filter(VM.fingerprint.is_(None)).count() == 0
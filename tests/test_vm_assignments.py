@@ -0,0 +1,42 @@
+import pytest
+
+from app import db
+from app.models import VM
+from app.utils.vm_stats import record_stats_snapshot
+
+
+@pytest.fixture
+def vm(app):
+    with app.app_context():
+        db.session.add(VM(id="vm-1", name="web-1"))
+        db.session.commit()
+        record_stats_snapshot('test')
+        return "vm-1"
+
+
+def _stats(client):
+    response = client.get("/vms/api/stats")
+    assert response.status_code == 200
+    return response
+
+
+def test_assigning_unknown_owner_updates_dashboard_stats(client, vm):
+    before = _stats(client)
+    assert before.get_json()["additional_metrics"]["total_owners"] == 0
+
+    response = client.post(f"/vms/api/{vm}/owners", json={"emails": ["new.owner@example.com"]})
+    assert response.status_code == 200
+
+    assert client.get("/vms/api/stats", headers={"If-None-Match": before.headers["ETag"]}).status_code == 200
+    assert _stats(client).get_json()["additional_metrics"]["total_owners"] == 1
+
+
+def test_assigning_unknown_tag_updates_dashboard_stats(client, vm):
+    before = _stats(client)
+    assert before.get_json()["additional_metrics"]["total_tags"] == 0
+
+    response = client.post(f"/vms/api/{vm}/tags", json={"tags": ["prod"]})
+    assert response.status_code == 200
+
+    assert client.get("/vms/api/stats", headers={"If-None-Match": before.headers["ETag"]}).status_code == 200
+    assert _stats(client).get_json()["additional_metrics"]["total_tags"] == 1
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import db
+from app.models import VM
+from app.models.vm_change import VMChange
+
+
+@pytest.fixture
+def history(app):
+    """Changes whose changed_at is not in id order, as concurrent batches can write them."""
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    with app.app_context():
+        db.session.add(VM(id="vm-1", name="web-1"))
+        db.session.flush()
+        for i in range(7):
+            minutes = i if i % 2 == 0 else i - 3
+            db.session.add(VMChange(vm_id="vm-1", field="power_state", old_value=str(i), new_value=str(i + 1),
+                                    changed_at=start + timedelta(minutes=minutes)))
+        db.session.commit()
+        return [change.id for change in VMChange.query.order_by(VMChange.id.desc())]
+
+
+def test_history_pages_return_every_change_once(client, history):
+    seen, before = [], None
+    while True:
+        params = {"limit": 3, **({"before": before} if before else {})}
+        body = client.get("/vms/api/vm-1/history", query_string=params).get_json()
+        seen.extend(change["id"] for change in body["changes"])
+        before = body["next_before"]
+        if before is None:
+            break
+
+    assert seen == history
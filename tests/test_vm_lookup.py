@@ -0,0 +1,27 @@
+import pytest
+
+from app import db
+from app.models import VM
+from app.models.vm import VMNic
+
+
+@pytest.fixture
+def nics(app):
+    with app.app_context():
+        db.session.add_all([
+            VM(id="vm-1", name="web-1"),
+            VM(id="vm-2", name="web-2"),
+            VMNic(vm_id="vm-1", label="Network adapter 1", mac="00:50:56:AB:CD:EF"),
+            VMNic(vm_id="vm-2", label="Network adapter 1", mac="00-50-56-aa-bb-cc"),
+        ])
+        db.session.commit()
+
+
+def test_mac_lookup_ignores_case_and_separators(client, nics):
+    response = client.post("/vms/api/lookup", json={"macs": ["00:50:56:ab:cd:ef", "0050.56AA.BBCC", "00:50:56:00:00:01"]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [hit["vm_id"] for hit in body["macs"]["00:50:56:ab:cd:ef"]] == ["vm-1"]
+    assert [hit["vm_id"] for hit in body["macs"]["00:50:56:aa:bb:cc"]] == ["vm-2"]
+    assert body["not_found"] == ["00:50:56:00:00:01"]
@@ -0,0 +1,38 @@
+from app import db
+from app.models import VM
+from app.scheduler.tasks import _sync_one_vcenter
+from app.utils.vcenter_sync import LOCK_KEY
+
+
+def _first_vm_id(app):
+    with app.app_context():
+        return VM.query.order_by(VM.id).first().id
+
+
+def test_refresh_vm(app, client, simulated_vcenter):
+    sim, cfg_id = simulated_vcenter(vms=3)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+
+    response = client.post(f"/vms/api/{_first_vm_id(app)}/refresh")
+
+    assert response.status_code == 200
+    assert response.get_json()["refreshed"] == [_first_vm_id(app)]
+
+
+def test_refresh_conflicts_with_running_sync(app, client, simulated_vcenter):
+    sim, cfg_id = simulated_vcenter(vms=3)
+    assert _sync_one_vcenter(app, cfg_id, full=True) == 'succeeded'
+    vm_id = _first_vm_id(app)
+
+    with app.app_context():
+        with db.engine.connect() as sync_conn:
+            sync_conn.execute(db.text("SELECT pg_advisory_lock(:k, :id)"), {"k": LOCK_KEY, "id": cfg_id})
+            try:
+                response = client.post(f"/vms/api/{vm_id}/refresh")
+            finally:
+                sync_conn.execute(db.text("SELECT pg_advisory_unlock(:k, :id)"), {"k": LOCK_KEY, "id": cfg_id})
+
+    assert response.status_code == 409
+    body = response.get_json()
+    assert body["error"] == "sync in progress"
+    assert body["refreshed"] == []
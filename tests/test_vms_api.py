@@ -0,0 +1,37 @@
+import pytest
+
+from app import db
+from app.models import VM, Owner, Tag
+
+
+@pytest.fixture
+def inventory(app):
+    with app.app_context():
+        alice = Owner(name="Alice", email="alice@example.com")
+        other = Owner(name="Alicia", email="a_ice@example.com")
+        prod = Tag(name="Prod")
+        db.session.add_all([
+            VM(id="vm-1", name="web-1", owners=[alice], tags=[prod]),
+            VM(id="vm-2", name="web-2", owners=[other], tags=[Tag(name="prod-eu")]),
+            VM(id="vm-3", name="db-1"),
+        ])
+        db.session.commit()
+
+
+def _ids(client, **params):
+    response = client.get("/vms/api", query_string=params)
+    assert response.status_code == 200
+    return sorted(vm["id"] for vm in response.get_json())
+
+
+def test_owner_filter_matches_email_or_name_exactly(client, inventory):
+    assert _ids(client, owner="ALICE@example.com") == ["vm-1"]
+    assert _ids(client, owner="alice") == ["vm-1"]
+    assert _ids(client, owner="ali") == []
+
+
+def test_owner_and_tag_filters_treat_like_wildcards_literally(client, inventory):
+    assert _ids(client, owner="%") == []
+    assert _ids(client, owner="a_ice@example.com") == ["vm-2"]
+    assert _ids(client, tag="prod%") == []
+    assert _ids(client, tag="PROD") == ["vm-1"]